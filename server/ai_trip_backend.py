@@ -1,98 +1,159 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import requests, datetime, os, random, time
+import datetime, os, hashlib, json, math
 from datetime import timedelta
+from urllib.parse import urlparse
+
+from cache import TTLCache
+from compression import init_compression
+from gazetteer import MAX_SUGGESTIONS, gazetteer
+from geocode_cache import geocode_cache, normalize_city
+from log import fields, get_logger
+import metrics
+from metrics import StageTimer, cache_requests, upstream_errors, upstream_seconds
+from overpass_tiles import TILE_TTL, TRIP_TILE_ZOOM, TileCache
+from places import Place, parse_fields
+from planner import plan_days
+from poi_index import POI_BACKEND, PoiIndex
+from ranking import importance, top_places
+from scheduler import BULK, Overloaded, upstream_scheduler, use_priority
+import singleflight
+from singleflight import SingleFlight
+from timetable import open_on, plan_visits, time_slot
+from trips import (MAX_TRIP_DAYS, InvalidEdit, SavedTrip, change_interests, load_trip, merge_candidates, refill_day,
+                   remove_stop, replace_stop, resize_trip, save_trip)
+from upstream import get_session, overpass_client
 
 app = Flask(__name__)
 CORS(app)
+init_compression(app)
+
+logger = get_logger("trip")
+
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_HOST = urlparse(NOMINATIM_URL).netloc
+
+# Finished trips keyed by normalized request, served with an ETag
+trip_cache = TTLCache(maxsize=256, ttl=15 * 60)
+
+# Parsed (and scored) places per OSM element, valid while the POI cache keeps serving the same element object
+place_cache = TTLCache(maxsize=100000, ttl=TILE_TTL)
+
+geocode_flight = SingleFlight("geocode")
+overpass_flight = SingleFlight("overpass")
 
 def get_coordinates(city):
-    """Get latitude and longitude using OpenStreetMap Nominatim"""
+    """Get latitude and longitude from the local gazetteer, else OpenStreetMap Nominatim (cached per city)"""
+    coords = local_coordinates(city)
+    if coords:
+        return coords
+    hit, coords = geocode_cache.get(city)
+    if hit:
+        return coords
+    # Concurrent misses for the same city share one Nominatim call
+    return geocode_flight.do(normalize_city(city), lookup_nominatim, city)
+
+def local_coordinates(city):
+    """Known cities resolve in-process from the gazetteer; None sends the lookup to Nominatim"""
+    if not gazetteer.available:
+        return None
+    coords = gazetteer.resolve(city)
+    cache_requests.inc(cache="gazetteer", result="hit" if coords else "miss")
+    return coords
+
+def lookup_nominatim(city):
+    """Resolve a city with Nominatim and store the answer in the geocode cache"""
     try:
-        url = f"https://nominatim.openstreetmap.org/search?city={city}&format=json&limit=1"
-        resp = requests.get(url, headers={"User-Agent": "TripPlannerApp"})
+        url = NOMINATIM_URL
+        params = {"city": city, "format": "json", "limit": 1}
+        # Shared 1 req/s budget across every worker, per the Nominatim usage policy
+        with upstream_scheduler.slot(NOMINATIM_HOST), upstream_seconds.time(host=NOMINATIM_HOST):
+            resp = get_session(url).get(url, params=params, timeout=10)
+        resp.raise_for_status()
         data = resp.json()
-        if data:
-            return float(data[0]["lat"]), float(data[0]["lon"])
+        # Only cache real answers - an empty list is a valid "not found"
+        coords = (float(data[0]["lat"]), float(data[0]["lon"])) if data else (None, None)
+        geocode_cache.set(city, coords)
+        return coords
+    except Overloaded:
+        raise
     except Exception as e:
-        print("❌ Nominatim error:", e)
+        upstream_errors.inc(host=NOMINATIM_HOST)
+        logger.warning("Nominatim error", extra=fields(city=city, error=str(e)))
     return None, None
 
-def get_places_from_overpass(lat, lon, interest, radius=20000):
-    """Get places from Overpass API"""
+# Overpass selectors per interest, compiled into a single union query per request
+INTEREST_QUERIES = {
+    "sightseeing": [
+        ("node", '["tourism"~"attraction|museum|viewpoint"]'),
+        ("node", '["historic"~"monument|castle|archaeological_site"]'),
+        ("node", '["amenity"~"place_of_worship"]'),
+        ("way", '["tourism"~"attraction|museum|viewpoint"]'),
+        ("way", '["historic"~"monument|castle|archaeological_site"]'),
+    ],
+    "culture": [
+        ("node", '["tourism"~"museum|gallery"]'),
+        ("node", '["amenity"~"place_of_worship|theatre"]'),
+        ("node", '["historic"~"monument|memorial"]'),
+        ("way", '["tourism"~"museum|gallery"]'),
+        ("way", '["amenity"~"place_of_worship|theatre"]'),
+    ],
+    "food": [
+        ("node", '["amenity"~"restaurant|cafe|fast_food"]'),
+        ("node", '["shop"~"bakery"]'),
+        ("way", '["amenity"~"restaurant|cafe|fast_food"]'),
+    ],
+    "shopping": [
+        ("node", '["shop"]'),
+        ("node", '["amenity"~"marketplace"]'),
+        ("way", '["shop"]'),
+    ],
+    "relaxation": [
+        ("node", '["leisure"~"park|garden"]'),
+        ("node", '["tourism"~"zoo|aquarium"]'),
+        ("node", '["natural"~"beach"]'),
+        ("way", '["leisure"~"park|garden"]'),
+        ("way", '["natural"~"beach"]'),
+    ],
+}
+
+def fetch_overpass_elements(query):
+    """Run an Overpass query on the healthiest mirror, raising on failure so empty results aren't cached"""
+    # Identical queries (same destination, same missing tiles) in flight at once share one call
+    return overpass_flight.do(query, post_overpass_query, query)
+
+def post_overpass_query(query):
+    resp = overpass_client.post(query, timeout=30)
+    return resp.json().get("elements", [])
+
+overpass_tiles = TileCache(fetch_overpass_elements, zoom=TRIP_TILE_ZOOM)
+
+# POI_BACKEND=offline answers from the local index built by poi_index.py instead of the network
+poi_source = PoiIndex() if POI_BACKEND == "offline" else overpass_tiles
+
+def interest_layers(interests):
+    """(unique interests, {interest: layer}, {layer: selectors}) for a trip's interests"""
+    interests = list(dict.fromkeys(interests))
+    # Unknown interests share the sightseeing layer instead of getting their own cache entries
+    layer_for = {interest: interest if interest in INTEREST_QUERIES else "sightseeing" for interest in interests}
+    layers = {layer: INTEREST_QUERIES[layer] for layer in layer_for.values()}
+    return interests, layer_for, layers
+
+def get_places_for_interests(lat, lon, interests, radius=20000):
+    """Get places for several interests with at most one Overpass round-trip, split back out by interest"""
+    interests, layer_for, layers = interest_layers(interests)
+
     try:
-        interest_queries = {
-            "sightseeing": """
-                [out:json];
-                (
-                    node["tourism"~"attraction|museum|viewpoint"](around:{radius},{lat},{lon});
-                    node["historic"~"monument|castle|archaeological_site"](around:{radius},{lat},{lon});
-                    node["amenity"~"place_of_worship"](around:{radius},{lat},{lon});
-                    way["tourism"~"attraction|museum|viewpoint"](around:{radius},{lat},{lon});
-                    way["historic"~"monument|castle|archaeological_site"](around:{radius},{lat},{lon});
-                );
-                out center;
-            """,
-            "culture": """
-                [out:json];
-                (
-                    node["tourism"~"museum|gallery"](around:{radius},{lat},{lon});
-                    node["amenity"~"place_of_worship|theatre"](around:{radius},{lat},{lon});
-                    node["historic"~"monument|memorial"](around:{radius},{lat},{lon});
-                    way["tourism"~"museum|gallery"](around:{radius},{lat},{lon});
-                    way["amenity"~"place_of_worship|theatre"](around:{radius},{lat},{lon});
-                );
-                out center;
-            """,
-            "food": """
-                [out:json];
-                (
-                    node["amenity"~"restaurant|cafe|fast_food"](around:{radius},{lat},{lon});
-                    node["shop"~"bakery"](around:{radius},{lat},{lon});
-                    way["amenity"~"restaurant|cafe|fast_food"](around:{radius},{lat},{lon});
-                );
-                out center;
-            """,
-            "shopping": """
-                [out:json];
-                (
-                    node["shop"](around:{radius},{lat},{lon});
-                    node["amenity"~"marketplace"](around:{radius},{lat},{lon});
-                    way["shop"](around:{radius},{lat},{lon});
-                );
-                out center;
-            """,
-            "relaxation": """
-                [out:json];
-                (
-                    node["leisure"~"park|garden"](around:{radius},{lat},{lon});
-                    node["tourism"~"zoo|aquarium"](around:{radius},{lat},{lon});
-                    node["natural"~"beach"](around:{radius},{lat},{lon});
-                    way["leisure"~"park|garden"](around:{radius},{lat},{lon});
-                    way["natural"~"beach"](around:{radius},{lat},{lon});
-                );
-                out center;
-            """
-        }
-        
-        query_template = interest_queries.get(interest, interest_queries["sightseeing"])
-        query = query_template.format(radius=radius, lat=lat, lon=lon)
-        
-        url = "https://overpass-api.de/api/interpreter"
-        resp = requests.post(url, data=query, timeout=30)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            elements = data.get("elements", [])
-            print(f"✅ Found {len(elements)} places from Overpass API for {interest}")
-            return elements
-        else:
-            print(f"❌ Overpass API Error: {resp.status_code}")
-            return []
-            
+        found = poi_source.query(layers, lat, lon, radius)
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"❌ Error fetching from Overpass API:", e)
-        return []
+        logger.warning("Error fetching from Overpass API", extra=fields(interests=interests, error=str(e)))
+        return {interest: [] for interest in interests}
+
+    results = {interest: found[layer_for[interest]] for interest in interests}
+    logger.info("Found places", extra=fields(count=sum(len(v) for v in found.values()), interests=interests))
+    return results
 
 def enhance_osm_place_data(place):
     """Extract and enhance place data from OSM response"""
@@ -139,214 +200,424 @@ def enhance_osm_place_data(place):
         if not lat or not lon:
             return None
             
-        return {
-            "name": name,
-            "address": address,
-            "category": category,
-            "lat": lat,
-            "lon": lon,
-            "tags": tags
-        }
+        place_id = f"{place.get('type', 'node')[0]}{place.get('id')}"
+        return Place(place_id, name, address, category, lat, lon, tags, importance(tags))
     except Exception as e:
-        print(f"❌ Error enhancing OSM place data: {e}")
+        logger.warning("Error enhancing OSM place data", extra=fields(error=str(e)))
         return None
 
-def create_time_slots(start_time, visit_duration, travel_time):
-    """Create time slots with specific timings"""
-    end_time = start_time + timedelta(minutes=visit_duration)
-    next_start_time = end_time + timedelta(minutes=travel_time)
-    
-    return {
-        "start_time": start_time.strftime("%H:%M"),
-        "end_time": end_time.strftime("%H:%M"),
-        "duration_minutes": visit_duration,
-        "travel_time_next": travel_time
-    }
+def parse_place(element):
+    """enhance_osm_place_data, memoized per OSM element"""
+    key = (element.get("type"), element.get("id"))
+    hit, cached = place_cache.get(key)
+    # Tile-cached elements are the same objects on every request; a refreshed tile or a
+    # PoiIndex row is a new object, so its tags are parsed and scored again
+    if hit and cached[0] is element:
+        return cached[1]
+    place = enhance_osm_place_data(element)
+    place_cache.set(key, (element, place))
+    return place
+
+def trip_date(start_date, day):
+    """Calendar date of a trip day, or None for trips without dates"""
+    if not start_date:
+        return None
+    return datetime.datetime.strptime(start_date, "%Y-%m-%d").date() + timedelta(days=day - 1)
 
-def estimate_visit_duration(category):
-    """Estimate how long to spend at a place based on its category"""
-    duration_map = {
-        "Temple": 45,           # 45 minutes
-        "Place Of Worship": 30, # 30 minutes
-        "Museum": 120,          # 2 hours
-        "Restaurant": 60,       # 1 hour
-        "Cafe": 45,             # 45 minutes
-        "Park": 90,             # 1.5 hours
-        "Shopping Mall": 120,   # 2 hours
-        "Market": 90,           # 1.5 hours
-        "Palace": 90,           # 1.5 hours
-        "Viewpoint": 30,        # 30 minutes
-        "Gallery": 90,          # 1.5 hours
-        "Beach": 120,           # 2 hours
-        "Zoo": 180,             # 3 hours
-        "Monument": 30,         # 30 minutes
-        "Castle": 120,          # 2 hours
-        "Archaeological Site": 90, # 1.5 hours
+def format_day(day, date, visits, compact=False):
+    """Serialize a day's timed visits; the only place minutes become clock strings"""
+    schedule = []
+    for visit in visits:
+        place = visit.place
+        slot = time_slot(visit.start, visit.duration, visit.travel)
+        travel_info = f"Travel to next: {visit.travel} min" if visit.travel > 0 else "Last activity"
+        if place is None:
+            schedule.append({
+                "activity": "Lunch Break",
+                "description": "Meal time",
+                "address": "Local restaurant",
+                "category": "Food",
+                "time_slot": slot,
+                "lat": None,
+                "lon": None,
+                "travel_info": "Break time"
+            })
+        elif compact:
+            schedule.append({
+                "placeId": place.id,
+                "activity": f"Visit {place.name}",
+                "time_slot": slot,
+                "travel_info": travel_info
+            })
+        else:
+            schedule.append({
+                "activity": f"Visit {place.name}",
+                "description": place.category,
+                "address": place.address,
+                "category": place.category,
+                "time_slot": slot,
+                "lat": place.lat,
+                "lon": place.lon,
+                "travel_info": travel_info
+            })
+
+    return {
+        "day": day,
+        "date": date.strftime("%Y-%m-%d") if date else f"Day {day}",
+        "schedule": schedule
     }
-    return duration_map.get(category, 60)  # Default 1 hour
 
-@app.route("/api/ai/generate-trip", methods=["POST"])
+@app.route("/api/ai/generate-trip", methods=["POST", "GET"])
 def generate_trip():
     try:
-        data = request.get_json()
-        print("✅ Received:", data)
-
-        destination = data.get("destination", "").strip()
-        start_date = data.get("startDate", "")
-        end_date = data.get("endDate", "")
-        budget = float(data.get("budget", 1000))
-        travelers = int(data.get("travelers", 1))
-        interests = data.get("interests", ["sightseeing"])
-        accommodation = data.get("accommodation", "mid-range")
-        travel_style = data.get("travelStyle", "balanced")
-
-        if not destination:
-            return jsonify({"status": "error", "message": "Destination is required"}), 400
-
-        # Calculate trip duration
-        if start_date and end_date:
-            d1 = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-            d2 = datetime.datetime.strptime(end_date, "%Y-%m-%d")
-            total_days = (d2 - d1).days + 1
-        else:
-            total_days = 3
+        # GET takes the same fields as query parameters so trip links can be shared and revalidated
+        data = request.get_json() if request.method == "POST" else trip_request_from_args(request.args)
+        logger.info("Trip requested", extra=fields(destination=data.get("destination"), interests=data.get("interests")))
 
-        per_day = round(budget / total_days, 2)
+        trip, error = parse_trip_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        key = trip_cache_key(trip)
+        hit, cached = trip_cache.get(key)
+        cache_requests.inc(cache="trip", result="hit" if hit else "miss")
+        if not hit:
+            timer = StageTimer("trip")
+            # Trip builds are bulk work: interactive nearby lookups get upstream slots first
+            with use_priority(BULK):
+                payload, status = build_trip(trip, timer)
+            if status != 200:
+                return jsonify(payload), status
+            cached = encode_trip(payload)
+            timer.mark("serialize")
+            trip_cache.set(key, cached)
 
-        # Get coordinates
-        print(f"📍 Getting coordinates for {destination}...")
-        lat, lon = get_coordinates(destination)
-        if not lat or not lon:
-            return jsonify({"status": "error", "message": f"Could not find coordinates for {destination}."}), 400
+        return trip_response(*cached)
 
-        print(f"📍 Coordinates found: {lat}, {lon}")
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.exception("Server error")
+        return jsonify({"status": "error", "message": "Internal server error"}), 500
 
-        # Get places from Overpass API - MORE PLACES
-        all_places = []
-        for interest in interests:
-            print(f"🔍 Searching for {interest} places in {destination}...")
-            places = get_places_from_overpass(lat, lon, interest, radius=25000)
-            
-            for place in places:
-                enhanced_place = enhance_osm_place_data(place)
-                if enhanced_place:
-                    all_places.append(enhanced_place)
-            
-            time.sleep(1)  # Be nice to the API
+@app.route("/api/ai/trips/<trip_id>", methods=["GET"])
+def get_trip(trip_id):
+    state = load_trip(trip_id)
+    if state is None:
+        return trip_not_found()
+    return trip_response(*encode_saved_trip(trip_id, state))
 
-        print(f"📊 Total raw places found: {len(all_places)}")
+@app.route("/api/ai/trips/<trip_id>/<edit>", methods=["POST"])
+def edit_trip(trip_id, edit):
+    """Edit a saved trip without planning it again; the edited trip comes back under a new tripId"""
+    try:
+        state = load_trip(trip_id)
+        if state is None or edit not in TRIP_EDITS:
+            return trip_not_found()
+        data = request.get_json(silent=True) or {}
 
-        # Remove duplicates by name and coordinates
-        unique_places = []
-        seen_combinations = set()
-        
-        for place in all_places:
-            place_key = f"{place['name']}_{place['lat']:.4f}_{place['lon']:.4f}"
-            if place_key not in seen_combinations:
-                seen_combinations.add(place_key)
-                unique_places.append(place)
-
-        print(f"🎯 Unique places after deduplication: {len(unique_places)}")
-
-        if not unique_places:
-            return jsonify({
-                "status": "error", 
-                "message": f"No places found for {destination}. Try a larger city or different interests."
-            }), 404
-
-        # Sort by category diversity and importance
-        unique_places.sort(key=lambda x: (
-            0 if "tourism" in str(x.get('tags', {})) else 1,  # Prioritize tourist spots
-            len(x['name'])  # Shorter names often indicate more important places
-        ))
-
-        # Generate itinerary with ALL places
-        itinerary = []
-        activities_per_day = min(8, len(unique_places) // total_days + 2)  # More activities per day
-        
-        for day in range(1, total_days + 1):
-            # Get places for this day
-            start_idx = (day - 1) * activities_per_day
-            end_idx = start_idx + activities_per_day
-            day_places = unique_places[start_idx:end_idx]
-            
-            if not day_places:
-                continue
-                
-            day_itinerary = {
-                "day": day,
-                "date": (datetime.datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=day-1)).strftime("%Y-%m-%d") if start_date else f"Day {day}",
-                "schedule": []
-            }
-            
-            # Start day at 9:00 AM
-            current_time = datetime.datetime.strptime("09:00", "%H:%M")
-            
-            for i, place in enumerate(day_places):
-                # Estimate visit duration
-                visit_duration = estimate_visit_duration(place["category"])
-                
-                # Calculate travel time to next place (if any)
-                travel_time = 0
-                if i < len(day_places) - 1:
-                    travel_time = 15  # Default 15 minutes
-                
-                # Create time slot
-                time_slot = create_time_slots(current_time, visit_duration, travel_time)
-                
-                # Add to itinerary - NO COSTS
-                day_itinerary["schedule"].append({
-                    "activity": f"Visit {place['name']}",
-                    "description": place['category'],
-                    "address": place['address'],
-                    "category": place['category'],
-                    "time_slot": time_slot,
-                    "lat": place['lat'],
-                    "lon": place['lon'],
-                    "travel_info": f"Travel to next: {travel_time} min" if travel_time > 0 else "Last activity"
-                })
-                
-                # Move time forward (visit duration + travel time)
-                current_time = current_time + timedelta(minutes=visit_duration + travel_time)
-                
-                # Add lunch break after 2-3 activities
-                if i == 2 and current_time.hour < 14:
-                    lunch_duration = 60
-                    lunch_time = create_time_slots(current_time, lunch_duration, 0)
-                    day_itinerary["schedule"].append({
-                        "activity": "Lunch Break",
-                        "description": "Meal time",
-                        "address": "Local restaurant",
-                        "category": "Food",
-                        "time_slot": lunch_time,
-                        "lat": None,
-                        "lon": None,
-                        "travel_info": "Break time"
-                    })
-                    current_time = current_time + timedelta(minutes=lunch_duration)
-
-            itinerary.append(day_itinerary)
-
-        suggestion = f"A {total_days}-day {travel_style} trip to {destination} with {len(unique_places)} unique places focusing on {', '.join(interests)}."
-
-        return jsonify({
-            "status": "success",
-            "destination": destination,
-            "totalDays": total_days,
-            "perDay": per_day,
-            "totalPlacesFound": len(unique_places),
-            "suggestion": suggestion,
-            "itinerary": itinerary,
-            "allPlaces": unique_places  # Send ALL places for the map
-        })
+        timer = StageTimer("trip_edit")
+        places_by_interest = {}
+        added = interests_to_add(state, data) if edit == "interests" else []
+        if added:
+            # Only the new interests are fetched, usually straight from the tile cache
+            places_by_interest = get_places_for_interests(state.lat, state.lon, added, radius=25000)
+            timer.mark("overpass")
+        etag, body = apply_trip_edit(state, edit, data, places_by_interest)
+        timer.mark("schedule")
+        response = Response(body, mimetype="application/json")
+        # The ETag a GET of the new tripId will answer with, so clients can revalidate from here
+        response.set_etag(etag)
+        return response
 
+    except InvalidEdit as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
-        print("❌ Server Error:", str(e))
+        logger.exception("Server error")
         return jsonify({"status": "error", "message": "Internal server error"}), 500
 
+def trip_response(etag, body):
+    # 304 only answers safe methods (RFC 9110); a POST gets the full trip
+    if request.method in ("GET", "HEAD") and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def overloaded_response(error):
+    response = jsonify({"status": "error", "message": "Upstream services are busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+def trip_not_found():
+    return jsonify({"status": "error", "message": "Trip not found or expired, please generate it again"}), 404
+
+def trip_request_from_args(args):
+    data = {key: args[key] for key in ("destination", "startDate", "endDate", "budget", "travelers",
+                                       "accommodation", "travelStyle", "fields") if key in args}
+    if "interests" in args:
+        data["interests"] = [i for i in args["interests"].split(",") if i]
+    for flag in ("include_tags", "compact"):
+        if flag in args:
+            data[flag] = args[flag].lower() in ("1", "true", "yes")
+    return data
+
+def trip_cache_key(trip):
+    """Everything that changes the response, from the normalized trip; the plan itself is deterministic given upstream data"""
+    return (
+        normalize_city(trip["destination"]),
+        trip["start_date"],
+        trip["total_days"],
+        trip["budget"],
+        tuple(trip["interests"]),
+        trip["travel_style"],
+        trip["place_fields"],
+        trip["compact"],
+    )
+
+def encode_trip(payload):
+    """(etag, body) for a finished trip"""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return hashlib.sha1(body).hexdigest(), body
+
+def encode_saved_trip(trip_id, state):
+    """encode_trip for a saved trip, splicing in allPlaces as encoded the first time; same bytes as encode_trip"""
+    payload = trip_payload(trip_id, state, all_places=False)
+    if state.places_json is None:
+        state.places_json = json.dumps([place.to_dict(state.trip["place_fields"]) for place in state.places],
+                                       separators=(",", ":")).encode()
+    body = json.dumps(payload, separators=(",", ":")).encode()[:-1] + b',"allPlaces":' + state.places_json + b"}"
+    return hashlib.sha1(body).hexdigest(), body
+
+def build_trip(trip, timer=None):
+    """Plan a trip for settings from parse_trip_request; returns (payload, status)"""
+    timer = timer or StageTimer("trip")
+    lat, lon = get_coordinates(trip["destination"])
+    timer.mark("geocode")
+    if not lat or not lon:
+        return destination_not_found(trip)
+
+    # Get places from Overpass API - MORE PLACES, one round-trip for every interest
+    places_by_interest = get_places_for_interests(lat, lon, trip["interests"], radius=25000)
+    timer.mark("overpass")
+    return assemble_trip(trip, lat, lon, places_by_interest, timer)
+
+def parse_trip_request(data):
+    """(trip settings, None), or (None, (error payload, status)) for a bad request"""
+    # Geocoded and echoed as given; only trip_cache_key folds case and punctuation
+    destination = str(data.get("destination", "")).strip()
+    start_date = data.get("startDate", "")
+    end_date = data.get("endDate", "")
+    budget = float(data.get("budget", 1000))
+    int(data.get("travelers", 1))  # not used in planning yet, but still validated
+    interests = normalize_interests(data.get("interests", ["sightseeing"])) or ["sightseeing"]
+
+    if not destination:
+        return None, ({"status": "error", "message": "Destination is required"}, 400)
+
+    # Calculate trip duration
+    if start_date and end_date:
+        d1 = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        d2 = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+        total_days = (d2 - d1).days + 1
+    else:
+        total_days = 3
+    if not 1 <= total_days <= MAX_TRIP_DAYS:
+        return None, ({"status": "error", "message": f"A trip has between 1 and {MAX_TRIP_DAYS} days"}, 400)
+
+    return {
+        "destination": destination,
+        "start_date": start_date,
+        "total_days": total_days,
+        "budget": budget,
+        "per_day": round(budget / total_days, 2),
+        "interests": interests,
+        "travel_style": str(data.get("travelStyle", "balanced")).strip().lower(),
+        # Response shaping: allPlaces field selection, and id references instead of copies in the itinerary
+        "place_fields": parse_fields(data.get("fields"), data.get("include_tags", True)),
+        "compact": bool(data.get("compact", False)),
+    }, None
+
+def normalize_interests(interests):
+    return list(dict.fromkeys(i.strip().lower() for i in interests if i.strip()))
+
+def destination_not_found(trip):
+    return {"status": "error", "message": f"Could not find coordinates for {trip['destination']}."}, 400
+
+def assemble_trip(trip, lat, lon, places_by_interest, timer):
+    """Everything after the upstream calls: parse, dedupe, rank, plan and schedule; returns (payload, status)"""
+    destination = trip["destination"]
+    total_days = trip["total_days"]
+    interests = trip["interests"]
+
+    found = parsed_places(places_by_interest, interests)
+    timer.mark("parse")
+
+    # Remove duplicates: same normalized name close together (node vs way center, casing)
+    unique_places, sources = merge_candidates([], {}, found)
+    timer.mark("dedup")
+    logger.info("Places deduplicated", extra=fields(destination=destination, raw=len(found), unique=len(unique_places)))
+
+    if not unique_places:
+        return {
+            "status": "error", 
+            "message": f"No places found for {destination}. Try a larger city or different interests."
+        }, 404
+
+    # Generate itinerary with ALL places
+    activities_per_day = min(8, len(unique_places) // total_days + 2)  # More activities per day
+
+    # Most important places by precomputed score, only as many as get scheduled
+    selected_places = top_places(unique_places, total_days * activities_per_day)
+    timer.mark("rank")
+
+    # Grouped into geographic days and ordered into short routes
+    day_plans = plan_days(selected_places, total_days, activities_per_day, (lat, lon))
+    # Too few places to fill every day leaves the last ones free, so the itinerary still spans the trip
+    day_plans += [[] for _ in range(total_days - len(day_plans))]
+    timer.mark("plan")
+
+    # Kept under a trip id so edits can reuse the candidates and untouched days
+    state = SavedTrip(trip, lat, lon, unique_places, sources, activities_per_day, day_plans)
+    schedule_pending(state)
+    timer.mark("schedule")
+
+    return trip_payload(save_trip(state), state), 200
+
+def parsed_places(places_by_interest, interests):
+    """(interest, Place) for every usable element, in interest order"""
+    found = []
+    for interest in interests:
+        for place in places_by_interest.get(interest, []):
+            enhanced_place = parse_place(place)
+            if enhanced_place:
+                found.append((interest, enhanced_place))
+    return found
+
+def schedule_pending(state):
+    """Schedule the days a saved trip has no schedule for: all of them when new, the edited ones after an edit"""
+    trip = state.trip
+    for day, day_places in enumerate(state.days, start=1):
+        if state.itinerary[day - 1] is None:
+            date = trip_date(trip["start_date"], day)
+            visits = plan_visits(day_places, date)
+            if sum(1 for visit in visits if visit.place is not None) < len(day_places):
+                # Stops that couldn't be fitted (closed that day) are swapped for open places around them
+                kept = [visit.place for visit in visits if visit.place is not None]
+                day_places = refill_day(state, day_places, kept, lambda place: open_on(place, date))
+                visits = plan_visits(day_places, date)
+            # Anything still left out drops out of the plan as well, so edit indices match the schedule
+            state.days[day - 1] = [visit.place for visit in visits if visit.place is not None]
+            state.itinerary[day - 1] = format_day(day, date, visits, trip["compact"])
+
+def trip_payload(trip_id, state, all_places=True):
+    trip = state.trip
+    suggestion = f"A {trip['total_days']}-day {trip['travel_style']} trip to {trip['destination']} with {len(state.places)} unique places focusing on {', '.join(trip['interests'])}."
+
+    payload = {
+        "status": "success",
+        "tripId": trip_id,
+        "destination": trip["destination"],
+        "totalDays": trip["total_days"],
+        "perDay": trip["per_day"],
+        "totalPlacesFound": len(state.places),
+        "suggestion": suggestion,
+        "itinerary": state.itinerary,
+    }
+    if all_places:
+        payload["allPlaces"] = [place.to_dict(trip["place_fields"]) for place in state.places]  # Send ALL places for the map
+    return payload
+
+# POST /api/ai/trips/<id>/<edit> bodies:
+#   remove-stop   {"day": 2, "index": 0}                 index counts stops, not lunch breaks
+#   replace-stop  {"day": 2, "index": 0, "placeId": "n1"} without placeId, the best unused place nearby
+#   dates         {"endDate": "2025-06-05"} or {"days": 5}
+#   interests     {"add": ["food"], "remove": ["shopping"]}
+TRIP_EDITS = ("remove-stop", "replace-stop", "dates", "interests")
+
+def interests_to_add(state, data):
+    add = data.get("add", [])
+    if not isinstance(add, list) or not all(isinstance(i, str) for i in add):
+        raise InvalidEdit("add must be a list of interests")
+    return [i for i in normalize_interests(add) if i not in state.trip["interests"]]
+
+def trip_length(trip, data):
+    """Days in the trip after a dates edit"""
+    if "days" in data:
+        return int(data["days"])
+    if not trip["start_date"]:
+        raise InvalidEdit("This trip has no startDate, send days instead of endDate")
+    d1 = datetime.datetime.strptime(trip["start_date"], "%Y-%m-%d")
+    d2 = datetime.datetime.strptime(data["endDate"], "%Y-%m-%d")
+    return (d2 - d1).days + 1
+
+def apply_trip_edit(state, edit, data, places_by_interest):
+    """Apply an edit, schedule only the days it changed and save the result; returns (etag, body)"""
+    try:
+        if edit == "remove-stop":
+            edited = remove_stop(state, int(data["day"]), int(data["index"]))
+        elif edit == "replace-stop":
+            place_id = data.get("placeId")
+            edited = replace_stop(state, int(data["day"]), int(data["index"]), str(place_id) if place_id else None)
+        elif edit == "dates":
+            edited = resize_trip(state, trip_length(state.trip, data))
+        else:
+            add = interests_to_add(state, data)
+            remove = data.get("remove", [])
+            if not isinstance(remove, list) or not all(isinstance(i, str) for i in remove):
+                raise InvalidEdit("remove must be a list of interests")
+            edited = change_interests(state, add, parsed_places(places_by_interest, add), normalize_interests(remove))
+    except InvalidEdit:
+        raise
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidEdit(f"Invalid {edit} edit: {e}")
+
+    schedule_pending(edited)
+    encoded = encode_saved_trip(save_trip(edited), edited)
+    if edited.places is state.places:
+        # Same candidates: edits of the original trip can reuse the encoding too
+        state.places_json = edited.places_json
+    return encoded
+
+@app.route("/api/destinations/suggest", methods=["GET"])
+def suggest_destinations():
+    payload, status = suggest_payload(request.args)
+    response = jsonify(payload)
+    if status == 200:
+        # The gazetteer only changes on deploy, so browsers may reuse answers while the user types
+        response.headers["Cache-Control"] = "public, max-age=3600"
+    return response, status
+
+def suggest_payload(args):
+    """(payload, status) for /api/destinations/suggest?q=...&limit=..."""
+    query = args.get("q", "")
+    try:
+        limit = int(args.get("limit", 10))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return {"status": "error", "message": f"limit must be between 1 and {MAX_SUGGESTIONS}"}, 400
+    return {"status": "success", "query": query, "suggestions": gazetteer.suggest(query, limit)}, 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/health", methods=["GET"])
 def health_check():
-    return jsonify({"status": "healthy", "service": "Trip Planner API"})
+    return jsonify({
+        "status": "healthy",
+        "service": "Trip Planner API",
+        "geocodeCache": geocode_cache.snapshot(),
+        "gazetteer": gazetteer.snapshot(),
+        "upstream": overpass_client.snapshot(),
+        "scheduler": upstream_scheduler.snapshot(),
+        "singleFlight": singleflight.snapshot()
+    })
 
 if __name__ == "__main__":
     app.run(debug=True, port=8000)
\ No newline at end of file
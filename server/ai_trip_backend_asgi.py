@@ -0,0 +1,231 @@
+"""Trip Planner API as an ASGI app: same routes and JSON as ai_trip_backend.py, with non-blocking upstream calls.
+
+    pip install quart quart-cors httpx hypercorn
+    hypercorn ai_trip_backend_asgi:app --bind 0.0.0.0:8000
+
+Geocoding and Overpass are awaited instead of blocking a thread; everything
+after them (parsing, dedup, planning, scheduling, saving) is the shared
+assemble_trip, run in a worker thread.
+"""
+import asyncio
+import math
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+
+import ai_trip_backend as trip_api
+from ai_trip_backend import (NOMINATIM_HOST, NOMINATIM_URL, TRIP_EDITS, apply_trip_edit, assemble_trip,
+                             destination_not_found, encode_saved_trip, encode_trip, interest_layers, interests_to_add,
+                             local_coordinates, parse_trip_request, suggest_payload, trip_cache, trip_cache_key,
+                             trip_request_from_args)
+from compression import init_compression_async
+from gazetteer import gazetteer
+from geocode_cache import geocode_cache, normalize_city
+from log import fields, get_logger
+import metrics
+from metrics import StageTimer, cache_requests, upstream_errors, upstream_seconds
+from overpass_tiles import TRIP_TILE_ZOOM, TileCache
+from poi_index import POI_BACKEND
+from scheduler import BULK, Overloaded, upstream_scheduler, use_priority
+import singleflight
+from singleflight import AsyncSingleFlight
+from trips import InvalidEdit, load_trip
+from upstream_async import async_overpass_client, close_clients, get_async_client
+
+app = cors(Quart(__name__), allow_origin="*")
+init_compression_async(app)
+
+logger = get_logger("trip_asgi")
+
+# Named apart from the groups of the imported ai_trip_backend, which this process registers too
+geocode_flight = AsyncSingleFlight("geocode_async")
+overpass_flight = AsyncSingleFlight("overpass_async")
+
+@app.after_serving
+async def shutdown():
+    await close_clients()
+
+async def get_coordinates(city):
+    """Async twin of ai_trip_backend.get_coordinates"""
+    coords = local_coordinates(city)
+    if coords:
+        return coords
+    # The geocode cache reads SQLite on a miss in memory, which mustn't stall the event loop
+    hit, coords = await asyncio.to_thread(geocode_cache.get, city)
+    if hit:
+        return coords
+    return await geocode_flight.do(normalize_city(city), lookup_nominatim, city)
+
+async def lookup_nominatim(city):
+    try:
+        params = {"city": city, "format": "json", "limit": 1}
+        async with upstream_scheduler.aslot(NOMINATIM_HOST):
+            with upstream_seconds.time(host=NOMINATIM_HOST):
+                resp = await get_async_client(NOMINATIM_URL).get(NOMINATIM_URL, params=params, timeout=10)
+        resp.raise_for_status()
+        data = resp.json()
+        coords = (float(data[0]["lat"]), float(data[0]["lon"])) if data else (None, None)
+        await asyncio.to_thread(geocode_cache.set, city, coords)
+        return coords
+    except Overloaded:
+        raise
+    except Exception as e:
+        upstream_errors.inc(host=NOMINATIM_HOST)
+        logger.warning("Nominatim error", extra=fields(city=city, error=str(e)))
+    return None, None
+
+async def fetch_overpass_elements(query):
+    return await overpass_flight.do(query, post_overpass_query, query)
+
+async def post_overpass_query(query):
+    resp = await async_overpass_client.post(query, timeout=30)
+    return resp.json().get("elements", [])
+
+overpass_tiles = TileCache(trip_api.fetch_overpass_elements, zoom=TRIP_TILE_ZOOM, afetch=fetch_overpass_elements)
+
+poi_source = trip_api.poi_source if POI_BACKEND == "offline" else overpass_tiles
+
+async def get_places_for_interests(lat, lon, interests, radius=20000):
+    """Async twin of ai_trip_backend.get_places_for_interests"""
+    interests, layer_for, layers = interest_layers(interests)
+    try:
+        found = await poi_source.query_async(layers, lat, lon, radius)
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.warning("Error fetching from Overpass API", extra=fields(interests=interests, error=str(e)))
+        return {interest: [] for interest in interests}
+
+    logger.info("Found places", extra=fields(count=sum(len(v) for v in found.values()), interests=interests))
+    return {interest: found[layer_for[interest]] for interest in interests}
+
+async def build_trip(trip, timer):
+    lat, lon = await get_coordinates(trip["destination"])
+    timer.mark("geocode")
+    if not lat or not lon:
+        return destination_not_found(trip)
+
+    places_by_interest = await get_places_for_interests(lat, lon, trip["interests"], radius=25000)
+    timer.mark("overpass")
+    # Planning ends in save_trip's SQLite commit, which mustn't hold up the event loop
+    return await asyncio.to_thread(assemble_trip, trip, lat, lon, places_by_interest, timer)
+
+@app.route("/api/ai/generate-trip", methods=["POST", "GET"])
+async def generate_trip():
+    try:
+        data = await request.get_json() if request.method == "POST" else trip_request_from_args(request.args)
+        logger.info("Trip requested", extra=fields(destination=data.get("destination"), interests=data.get("interests")))
+
+        trip, error = parse_trip_request(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        key = trip_cache_key(trip)
+        hit, cached = trip_cache.get(key)
+        cache_requests.inc(cache="trip", result="hit" if hit else "miss")
+        if not hit:
+            timer = StageTimer("trip")
+            with use_priority(BULK):
+                payload, status = await build_trip(trip, timer)
+            if status != 200:
+                return jsonify(payload), status
+            cached = encode_trip(payload)
+            timer.mark("serialize")
+            trip_cache.set(key, cached)
+
+        return trip_response(*cached)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.exception("Server error")
+        return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+@app.route("/api/ai/trips/<trip_id>", methods=["GET"])
+async def get_trip(trip_id):
+    state = await asyncio.to_thread(load_trip, trip_id)
+    if state is None:
+        return trip_not_found()
+    return trip_response(*encode_saved_trip(trip_id, state))
+
+@app.route("/api/ai/trips/<trip_id>/<edit>", methods=["POST"])
+async def edit_trip(trip_id, edit):
+    """Async twin of ai_trip_backend.edit_trip"""
+    try:
+        state = await asyncio.to_thread(load_trip, trip_id)
+        if state is None or edit not in TRIP_EDITS:
+            return trip_not_found()
+        data = await request.get_json(silent=True) or {}
+
+        timer = StageTimer("trip_edit")
+        places_by_interest = {}
+        added = interests_to_add(state, data) if edit == "interests" else []
+        if added:
+            places_by_interest = await get_places_for_interests(state.lat, state.lon, added, radius=25000)
+            timer.mark("overpass")
+        etag, body = await asyncio.to_thread(apply_trip_edit, state, edit, data, places_by_interest)
+        timer.mark("schedule")
+        response = Response(body, mimetype="application/json")
+        # The ETag a GET of the new tripId will answer with, so clients can revalidate from here
+        response.set_etag(etag)
+        return response
+
+    except InvalidEdit as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.exception("Server error")
+        return jsonify({"status": "error", "message": "Internal server error"}), 500
+
+def trip_response(etag, body):
+    # 304 only answers safe methods (RFC 9110); a POST gets the full trip
+    if request.method in ("GET", "HEAD") and request.if_none_match.contains_weak(etag):
+        response = Response(b"", status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def overloaded_response(error):
+    response = jsonify({"status": "error", "message": "Upstream services are busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+def trip_not_found():
+    return jsonify({"status": "error", "message": "Trip not found or expired, please generate it again"}), 404
+
+@app.route("/api/destinations/suggest", methods=["GET"])
+async def suggest_destinations():
+    payload, status = suggest_payload(request.args)
+    response = jsonify(payload)
+    if status == 200:
+        response.headers["Cache-Control"] = "public, max-age=3600"
+    return response, status
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/health", methods=["GET"])
+async def health_check():
+    return jsonify({
+        "status": "healthy",
+        "service": "Trip Planner API",
+        "geocodeCache": geocode_cache.snapshot(),
+        "gazetteer": gazetteer.snapshot(),
+        "upstream": async_overpass_client.snapshot(),
+        "scheduler": upstream_scheduler.snapshot(),
+        "singleFlight": singleflight.snapshot()
+    })
+
+if __name__ == "__main__":
+    import asyncio
+
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ["0.0.0.0:8000"]
+    asyncio.run(serve(app, config))
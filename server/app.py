@@ -1,17 +1,30 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-import requests
+import heapq
+import json
 import math
 
+from compression import init_compression
+from geo import PointIndex, densified_count, densify_polyline, element_coords, haversine_km_many, np
+from log import fields, get_logger
+import metrics
+from metrics import StageTimer
+from osm_stream import CHUNK_SIZE, iter_elements
+from overpass_query import around, build_union_query
+from overpass_tiles import TileCache
+from poi_index import POI_BACKEND, PoiIndex
+from scheduler import Overloaded, upstream_scheduler
+import singleflight
+from singleflight import SingleFlight
+from upstream import UpstreamError, overpass_client
+
 app = Flask(__name__)
 CORS(app)
+init_compression(app)
 
-# Overpass servers (backup if one fails)
-OVERPASS_SERVERS = [
-    "https://overpass-api.de/api/interpreter",
-    "https://overpass.kumi.systems/api/interpreter",
-    "https://overpass.openstreetmap.fr/api/interpreter"
-]
+overpass_flight = SingleFlight("overpass")
+
+logger = get_logger("nearby")
 
 # Define categories for filtering
 CATEGORY_FILTERS = {
@@ -22,6 +35,18 @@ CATEGORY_FILTERS = {
     "fuel": '["amenity"~"fuel|charging_station"]'
 }
 
+# Used when no category is given
+ALL_SELECTORS = [
+    ("node", '["amenity"]'),
+    ("way", '["amenity"]'),
+    ("node", '["tourism"]'),
+    ("way", '["tourism"]'),
+]
+
+MAX_BATCH_POINTS = 200
+MAX_RADIUS = 50000    # meters, for nearby searches, batch points and corridors alike
+MIN_CORRIDOR = 10
+
 @app.route("/")
 def home():
     return jsonify({
@@ -30,7 +55,8 @@ def home():
         "endpoints": {
             "/": "Homepage",
             "/api/health": "Health check",
-            "/api/nearby": "Get nearby places (POST)"
+            "/api/nearby": "Get nearby places (POST), nearest first, optional limit/offset",
+            "/api/nearby/batch": "Nearby places for many points or a route corridor (POST), one upstream query"
         }
     })
 
@@ -39,14 +65,83 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "message": "Server is running correctly!",
-        "service": "Nearby Places API"
+        "service": "Nearby Places API",
+        "upstream": overpass_client.snapshot(),
+        "scheduler": upstream_scheduler.snapshot(),
+        "singleFlight": singleflight.snapshot()
     })
 
 @app.route("/api/nearby", methods=["POST", "GET"])
 def nearby_places():
     try:
-        if request.method == "POST":
-            data = request.get_json() or {}
+        data = (request.get_json() or {}) if request.method == "POST" else request.args
+        lat, lon, radius, category, limit, offset = nearby_request(data, request.method)
+
+        # Overpass selectors for this category, answered from the tile cache where possible
+        layer, selectors = category_layer(category)
+
+        # Opt-in NDJSON streaming: each place is sent as soon as it is parsed off the upstream socket
+        if wants_stream(data, request.headers):
+            return Response(stream_nearby(selectors, lat, lon, radius), mimetype="application/x-ndjson")
+
+        timer = StageTimer("nearby")
+        try:
+            elements = poi_source.query({layer: selectors}, lat, lon, radius)[layer]
+        except RuntimeError:
+            elements = []  # every mirror failed, same empty answer as before
+        except Overloaded as e:
+            # Rate limits are saturated; a quick 503 beats holding the connection until the queue drains
+            return overloaded_response(e)
+        timer.mark("overpass")
+
+        response = jsonify(nearby_payload(elements, lat, lon, radius, category, limit, offset, timer))
+        timer.mark("serialize")
+        return response
+
+    except InvalidRequest as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error fetching nearby places")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/nearby/batch", methods=["POST"])
+def nearby_batch():
+    """Nearby places for many points, or a polyline corridor, from one upstream query"""
+    try:
+        points, nearest_only, category, limit = batch_request(request.get_json() or {})
+
+        timer = StageTimer("nearby_batch")
+        layer, selectors = category_layer(category)
+        try:
+            elements = poi_source.query_many({layer: selectors}, points)[layer]
+        except RuntimeError:
+            elements = []
+        except Overloaded as e:
+            return overloaded_response(e)
+        timer.mark("overpass")
+
+        response = jsonify(batch_payload(elements, points, nearest_only, category, limit, timer))
+        timer.mark("serialize")
+        return response
+
+    except InvalidRequest as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error fetching nearby places in batch")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# Request parsing and response building, shared with the ASGI service in app_asgi.py
+
+class InvalidRequest(ValueError):
+    """Bad client input, answered with a 400"""
+
+
+def nearby_request(data, method):
+    """(lat, lon, radius, category, limit, offset) for /api/nearby"""
+    try:
+        if method == "POST":
             lat = float(data.get("lat", 40.7128))
             lon = float(data.get("lon", -74.0060))
             radius = int(data.get("radius", 5000))
@@ -56,69 +151,242 @@ def nearby_places():
             lat, lon, radius = 40.7128, -74.0060, 5000
             category = None
 
-        print(f"📍 Searching at {lat}, {lon}, radius: {radius}m")
-
-        # Build Overpass query
-        if category and category in CATEGORY_FILTERS:
-            query = f"""
-            [out:json][timeout:25];
-            (
-                node{CATEGORY_FILTERS[category]}(around:{radius},{lat},{lon});
-                way{CATEGORY_FILTERS[category]}(around:{radius},{lat},{lon});
-            );
-            out center;
-            """
+        # Optional paging; without a limit every place is returned, nearest first
+        limit = data.get("limit")
+        limit = int(limit) if limit is not None else None
+        offset = int(data.get("offset", 0))
+    except (TypeError, ValueError) as e:
+        raise InvalidRequest(f"Invalid nearby request: {e}")
+
+    if (limit is not None and limit < 1) or offset < 0:
+        raise InvalidRequest("limit must be >= 1 and offset >= 0")
+    if not 1 <= radius <= MAX_RADIUS:
+        raise InvalidRequest(f"radius must be between 1 and {MAX_RADIUS} meters")
+    return lat, lon, radius, category, limit, offset
+
+
+def wants_stream(data, headers):
+    return data.get("stream") in (True, "1", "true") or "application/x-ndjson" in headers.get("Accept", "")
+
+
+def nearby_payload(elements, lat, lon, radius, category, limit, offset, timer):
+    total, ranked = rank_nearby(elements, lat, lon, radius, limit, offset)
+    timer.mark("rank")
+    places = []
+
+    for element, distance in ranked:
+        place = parse_osm_element(element, lat, lon, distance)
+        if place:
+            places.append(place)
+    timer.mark("parse")
+
+    logger.info("Nearby search", extra=fields(lat=lat, lon=lon, radius=radius, category=category,
+                                              total=total, returned=len(places)))
+
+    return {
+        "status": "success",
+        "count": len(places),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "places": places,
+        "user_location": {"lat": lat, "lon": lon},
+        "radius": radius
+    }
+
+
+def batch_request(data):
+    """(points, nearest_only, category, limit) for /api/nearby/batch"""
+    try:
+        category = data.get("category")
+        limit = data.get("limit")
+        limit = int(limit) if limit is not None else None
+
+        polyline = data.get("polyline")
+        if polyline:
+            corridor = float(data.get("corridor", 1000))
+            polyline = [(float(lat), float(lon)) for lat, lon in polyline]
         else:
-            # Query all categories
-            query = f"""
-            [out:json][timeout:25];
-            (
-                node["amenity"](around:{radius},{lat},{lon});
-                way["amenity"](around:{radius},{lat},{lon});
-                node["tourism"](around:{radius},{lat},{lon});
-                way["tourism"](around:{radius},{lat},{lon});
-            );
-            out center;
-            """
-
-        data = fetch_overpass(query)
-        places = []
-        
-        for element in data.get("elements", []):
+            points = [(float(p["lat"]), float(p["lon"]), int(p.get("radius", 5000))) for p in data.get("points", [])]
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidRequest(f"Invalid batch request: {e}")
+
+    if limit is not None and limit < 1:
+        raise InvalidRequest("limit must be >= 1")
+    if polyline:
+        if not MIN_CORRIDOR <= corridor <= MAX_RADIUS:
+            raise InvalidRequest(f"corridor must be between {MIN_CORRIDOR} and {MAX_RADIUS} meters")
+        # Circles of radius corridor/2 * 1.12 spaced corridor/2 apart cover the whole corridor.
+        # Counted before densifying, so a narrow corridor along a long route is turned down cheaply.
+        half_width = corridor / 2
+        if len(polyline) > MAX_BATCH_POINTS or densified_count(polyline, half_width) > MAX_BATCH_POINTS:
+            raise InvalidRequest(f"At most {MAX_BATCH_POINTS} points per batch, widen the corridor or split the route")
+        radius = int(half_width * 1.12)
+        points = [(lat, lon, radius) for lat, lon in densify_polyline(polyline, half_width)]
+        nearest_only = True
+    else:
+        nearest_only = False
+    if not points:
+        raise InvalidRequest("points or polyline is required")
+    if len(points) > MAX_BATCH_POINTS:
+        raise InvalidRequest(f"At most {MAX_BATCH_POINTS} points per batch, widen the corridor or split the route")
+    if any(not 1 <= radius <= MAX_RADIUS for _, _, radius in points):
+        raise InvalidRequest(f"radius must be between 1 and {MAX_RADIUS} meters")
+    return points, nearest_only, category, limit
+
+
+def batch_payload(elements, points, nearest_only, category, limit, timer):
+    matches = assign_to_points(elements, points, nearest_only)
+    timer.mark("rank")
+
+    results = []
+    for (lat, lon, radius), found in zip(points, matches):
+        ranked = heapq.nsmallest(limit, found, key=lambda m: m[1]) if limit else sorted(found, key=lambda m: m[1])
+        places = [place for place in (parse_osm_element(e, lat, lon, d) for e, d in ranked) if place]
+        results.append({"lat": lat, "lon": lon, "radius": radius, "total": len(found),
+                        "count": len(places), "places": places})
+    timer.mark("parse")
+
+    logger.info("Nearby batch search", extra=fields(points=len(points), category=category, elements=len(elements),
+                                                    returned=sum(r["count"] for r in results)))
+
+    return {
+        "status": "success",
+        "count": sum(r["count"] for r in results),
+        "limit": limit,
+        "results": results
+    }
+
+
+def category_layer(category):
+    """(tile cache layer, Overpass selectors) for a nearby category, or every category"""
+    if category and category in CATEGORY_FILTERS:
+        return category, [("node", CATEGORY_FILTERS[category]), ("way", CATEGORY_FILTERS[category])]
+    return "all", ALL_SELECTORS
+
+
+def assign_to_points(elements, points, nearest_only=False):
+    """Per point, [(element, km)] for the named elements within its radius; nearest_only keeps each at one point"""
+    index = PointIndex(points)
+    matches = [[] for _ in points]
+    for element in elements:
+        if not element.get("tags", {}).get("name"):
+            continue
+        lat, lon = element_coords(element)
+        if lat is None:
+            continue
+        found = index.within(lat, lon)
+        if nearest_only and found:
+            found = [min(found, key=lambda m: m[1])]
+        for i, distance in found:
+            matches[i].append((element, distance))
+    return matches
+
+
+def overloaded_response(error):
+    response = jsonify({"status": "error", "message": "Upstream services are busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
+def rank_nearby(elements, user_lat, user_lon, radius, limit=None, offset=0):
+    """Distance-sort elements in one vectorized pass and return (total, page of (element, km))"""
+    # Same gate as parse_osm_element: must be named and located
+    candidates, lats, lons = [], [], []
+    for element in elements:
+        if not element.get("tags", {}).get("name"):
+            continue
+        lat, lon = element_coords(element)
+        if lat is None:
+            continue
+        candidates.append(element)
+        lats.append(lat)
+        lons.append(lon)
+
+    distances = haversine_km_many(user_lat, user_lon, lats, lons)
+    radius_km = radius / 1000
+
+    if np is None:
+        in_range = [i for i, d in enumerate(distances) if d <= radius_km]
+        end = len(in_range) if limit is None else offset + limit
+        order = heapq.nsmallest(end, in_range, key=distances.__getitem__)[offset:]
+        return len(in_range), [(candidates[i], distances[i]) for i in order]
+
+    in_range = np.flatnonzero(distances <= radius_km)
+    total = len(in_range)
+    end = total if limit is None else min(offset + limit, total)
+    if offset >= end:
+        return total, []
+    in_range_distances = distances[in_range]
+    if end < total:
+        # Only the first `end` entries need ordering
+        nearest = np.argpartition(in_range_distances, end - 1)[:end]
+    else:
+        nearest = np.arange(total)
+    nearest = nearest[np.argsort(in_range_distances[nearest], kind="stable")][offset:end]
+    return total, [(candidates[i], float(distances[i])) for i in in_range[nearest]]
+
+
+def stream_nearby(selectors, lat, lon, radius):
+    """Yield one NDJSON line per place; memory stays flat regardless of result size"""
+    count = 0
+    try:
+        if POI_BACKEND == "offline":
+            elements = poi_source.query({"stream": selectors}, lat, lon, radius)["stream"]
+        else:
+            elements = stream_overpass_elements(build_union_query(selectors, around(radius, lat, lon)))
+        for element in elements:
             place = parse_osm_element(element, lat, lon)
             if place:
-                places.append(place)
+                count += 1
+                yield json.dumps(place) + "\n"
+    except Exception as e:
+        # Headers are already sent, so the only option left is to end the stream
+        logger.warning("Error streaming nearby places", extra=fields(error=str(e)))
+    logger.info("Streamed nearby places", extra=fields(count=count))
 
-        print(f"✅ Found {len(places)} places")
 
-        return jsonify({
-            "status": "success",
-            "count": len(places),
-            "places": places,
-            "user_location": {"lat": lat, "lon": lon},
-            "radius": radius
-        })
+def stream_overpass_elements(query):
+    """Like fetch_overpass_elements, but yields elements while the response is still arriving"""
+    try:
+        res = overpass_client.post(query, stream=True)
+    except UpstreamError as e:
+        logger.warning("Streaming Overpass request failed", extra=fields(error=str(e)))
+        return
 
-    except Exception as e:
-        print("Error fetching nearby places:", e)
-        return jsonify({"status": "error", "message": str(e)}), 500
+    try:
+        yield from iter_elements(res.iter_content(CHUNK_SIZE))
+    finally:
+        res.close()
 
 
-def fetch_overpass(query):
-    for server in OVERPASS_SERVERS:
-        try:
-            print(f"🔍 Trying Overpass server: {server}")
-            res = requests.post(server, data=query, timeout=20)
-            if res.status_code == 200:
-                print(f"✅ Success with {server}")
-                return res.json()
-        except Exception as e:
-            print(f"❌ Failed with {server}: {e}")
-            continue
-    return {"elements": []}
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def fetch_overpass_elements(query):
+    """Ask the healthiest Overpass mirror (hedged), raising if all fail so the tile cache skips them"""
+    # Duplicate map requests in flight at once share one upstream call
+    return overpass_flight.do(query, post_overpass_query, query)
+
+
+def post_overpass_query(query):
+    try:
+        res = overpass_client.post(query)
+    except UpstreamError as e:
+        raise RuntimeError(str(e))
+    return res.json().get("elements", [])
+
+
+overpass_tiles = TileCache(fetch_overpass_elements)
+
+# POI_BACKEND=offline answers from the local index built by poi_index.py instead of the network
+poi_source = PoiIndex() if POI_BACKEND == "offline" else overpass_tiles
 
 
-def parse_osm_element(element, user_lat, user_lon):
+def parse_osm_element(element, user_lat, user_lon, distance=None):
     try:
         tags = element.get("tags", {})
         name = tags.get("name")
@@ -133,8 +401,9 @@ def parse_osm_element(element, user_lat, user_lon):
         else:
             return None
 
-        # Calculate distance
-        distance = calculate_distance(user_lat, user_lon, lat, lon)
+        # Calculate distance, unless the batch path already did
+        if distance is None:
+            distance = calculate_distance(user_lat, user_lon, lat, lon)
 
         # Determine category
         amenity = tags.get("amenity", "")
@@ -170,7 +439,7 @@ def parse_osm_element(element, user_lat, user_lon):
             "distance_km": round(distance, 2)
         }
     except Exception as e:
-        print(f"Error parsing element: {e}")
+        logger.warning("Error parsing element", extra=fields(error=str(e)))
         return None
 
 
@@ -196,4 +465,5 @@ if __name__ == "__main__":
     print("   GET  /api/health       - Health check")
     print("   POST /api/nearby       - Get nearby places")
     print("   GET  /api/nearby       - Get nearby places (default location)")
+    print("   POST /api/nearby/batch - Nearby places for many points or a route")
     app.run(host="0.0.0.0", port=6000, debug=True)
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""Nearby Places API as an ASGI app: same routes and JSON as app.py, with non-blocking upstream calls.
+
+    pip install quart quart-cors httpx hypercorn
+    hypercorn app_asgi:app --bind 0.0.0.0:6000
+
+A worker holds no thread while it waits on Overpass, so one process can keep
+hundreds of slow upstream requests in flight. Parsing and ranking are the
+same functions app.py uses.
+"""
+import json
+import math
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+
+import app as nearby_api
+from app import (InvalidRequest, batch_payload, batch_request, category_layer, nearby_payload, nearby_request,
+                 parse_osm_element, wants_stream)
+from compression import init_compression_async
+from log import fields, get_logger
+import metrics
+from metrics import StageTimer
+from osm_stream import ElementParser
+from overpass_query import around, build_union_query
+from overpass_tiles import TileCache
+from poi_index import POI_BACKEND
+from scheduler import Overloaded, upstream_scheduler
+import singleflight
+from singleflight import AsyncSingleFlight
+from upstream import UpstreamError
+from upstream_async import async_overpass_client, close_clients
+
+app = cors(Quart(__name__), allow_origin="*")
+init_compression_async(app)
+
+# Named apart from the groups of the imported app, which this process registers too
+overpass_flight = AsyncSingleFlight("overpass_async")
+
+logger = get_logger("nearby_asgi")
+
+
+@app.after_serving
+async def shutdown():
+    await close_clients()
+
+
+@app.route("/")
+async def home():
+    return jsonify({
+        "message": "Nearby Places API is running!",
+        "status": "success",
+        "endpoints": {
+            "/": "Homepage",
+            "/api/health": "Health check",
+            "/api/nearby": "Get nearby places (POST), nearest first, optional limit/offset",
+            "/api/nearby/batch": "Nearby places for many points or a route corridor (POST), one upstream query"
+        }
+    })
+
+
+@app.route("/api/health", methods=["GET"])
+async def health_check():
+    return jsonify({
+        "status": "healthy",
+        "message": "Server is running correctly!",
+        "service": "Nearby Places API",
+        "upstream": async_overpass_client.snapshot(),
+        "scheduler": upstream_scheduler.snapshot(),
+        "singleFlight": singleflight.snapshot()
+    })
+
+
+@app.route("/api/nearby", methods=["POST", "GET"])
+async def nearby_places():
+    try:
+        data = (await request.get_json() or {}) if request.method == "POST" else request.args
+        lat, lon, radius, category, limit, offset = nearby_request(data, request.method)
+        layer, selectors = category_layer(category)
+
+        if wants_stream(data, request.headers):
+            return Response(stream_nearby(selectors, lat, lon, radius), mimetype="application/x-ndjson")
+
+        timer = StageTimer("nearby")
+        try:
+            elements = (await poi_source.query_async({layer: selectors}, lat, lon, radius))[layer]
+        except RuntimeError:
+            elements = []  # every mirror failed, same empty answer as the threaded service
+        except Overloaded as e:
+            return overloaded_response(e)
+        timer.mark("overpass")
+
+        response = jsonify(nearby_payload(elements, lat, lon, radius, category, limit, offset, timer))
+        timer.mark("serialize")
+        return response
+
+    except InvalidRequest as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error fetching nearby places")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/nearby/batch", methods=["POST"])
+async def nearby_batch():
+    try:
+        points, nearest_only, category, limit = batch_request(await request.get_json() or {})
+
+        timer = StageTimer("nearby_batch")
+        layer, selectors = category_layer(category)
+        try:
+            elements = (await poi_source.query_many_async({layer: selectors}, points))[layer]
+        except RuntimeError:
+            elements = []
+        except Overloaded as e:
+            return overloaded_response(e)
+        timer.mark("overpass")
+
+        response = jsonify(batch_payload(elements, points, nearest_only, category, limit, timer))
+        timer.mark("serialize")
+        return response
+
+    except InvalidRequest as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error fetching nearby places in batch")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def overloaded_response(error):
+    response = jsonify({"status": "error", "message": "Upstream services are busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
+async def stream_nearby(selectors, lat, lon, radius):
+    """Async twin of app.stream_nearby"""
+    count = 0
+    try:
+        if POI_BACKEND == "offline":
+            elements = iter_async((await poi_source.query_async({"stream": selectors}, lat, lon, radius))["stream"])
+        else:
+            elements = stream_overpass_elements(build_union_query(selectors, around(radius, lat, lon)))
+        async for element in elements:
+            place = parse_osm_element(element, lat, lon)
+            if place:
+                count += 1
+                yield (json.dumps(place) + "\n").encode()
+    except Exception as e:
+        logger.warning("Error streaming nearby places", extra=fields(error=str(e)))
+    logger.info("Streamed nearby places", extra=fields(count=count))
+
+
+async def iter_async(items):
+    for item in items:
+        yield item
+
+
+async def stream_overpass_elements(query):
+    """Yield elements while the Overpass response is still arriving"""
+    try:
+        res = await async_overpass_client.post(query, stream=True)
+    except UpstreamError as e:
+        logger.warning("Streaming Overpass request failed", extra=fields(error=str(e)))
+        return
+
+    parser = ElementParser()
+    try:
+        async for chunk in res.aiter_bytes():
+            for element in parser.feed(chunk):
+                yield element
+            if parser.done:
+                return
+        for element in parser.close():
+            yield element
+    finally:
+        await res.aclose()
+
+
+async def fetch_overpass_elements(query):
+    """Async twin of app.fetch_overpass_elements, for the tile cache"""
+    return await overpass_flight.do(query, post_overpass_query, query)
+
+
+async def post_overpass_query(query):
+    try:
+        res = await async_overpass_client.post(query)
+    except UpstreamError as e:
+        raise RuntimeError(str(e))
+    return res.json().get("elements", [])
+
+
+overpass_tiles = TileCache(nearby_api.fetch_overpass_elements, afetch=fetch_overpass_elements)
+
+poi_source = nearby_api.poi_source if POI_BACKEND == "offline" else overpass_tiles
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ["0.0.0.0:6000"]
+    print("🚀 Nearby Places API (ASGI) running on http://localhost:6000")
+    asyncio.run(serve(app, config))
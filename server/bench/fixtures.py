@@ -0,0 +1,170 @@
+"""Recorded and synthetic Nominatim/Overpass responses for the benchmarks.
+
+    python bench/fixtures.py generate              # synthetic town/city/metro, deterministic
+    python bench/fixtures.py record metro "New York"   # record a real response (hits the public APIs)
+    python bench/fixtures.py places                # synthetic GeoNames dump for gazetteer.py
+
+Fixtures are written to bench/fixtures/<name>.json and are not committed.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# name -> (city, lat, lon, element count, spread in degrees)
+SIZES = {
+    "town": ("Heidelberg", 49.4093, 8.6937, 300, 0.05),
+    "city": ("Paris", 48.8566, 2.3522, 5000, 0.2),
+    "metro": ("New York", 40.7128, -74.0060, 40000, 0.3),
+}
+
+# Tag values the two services actually query, so every code path gets exercised
+TAG_CHOICES = [
+    ("tourism", ["attraction", "museum", "viewpoint", "gallery", "hotel", "hostel", "zoo"]),
+    ("amenity", ["restaurant", "cafe", "fast_food", "place_of_worship", "theatre", "atm", "bank",
+                 "pharmacy", "hospital", "fuel", "marketplace"]),
+    ("historic", ["monument", "castle", "memorial", "archaeological_site"]),
+    ("shop", ["bakery", "clothes", "supermarket", "books"]),
+    ("leisure", ["park", "garden"]),
+    ("natural", ["beach"]),
+]
+EXTRA_TAGS = [("wikidata", "Q{}"), ("addr:street", "Street {}"), ("addr:city", "City"),
+              ("opening_hours", "Mo-Fr 09:00-18:00; Sa 10:00-16:00"), ("website", "https://example.org/{}")]
+
+
+def generate(name, seed=42):
+    """Deterministic Overpass-shaped response, including node/way duplicates for dedup"""
+    city, lat, lon, count, spread = SIZES[name]
+    rng = random.Random(seed)
+    elements = []
+    for i in range(count):
+        key, values = rng.choice(TAG_CHOICES)
+        tags = {"name": f"{city} {values[0].title()} {i}", key: rng.choice(values)}
+        for extra_key, template in EXTRA_TAGS:
+            if rng.random() < 0.3:
+                tags[extra_key] = template.format(i)
+        el_lat = lat + rng.gauss(0, spread / 2)
+        el_lon = lon + rng.gauss(0, spread / 2)
+        if rng.random() < 0.8:
+            elements.append({"type": "node", "id": i, "lat": el_lat, "lon": el_lon, "tags": tags})
+        else:
+            elements.append({"type": "way", "id": i, "center": {"lat": el_lat, "lon": el_lon}, "tags": tags})
+        # ~5% come back twice: once as a node, once as a slightly offset, upper-cased way
+        if rng.random() < 0.05:
+            dup_tags = dict(tags, name=tags["name"].upper())
+            elements.append({"type": "way", "id": count + i,
+                             "center": {"lat": el_lat + 0.0003, "lon": el_lon - 0.0003}, "tags": dup_tags})
+    return {
+        "version": 0.6,
+        "generator": "bench/fixtures.py",
+        "nominatim": [{"lat": str(lat), "lon": str(lon), "display_name": city}],
+        "city": city,
+        "elements": elements,
+    }
+
+
+SYLLABLES = ["ber", "lin", "mar", "sa", "to", "ka", "ven", "dor", "ri", "po", "la", "nes", "gra", "ham",
+             "wick", "ton", "ville", "burg", "san", "el", "mo", "ra", "sch", "ö", "é", "ah"]
+COUNTRIES = ["DE", "FR", "US", "GB", "IT", "ES", "BR", "JP", "IN", "NG"]
+
+
+def generate_places(count=50000, seed=42):
+    """GeoNames-format rows: the fixture cities plus `count` made-up ones with a long-tailed population"""
+    rng = random.Random(seed)
+    rows = []
+    for i, (city, lat, lon, _, _) in enumerate(SIZES.values()):
+        rows.append((i + 1, city, lat, lon, "XX", 1000000))
+    for i in range(count):
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        if rng.random() < 0.1:
+            name = rng.choice(["San ", "New ", "Bad ", "Saint-"]) + name
+        population = int(1000 * rng.paretovariate(1.2))
+        rows.append((len(rows) + 1, name, rng.uniform(-60, 70), rng.uniform(-180, 180),
+                     rng.choice(COUNTRIES), population))
+    return ["\t".join([str(gid), name, name, "", f"{lat:.5f}", f"{lon:.5f}", "P", "PPL", country,
+                       "", "", "", "", "", str(population), "", "", "", ""])
+            for gid, name, lat, lon, country, population in rows]
+
+
+def places_path():
+    return os.path.join(FIXTURE_DIR, "places.txt")
+
+
+def load_places():
+    """Path of the synthetic GeoNames dump, generating it on first use"""
+    if not os.path.exists(places_path()):
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        with open(places_path(), "w", encoding="utf-8") as f:
+            f.write("\n".join(generate_places()) + "\n")
+    return places_path()
+
+
+def record(name, city, radius=25000):
+    """Record one real Nominatim + Overpass answer covering every trip interest"""
+    import requests
+    from ai_trip_backend import INTEREST_QUERIES
+    from overpass_query import around, build_union_query
+
+    headers = {"User-Agent": "TripPlannerApp-bench"}
+    geo = requests.get("https://nominatim.openstreetmap.org/search",
+                       params={"city": city, "format": "json", "limit": 1}, headers=headers, timeout=30).json()
+    lat, lon = float(geo[0]["lat"]), float(geo[0]["lon"])
+    selectors = []
+    for interest_selectors in INTEREST_QUERIES.values():
+        selectors.extend(s for s in interest_selectors if s not in selectors)
+    query = build_union_query(selectors, around(radius, lat, lon), timeout=180)
+    data = requests.post("https://overpass-api.de/api/interpreter", data=query, headers=headers, timeout=200).json()
+    data["nominatim"] = geo
+    data["city"] = city
+    return data
+
+
+def path_for(name):
+    return os.path.join(FIXTURE_DIR, f"{name}.json")
+
+
+def save(name, data):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with open(path_for(name), "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def load(name):
+    """Load a fixture, generating the synthetic one on first use"""
+    if not os.path.exists(path_for(name)):
+        save(name, generate(name))
+    with open(path_for(name)) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fixtures")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate")
+    gen.add_argument("names", nargs="*", default=list(SIZES))
+    rec = sub.add_parser("record")
+    rec.add_argument("name")
+    rec.add_argument("city")
+    sub.add_parser("places")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        for name in args.names:
+            data = generate(name)
+            save(name, data)
+            print(f"{name}: {len(data['elements'])} elements -> {path_for(name)}")
+    elif args.command == "places":
+        print(f"places: {load_places()}")
+    else:
+        data = record(args.name, args.city)
+        save(args.name, data)
+        print(f"{args.name}: {len(data['elements'])} elements recorded -> {path_for(args.name)}")
+
+
+if __name__ == "__main__":
+    main()
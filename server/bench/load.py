@@ -0,0 +1,115 @@
+"""Load scenarios for /api/nearby and /api/ai/generate-trip; reports throughput and latency percentiles.
+
+    python bench/load.py nearby --base http://localhost:6000 --fixture city -c 32 -n 2000
+    python bench/load.py trip --base http://localhost:8000 --fixture city -c 8 -n 200
+
+Point the services at bench/standin.py first so runs are reproducible.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import SIZES  # noqa: E402
+
+CATEGORIES = [None, "restaurant", "hotel", "medical", "atm", "fuel"]
+INTERESTS = ["sightseeing", "culture", "food", "shopping", "relaxation"]
+
+_local = threading.local()
+
+
+def session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def nearby_request(base, fixture, rng):
+    _, lat, lon, _, spread = SIZES[fixture]
+    body = {"lat": lat + rng.uniform(-spread, spread) / 4, "lon": lon + rng.uniform(-spread, spread) / 4,
+            "radius": rng.choice([500, 1000, 2000, 5000]), "limit": 50}
+    category = rng.choice(CATEGORIES)
+    if category:
+        body["category"] = category
+    return session().post(f"{base}/api/nearby", json=body, timeout=60)
+
+
+def trip_request(base, fixture, rng):
+    city = SIZES[fixture][0]
+    body = {"destination": city, "startDate": "2026-06-01",
+            "endDate": f"2026-06-0{rng.randint(1, 7)}",
+            "interests": rng.sample(INTERESTS, rng.randint(1, 3)),
+            "travelStyle": rng.choice(["balanced", "relaxed", "packed"])}
+    return session().post(f"{base}/api/ai/generate-trip", json=body, timeout=120)
+
+
+SCENARIOS = {"nearby": nearby_request, "trip": trip_request}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(scenario, base, fixture, concurrency, total, seed=1):
+    fn = SCENARIOS[scenario]
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        rng = random.Random(seed * 100003 + i)
+        start = time.perf_counter()
+        try:
+            ok = fn(base, fixture, rng).status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the trip services")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--base", required=True)
+    parser.add_argument("--fixture", default="city", choices=sorted(SIZES))
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    result = run(args.scenario, args.base.rstrip("/"), args.fixture, args.concurrency, args.requests)
+    for key, value in result.items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
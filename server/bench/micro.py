@@ -0,0 +1,84 @@
+"""Micro-benchmarks for the in-process stages, no network involved.
+
+    python bench/micro.py --fixture metro
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import SIZES, load, load_places  # noqa: E402
+
+import ai_trip_backend  # noqa: E402
+import app  # noqa: E402
+from dedup import dedupe_places  # noqa: E402
+import gazetteer  # noqa: E402
+from opening_hours import compile_hours  # noqa: E402
+from planner import plan_days  # noqa: E402
+from ranking import top_places  # noqa: E402
+from timetable import plan_visits  # noqa: E402
+
+
+def bench(label, fn, items, repeat=5):
+    """Best-of-N wall time for fn(); reports total and per-item cost"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    per_item = best / max(items, 1) * 1e6
+    print(f"{label:<28} {best * 1000:9.2f} ms  {per_item:8.2f} us/item  ({items} items)")
+    return result
+
+
+def schedule_day(day, day_places, start_date):
+    """One day's timetable and JSON entries: schedule_pending's per-day work, kept here to time it alone"""
+    date = ai_trip_backend.trip_date(start_date, day)
+    return ai_trip_backend.format_day(day, date, plan_visits(day_places, date))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark parsing, dedup and scheduling")
+    parser.add_argument("--fixture", default="city", choices=sorted(SIZES))
+    parser.add_argument("--days", type=int, default=5)
+    args = parser.parse_args()
+
+    data = load(args.fixture)
+    elements = data["elements"]
+    _, lat, lon, _, _ = SIZES[args.fixture]
+    print(f"fixture={args.fixture} elements={len(elements)}")
+
+    bench("parse_osm_element", lambda: [app.parse_osm_element(e, lat, lon) for e in elements], len(elements))
+    bench("rank_nearby (top 50)", lambda: app.rank_nearby(elements, lat, lon, 25000, 50), len(elements))
+    places = bench("enhance_osm_place_data",
+                   lambda: [p for p in map(ai_trip_backend.enhance_osm_place_data, elements) if p], len(elements))
+    unique = bench("dedupe_places", lambda: dedupe_places(places), len(places))
+
+    bench("parse_place (memoized)", lambda: [ai_trip_backend.parse_place(e) for e in elements], len(elements))
+
+    per_day = min(8, len(unique) // args.days + 2)
+    selected = bench("top_places", lambda: top_places(unique, args.days * per_day), len(unique))
+    day_plans = bench("plan_days", lambda: plan_days(selected, args.days, per_day, (lat, lon)), len(selected))
+    bench("schedule_day (all days)",
+          lambda: [schedule_day(d, ps, "2026-06-01") for d, ps in enumerate(day_plans, 1)],
+          len(selected))
+
+    hours = [e["tags"]["opening_hours"] for e in elements if "opening_hours" in e["tags"]]
+    bench("compile_hours (cached)", lambda: [compile_hours(h) for h in hours], len(hours))
+    bench("compile_hours (uncached)", lambda: [compile_hours.__wrapped__(h) for h in hours[:200]], min(len(hours), 200))
+
+    source = load_places()
+    index_path = os.path.join(os.path.dirname(source), "gazetteer.bin")
+    bench("gazetteer build", lambda: gazetteer.build(gazetteer.iter_geonames(source), index_path), 1, repeat=1)
+    index = gazetteer.Gazetteer(index_path)
+    prefixes = ["s", "sa", "san", "new y", "heidel", "zzz"] * 100
+    bench("gazetteer suggest", lambda: [index.suggest(q) for q in prefixes], len(prefixes))
+    cities = ["Paris", "heidelberg", "Nowhere Town"] * 200
+    bench("gazetteer resolve", lambda: [index.resolve(c) for c in cities], len(cities))
+
+
+if __name__ == "__main__":
+    main()
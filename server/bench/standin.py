@@ -0,0 +1,133 @@
+"""Local stand-in for Nominatim and Overpass that replays a fixture.
+
+    python bench/standin.py --fixture metro --port 9100 --latency-ms 300 --jitter-ms 200 --fail-rate 0.05
+
+Then start the services against it:
+
+    OVERPASS_SERVERS=http://localhost:9100/api/interpreter \\
+    NOMINATIM_URL=http://localhost:9100/search python ai_trip_backend.py
+
+The stand-in gets the default per-host rate limit; measure raw throughput instead with
+UPSTREAM_LIMITS=localhost:9100=1000:1000:64
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote_plus, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import load  # noqa: E402
+from geo import bounding_box, element_coords  # noqa: E402
+
+BBOX_RE = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+AROUND_RE = re.compile(r"\(around:([\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+
+
+class Replay:
+    def __init__(self, fixture, latency_ms, jitter_ms, fail_rate):
+        data = load(fixture)
+        self.nominatim = json.dumps(data.get("nominatim", [])).encode()
+        self.elements = data["elements"]
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def delay(self):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def overpass_body(self, query):
+        """Elements inside the query's bboxes (or around: circles' boxes), serialized once per area"""
+        boxes = tuple(sorted({tuple(float(v) for v in match) for match in BBOX_RE.findall(query)}))
+        if not boxes:
+            boxes = tuple(sorted({bounding_box(float(lat), float(lon), float(radius))
+                                  for radius, lat, lon in AROUND_RE.findall(query)}))
+        with self._lock:
+            body = self._bodies.get(boxes)
+        if body is None:
+            elements = self.elements
+            if boxes:
+                elements = [e for e in elements
+                            if any(south <= element_coords(e)[0] <= north and west <= element_coords(e)[1] <= east
+                                   for south, west, north, east in boxes)]
+            body = json.dumps({"version": 0.6, "elements": elements}).encode()
+            with self._lock:
+                self._bodies[boxes] = body
+        return body
+
+
+def make_handler(replay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def maybe_fail(self):
+            replay.requests += 1
+            replay.delay()
+            if random.random() < replay.fail_rate:
+                self.send_body(random.choice([429, 503, 504]), b'{"error":"injected failure"}')
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/search":
+                return self.send_body(404, b"{}")
+            if self.maybe_fail():
+                return
+            city = parse_qs(url.query).get("city", [""])[0]
+            # Cities starting with "zz" simulate a typo that Nominatim can't resolve
+            self.send_body(200, b"[]" if city.lower().startswith("zz") else replay.nominatim)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            query = self.rfile.read(length).decode()
+            if query.startswith("data="):
+                query = unquote_plus(query[5:])
+            if urlparse(self.path).path != "/api/interpreter":
+                return self.send_body(404, b"{}")
+            if self.maybe_fail():
+                return
+            self.send_body(200, replay.overpass_body(query))
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Nominatim/Overpass fixtures locally")
+    parser.add_argument("--fixture", default="city")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    replay = Replay(args.fixture, args.latency_ms, args.jitter_ms, args.fail_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(replay))
+    print(f"Stand-in serving {args.fixture} ({len(replay.elements)} elements) on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+MIN_SIZE = 1024
+COMPRESSIBLE = ("application/json", "text/plain", "text/html")
+
+
+def pick_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _skip(response):
+    return (response.status_code < 200 or response.status_code >= 300
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE)
+
+
+def _compress(response, body, accept_encoding):
+    encoding = pick_encoding(accept_encoding)
+    response.vary.add("Accept-Encoding")
+    if encoding is None or len(body) < MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    else:
+        body = gzip.compress(body, compresslevel=6)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the identity ones, so the validator can only be weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Compress JSON responses with brotli or gzip when the client asks for it"""
+
+    @app.after_request
+    def compress_response(response):
+        if response.is_streamed or response.direct_passthrough or _skip(response):
+            return response
+        return _compress(response, response.get_data(), request.headers.get("Accept-Encoding", ""))
+
+    return app
+
+
+def init_compression_async(app):
+    """init_compression for the Quart (ASGI) apps, where the body is read with await"""
+    from quart import request as quart_request
+    from quart.wrappers.response import DataBody
+
+    @app.after_request
+    async def compress_response(response):
+        if not isinstance(response.response, DataBody) or _skip(response):
+            return response
+        body = await response.get_data()
+        return _compress(response, body, quart_request.headers.get("Accept-Encoding", ""))
+
+    return app
@@ -0,0 +1,65 @@
+import math
+import re
+import unicodedata
+
+from geo import METERS_PER_DEGREE, haversine_km
+
+DEDUP_RADIUS_M = 150   # a node and its way's center rarely sit further apart than this
+
+
+def normalize_name(name):
+    """'Musée du Louvre' and 'MUSEE DU LOUVRE ' normalize to the same key"""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _find_match(unique, buckets, place, name, cx, cy, radius_km):
+    """Index of an already kept place with this name in the 3x3 neighbourhood, or None"""
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for idx in buckets.get((cx + dx, cy + dy, name), ()):
+                kept = unique[idx]
+                if haversine_km(place["lat"], place["lon"], kept["lat"], kept["lon"]) <= radius_km:
+                    return idx
+    return None
+
+
+def dedupe_places(places, radius_m=DEDUP_RADIUS_M):
+    """Merge places with the same normalized name within radius_m, in linear time.
+
+    Places are bucketed into a grid of radius_m-sized cells keyed by
+    (cell, normalized name), so each place only checks the 3x3 neighbouring
+    cells for its own name. The copy with the richer tag set wins and keeps
+    the position of the first occurrence.
+    """
+    return dedupe_slots(places, radius_m)[0]
+
+
+def dedupe_slots(places, radius_m=DEDUP_RADIUS_M):
+    """dedupe_places, plus for every input place the index of the unique place it was merged into"""
+    if not places:
+        return [], []
+
+    cell_lat = radius_m / METERS_PER_DEGREE
+    cell_lon = cell_lat / max(math.cos(math.radians(places[0]["lat"])), 0.01)
+    radius_km = radius_m / 1000
+
+    unique = []
+    slots = []
+    buckets = {}
+    for place in places:
+        name = normalize_name(place["name"])
+        cx, cy = int(place["lat"] // cell_lat), int(place["lon"] // cell_lon)
+
+        match = _find_match(unique, buckets, place, name, cx, cy, radius_km)
+        if match is None:
+            buckets.setdefault((cx, cy, name), []).append(len(unique))
+            slots.append(len(unique))
+            unique.append(place)
+        else:
+            slots.append(match)
+            if len(place.get("tags", {})) > len(unique[match].get("tags", {})):
+                unique[match] = place
+    return unique, slots
@@ -0,0 +1,277 @@
+"""Offline gazetteer: a prefix index of place names for destination autocomplete and local geocoding.
+
+    python gazetteer.py build cities15000.txt                     # GeoNames dump
+    python gazetteer.py build places.json --alternate-names       # Overpass JSON of place=* elements
+
+The index is a single file of fixed-size rows sorted by normalized name and
+read through mmap, so every worker process shares the same pages and nothing
+is parsed at startup. All names starting with a prefix are one contiguous run
+of rows found by binary search. Prefixes too common to scan on every
+keystroke have their best places precomputed at build time.
+"""
+import argparse
+import mmap
+import os
+import re
+import struct
+
+from dedup import normalize_name
+from geo import element_coords
+from log import fields, get_logger
+from osm_stream import iter_elements, iter_file_chunks
+
+logger = get_logger("gazetteer")
+
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.bin")
+)
+
+MAGIC = b"GAZ1"
+HEADER = struct.Struct("<4sIIII")   # magic, rows, hot prefixes, places per hot prefix, hot threshold
+# key offset/length, name offset/length, country code, lat/lon in microdegrees, population, place id
+ROW = struct.Struct("<IHIH2siiIQ")
+HOT = struct.Struct("<IH")          # prefix offset/length, followed by MAX_SUGGESTIONS row numbers
+ROW_NUMBER = struct.Struct("<I")
+NO_ROW = 0xFFFFFFFF
+
+MAX_SUGGESTIONS = 20
+# Prefixes matching more rows than this are answered from the precomputed table instead of a scan
+HOT_THRESHOLD = 256
+
+OSM_PLACES = ("city", "town", "village", "municipality")
+OSM_TYPES = ("node", "way", "relation")
+
+
+def _population(value):
+    digits = re.sub(r"\D", "", str(value or "").split(";")[0].split(".")[0])
+    return min(int(digits), NO_ROW) if digits else 0
+
+
+def iter_geonames(path, alternate_names=False):
+    """(place id, name, country, lat, lon, population, names) from a GeoNames cities*.txt / allCountries.txt dump"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or cols[6] != "P":
+                continue
+            names = [cols[1], cols[2]]
+            if alternate_names and cols[3]:
+                names.extend(cols[3].split(","))
+            yield int(cols[0]), cols[1], cols[8], float(cols[4]), float(cols[5]), _population(cols[14]), names
+
+
+def iter_osm_places(path, alternate_names=False):
+    """The same tuples from an Overpass JSON dump of place=city/town/village elements"""
+    with open(path, "rb") as f:
+        for element in iter_elements(iter_file_chunks(f)):
+            tags = element.get("tags") or {}
+            lat, lon = element_coords(element)
+            if tags.get("place") not in OSM_PLACES or not tags.get("name") or lat is None:
+                continue
+            names = [tags["name"]]
+            if alternate_names:
+                names.extend(v for k, v in tags.items() if k.startswith("name:") or k in ("alt_name", "int_name"))
+            country = tags.get("is_in:country_code", tags.get("ISO3166-1", ""))[:2].upper()
+            # OSM ids are only unique per element type
+            place_id = element["id"] * len(OSM_TYPES) + OSM_TYPES.index(element.get("type", "node"))
+            yield place_id, tags["name"], country, lat, lon, _population(tags.get("population")), names
+
+
+def _best_rows(candidates, limit):
+    """Row numbers of the `limit` most populous distinct places among (row, population, key length, place id)"""
+    best = []
+    seen = set()
+    # Ties go to the shorter name, i.e. the closer match for the typed prefix
+    for row, _, _, place_id in sorted(candidates, key=lambda c: (-c[1], c[2], c[0])):
+        if place_id not in seen:
+            seen.add(place_id)
+            best.append(row)
+            if len(best) == limit:
+                break
+    return best
+
+
+def _hot_prefixes(keys, candidates):
+    """(prefix, best rows) for every prefix matching more than HOT_THRESHOLD rows"""
+    hot = []
+    length = 1
+    while True:
+        found = False
+        start = 0
+        while start < len(keys):
+            if len(keys[start]) < length:
+                start += 1
+                continue
+            prefix = keys[start][:length]
+            end = start + 1
+            while end < len(keys) and keys[end].startswith(prefix):
+                end += 1
+            if end - start > HOT_THRESHOLD:
+                found = True
+                hot.append((prefix, _best_rows(candidates[start:end], MAX_SUGGESTIONS)))
+            start = end
+        if not found:
+            return sorted(hot)
+        length += 1
+
+
+def build(places, path=GAZETTEER_PATH):
+    """Write the index for an iterable of place tuples; returns (places, rows)"""
+    blob = bytearray()
+    interned = {}
+
+    def intern(data):
+        offset = interned.get(data)
+        if offset is None:
+            offset = interned[data] = len(blob)
+            blob.extend(data)
+        return offset, len(data)
+
+    rows = []
+    count = 0
+    for place_id, name, country, lat, lon, population, names in places:
+        count += 1
+        name_ref = intern(name.encode()[:0xFFFF])
+        for key in {normalize_name(n).encode()[:0xFFFF] for n in names} - {b""}:
+            rows.append((key, name_ref, country.encode()[:2], round(lat * 1e6), round(lon * 1e6), population, place_id))
+    # Within one name the most populous place comes first, which is what resolve() picks
+    rows.sort(key=lambda r: (r[0], -r[5], r[6]))
+
+    keys = [r[0] for r in rows]
+    hot = _hot_prefixes(keys, [(i, r[5], len(r[0]), r[6]) for i, r in enumerate(rows)])
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(hot), MAX_SUGGESTIONS, HOT_THRESHOLD))
+        for key, (name_off, name_len), country, lat, lon, population, place_id in rows:
+            key_off, key_len = intern(key)
+            f.write(ROW.pack(key_off, key_len, name_off, name_len, country, lat, lon, population, place_id))
+        for prefix, best in hot:
+            f.write(HOT.pack(*intern(prefix)))
+            f.write(b"".join(ROW_NUMBER.pack(i) for i in best + [NO_ROW] * (MAX_SUGGESTIONS - len(best))))
+        f.write(blob)
+    # Readers keep mapping the old file until they reopen it
+    os.replace(path + ".tmp", path)
+    return count, len(rows)
+
+
+class Gazetteer:
+    """Read side of the index: prefix suggestions and exact-name lookups straight from the mapped file"""
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self.rows = 0
+        if not os.path.exists(path):
+            logger.info("No gazetteer, destinations are geocoded by Nominatim", extra=fields(path=path))
+            return
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, self.hot_count, self.hot_k, self.hot_threshold = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index (run gazetteer.py build)")
+        self._hot_size = HOT.size + ROW_NUMBER.size * self.hot_k
+        self._hot_at = HEADER.size + ROW.size * self.rows
+        self._blob_at = self._hot_at + self._hot_size * self.hot_count
+
+    @property
+    def available(self):
+        return self.rows > 0
+
+    def _text(self, offset, length):
+        start = self._blob_at + offset
+        return self._mm[start:start + length]
+
+    def _key(self, row):
+        return self._text(*struct.unpack_from("<IH", self._mm, HEADER.size + ROW.size * row))
+
+    def _lower_bound(self, key):
+        """First row whose name is >= key"""
+        lo, hi = 0, self.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _hot_rows(self, prefix):
+        lo, hi = 0, self.hot_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = self._hot_at + self._hot_size * mid
+            key = self._text(*HOT.unpack_from(self._mm, at))
+            if key < prefix:
+                lo = mid + 1
+            elif key > prefix:
+                hi = mid
+            else:
+                rows = struct.unpack_from(f"<{self.hot_k}I", self._mm, at + HOT.size)
+                return [row for row in rows if row != NO_ROW]
+        return []
+
+    def _row(self, row):
+        return ROW.unpack_from(self._mm, HEADER.size + ROW.size * row)
+
+    def _place(self, row):
+        _, _, name_off, name_len, country, lat, lon, population, _ = self._row(row)
+        return {
+            "name": self._text(name_off, name_len).decode(),
+            "country": country.rstrip(b"\0").decode(),
+            "lat": lat / 1e6,
+            "lon": lon / 1e6,
+            "population": population
+        }
+
+    def suggest(self, query, limit=10):
+        """The most populous places with a name starting with `query`"""
+        prefix = normalize_name(query).encode()
+        if not prefix or not self.rows:
+            return []
+        # UTF-8 never contains 0xFF, so every name with this prefix sorts below prefix + 0xFF
+        lo, hi = self._lower_bound(prefix), self._lower_bound(prefix + b"\xff")
+        if hi - lo > self.hot_threshold:
+            rows = self._hot_rows(prefix)[:limit]
+        else:
+            candidates = []
+            for row in range(lo, hi):
+                key_off, key_len, _, _, _, _, _, population, place_id = self._row(row)
+                candidates.append((row, population, key_len, place_id))
+            rows = _best_rows(candidates, limit)
+        return [self._place(row) for row in rows]
+
+    def resolve(self, city):
+        """(lat, lon) of the most populous place named exactly `city`, or None"""
+        key = normalize_name(city or "").encode()
+        if not key or not self.rows:
+            return None
+        row = self._lower_bound(key)
+        if row == self.rows or self._key(row) != key:
+            return None
+        lat, lon = self._row(row)[5:7]
+        return lat / 1e6, lon / 1e6
+
+    def snapshot(self):
+        return {"path": self.path, "names": self.rows}
+
+
+gazetteer = Gazetteer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the destination gazetteer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bld = sub.add_parser("build", help="GeoNames .txt dump or Overpass JSON of place=* elements")
+    bld.add_argument("source")
+    bld.add_argument("--out", default=GAZETTEER_PATH)
+    bld.add_argument("--alternate-names", action="store_true", help="index translated and alternate names too")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        reader = iter_osm_places if args.source.endswith(".json") else iter_geonames
+        places, rows = build(reader(args.source, args.alternate_names), args.out)
+        print(f"✅ Indexed {places} places under {rows} names into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
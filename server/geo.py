@@ -0,0 +1,107 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional, pure-Python fallback below
+    np = None
+
+EARTH_RADIUS_KM = 6371
+METERS_PER_DEGREE = 111320
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates in kilometers"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def element_coords(element):
+    """Coordinates of an Overpass element - nodes carry lat/lon, ways a center"""
+    if "lat" in element and "lon" in element:
+        return element["lat"], element["lon"]
+    if "center" in element:
+        return element["center"]["lat"], element["center"]["lon"]
+    return None, None
+
+
+def bounding_box(lat, lon, radius_m):
+    """(south, west, north, east) box that contains a circle of radius_m meters"""
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return (max(lat - dlat, -85.0), max(lon - dlon, -180.0),
+            min(lat + dlat, 85.0), min(lon + dlon, 180.0))
+
+
+def haversine_km_many(lat, lon, lats, lons):
+    """Distances in km from one point to many, vectorized with NumPy when it is installed"""
+    if np is None:
+        return [haversine_km(lat, lon, lat2, lon2) for lat2, lon2 in zip(lats, lons)]
+    lat1 = math.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _segment_steps(lat1, lon1, lat2, lon2, spacing_m):
+    return max(1, math.ceil(haversine_km(lat1, lon1, lat2, lon2) * 1000 / spacing_m))
+
+
+def densified_count(points, spacing_m):
+    """How many points densify_polyline returns, without building them"""
+    if not points:
+        return 0
+    return 1 + sum(_segment_steps(lat1, lon1, lat2, lon2, spacing_m)
+                   for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]))
+
+
+def densify_polyline(points, spacing_m):
+    """Points along a [(lat, lon), ...] polyline no more than spacing_m apart, vertices included"""
+    if not points:
+        return []
+    result = [tuple(points[0])]
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        steps = _segment_steps(lat1, lon1, lat2, lon2, spacing_m)
+        for i in range(1, steps + 1):
+            t = i / steps
+            result.append((lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t))
+    return result
+
+
+class PointIndex:
+    """Grid hash over query circles: which (lat, lon, radius_m) points cover a location.
+
+    Cells are as large as the biggest radius, so a location only has to be
+    checked against the circles in its 3x3 cell neighbourhood.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        max_radius = max(max(radius for _, _, radius in points), 1)
+        max_lat = max(abs(lat) for lat, _, _ in points)
+        self.cell_lat = max_radius / METERS_PER_DEGREE
+        # Sized for the widest-spaced meridians in the set, so no neighbour cell is ever skipped
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(min(max_lat, 89.0))), 0.01)
+        self.cells = {}
+        for i, (lat, lon, _) in enumerate(points):
+            self.cells.setdefault(self._cell(lat, lon), []).append(i)
+
+    def _cell(self, lat, lon):
+        return int(lat // self.cell_lat), int(lon // self.cell_lon)
+
+    def within(self, lat, lon):
+        """[(point index, km)] for every point whose radius reaches (lat, lon)"""
+        cx, cy = self._cell(lat, lon)
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in self.cells.get((cx + dx, cy + dy), ()):
+                    p_lat, p_lon, radius = self.points[i]
+                    distance = haversine_km(lat, lon, p_lat, p_lon)
+                    if distance * 1000 <= radius:
+                        found.append((i, distance))
+        return found
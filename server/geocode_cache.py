@@ -0,0 +1,116 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from cache import TTLCache
+from log import fields, get_logger
+from metrics import register_collector
+from sqlite_store import thread_connection
+
+logger = get_logger("geocode_cache")
+
+# On-disk store shared by every worker process, survives restarts
+GEOCODE_DB_PATH = os.environ.get(
+    "GEOCODE_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocode_cache.sqlite3")
+)
+
+POSITIVE_TTL = 30 * 24 * 3600   # cities don't move, keep hits for 30 days
+NEGATIVE_TTL = 10 * 60          # unknown names are retried after 10 minutes
+MEMORY_SIZE = 2048
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocode (
+    key TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def normalize_city(city):
+    """Normalize a free-text city name so 'Paris ', 'paris' and 'PARIS,' share a key"""
+    text = unicodedata.normalize("NFKC", city or "").casefold()
+    text = re.sub(r"[^\w\s-]", " ", text)
+    return " ".join(text.split())
+
+
+class GeocodeCache:
+    """In-process LRU in front of a SQLite table of (city -> lat, lon)"""
+
+    def __init__(self, db_path=GEOCODE_DB_PATH, memory_size=MEMORY_SIZE):
+        self.db_path = db_path
+        self.memory = TTLCache(maxsize=memory_size, ttl=POSITIVE_TTL)
+        self._conn = thread_connection(db_path, SCHEMA)
+        self._stats_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get(self, city):
+        """Return (hit, (lat, lon)); a cached negative result is (True, (None, None))"""
+        key = normalize_city(city)
+        hit, coords = self.memory.get(key)
+        if hit:
+            self._count("negative_hits" if coords[0] is None else "memory_hits")
+            return True, coords
+
+        try:
+            row = self._conn().execute(
+                "SELECT lat, lon, expires_at FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Geocode cache read error", extra=fields(error=str(e)))
+            row = None
+
+        now = time.time()
+        if row and row[2] > now:
+            coords = (row[0], row[1])
+            self.memory.set(key, coords, ttl=row[2] - now)
+            self._count("negative_hits" if coords[0] is None else "disk_hits")
+            return True, coords
+
+        self._count("misses")
+        return False, None
+
+    def set(self, city, coords):
+        """Cache a Nominatim answer; (None, None) is stored as a short-lived negative"""
+        key = normalize_city(city)
+        ttl = NEGATIVE_TTL if coords[0] is None else POSITIVE_TTL
+        self.memory.set(key, coords, ttl=ttl)
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, coords[0], coords[1], time.time() + ttl)
+                )
+        except sqlite3.Error as e:
+            logger.warning("Geocode cache write error", extra=fields(error=str(e)))
+        self._count("stores")
+
+    def snapshot(self):
+        """Hit/miss counters plus hit rate, for the health endpoint"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["negative_hits"] + stats["misses"]
+        hits = lookups - stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+geocode_cache = GeocodeCache()
+
+
+@register_collector
+def _geocode_metrics():
+    stats = geocode_cache.snapshot()
+    yield ("geocode_cache_lookups_total", "counter", "Geocode cache lookups by result",
+           [({"result": name}, stats[name]) for name in ("memory_hits", "disk_hits", "negative_hits", "misses")])
@@ -0,0 +1,69 @@
+"""Structured JSON logging that never blocks the request thread on stdout."""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_LEVEL = logging.INFO
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback out of msg, so it still ends up in the "exc" field"""
+
+    def prepare(self, record):
+        # Like the stock prepare(): resolve the message and drop references to frames before queueing
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _start():
+    global _listener
+    # Request threads only enqueue; one background thread does the writes
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger("trip")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_QueueHandler(log_queue))
+    root.propagate = False
+
+
+def get_logger(name):
+    if _listener is None:
+        _start()
+    return logging.getLogger(f"trip.{name}")
+
+
+def fields(**kwargs):
+    """extra= payload: logger.info("msg", extra=fields(city=city))"""
+    return {"fields": kwargs}
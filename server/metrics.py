@@ -0,0 +1,125 @@
+"""In-process Prometheus-style metrics, rendered in the text exposition format by /metrics."""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers in-process stages (sub-ms) up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_metrics = []
+_collectors = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}   # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def register_collector(fn):
+    """fn() -> iterable of (name, type, help, [(labels dict, value), ...]) read at scrape time"""
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Shared by both services
+stage_seconds = Histogram("stage_seconds", "Time spent in each request pipeline stage", ("service", "stage"))
+upstream_seconds = Histogram("upstream_request_seconds", "Latency of successful upstream requests", ("host",))
+upstream_errors = Counter("upstream_errors_total", "Failed upstream requests", ("host",))
+upstream_hedges = Counter("upstream_hedges_total", "Hedged requests sent to a second mirror", ("host",))
+cache_requests = Counter("cache_requests_total", "Cache lookups by result", ("cache", "result"))
+upstream_queue_seconds = Histogram("upstream_queue_seconds", "Time spent waiting for an upstream slot",
+                                   ("host", "priority"))
+upstream_shed = Counter("upstream_shed_total", "Upstream requests rejected with 503 instead of queueing",
+                        ("host", "priority"))
+
+
+class StageTimer:
+    """Times consecutive pipeline stages: call mark(stage) as each one finishes"""
+
+    def __init__(self, service):
+        self.service = service
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        stage_seconds.observe(now - self.last, service=self.service, stage=stage)
+        self.last = now
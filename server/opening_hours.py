@@ -0,0 +1,153 @@
+"""OSM opening_hours, compiled once per distinct string into minute intervals for every (month, weekday).
+
+Covers what most POIs carry: weekday and month selectors with ranges and
+lists, several time spans per rule, overnight spans, open ends, "off",
+"24/7" and later rules overriding earlier ones. Anything else (public
+holidays alone, sunrise/sunset, week numbers, dates, comments, fallback
+rules) compiles to None, which callers treat as "always open" rather
+than guessing.
+"""
+import re
+from functools import lru_cache
+
+DAY_MINUTES = 24 * 60
+
+WEEKDAYS = ("Mo", "Tu", "We", "Th", "Fr", "Sa", "Su")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+HOLIDAYS = ("PH", "SH")
+
+_MONTH_SELECTOR = re.compile(r"^((?:%s)(?:-(?:%s))?(?:,(?:%s)(?:-(?:%s))?)*)(?:\s+|:\s*|$)" % (("|".join(MONTHS),) * 4))
+_DAY_SELECTOR = re.compile(r"^((?:%s)(?:-(?:%s))?(?:,(?:%s)(?:-(?:%s))?)*)(?:\s+|:\s*|$)"
+                           % (("|".join(WEEKDAYS + HOLIDAYS),) * 4))
+_SPAN = re.compile(r"^(\d{1,2}):(\d{2})(?:-(\d{1,2}):(\d{2})|(\+))$")
+# A comma between a time and a selector starts an additional rule: "Mo-Fr 09:00-18:00, Sa 10:00-14:00"
+_ADDITIONAL_RULE = re.compile(r"(?<=\d|\+),\s*(?=(?:%s)\b)" % "|".join(WEEKDAYS + HOLIDAYS + MONTHS))
+
+
+class OpeningHours:
+    """Compiled opening hours: sorted (open, close) minute pairs per (month, weekday), all within one day"""
+
+    __slots__ = ("table",)
+
+    def __init__(self, table):
+        self.table = table
+
+    def intervals(self, date):
+        return self.table[(date.month - 1) * 7 + date.weekday()]
+
+    def is_open(self, date, minute):
+        return any(start <= minute < end for start, end in self.intervals(date))
+
+    def earliest_start(self, date, minute, duration):
+        """First minute >= `minute` a visit of `duration` fits in one opening on `date`, or None"""
+        for start, end in self.intervals(date):
+            begin = max(start, minute)
+            if begin + duration <= end:
+                return begin
+        return None
+
+
+ALWAYS_OPEN = OpeningHours((((0, DAY_MINUTES),),) * (12 * 7))
+
+
+def _expand(selector, names):
+    """'Mo-We,Fr' -> [0, 1, 2, 4]; ranges may wrap around ('Fr-Mo', 'Nov-Feb')"""
+    selected = []
+    for part in selector.split(","):
+        first, _, last = part.partition("-")
+        start = names.index(first)
+        end = names.index(last) if last else start
+        selected.extend((start + i) % len(names) for i in range((end - start) % len(names) + 1))
+    return selected
+
+
+def _spans(text):
+    """'09:00-12:00,14:00-02:00' -> [(540, 720), (840, 1560)], or None if unparseable"""
+    spans = []
+    for part in text.split(","):
+        match = _SPAN.match(part.strip())
+        if not match:
+            return None
+        h1, m1, h2, m2, open_end = match.groups()
+        start = int(h1) * 60 + int(m1)
+        end = DAY_MINUTES if open_end else int(h2) * 60 + int(m2)
+        if end <= start:
+            end += DAY_MINUTES  # past midnight
+        spans.append((start, end))
+    return spans
+
+
+def _parse_rule(rule):
+    """(months, weekdays, spans) for one rule, or None if it uses syntax we don't evaluate"""
+    months = list(range(12))
+    match = _MONTH_SELECTOR.match(rule)
+    if match:
+        months = _expand(match.group(1), MONTHS)
+        rule = rule[match.end():]
+
+    weekdays = list(range(7))
+    match = _DAY_SELECTOR.match(rule)
+    if match:
+        # Holidays can't be known here; a rule only about them is skipped, a mixed one keeps its weekdays
+        parts = [p for p in match.group(1).split(",") if p not in HOLIDAYS]
+        if not parts:
+            return (), (), []
+        if any(h in part for part in parts for h in HOLIDAYS):
+            return None
+        weekdays = _expand(",".join(parts), WEEKDAYS)
+        rule = rule[match.end():]
+
+    rule = rule.strip()
+    if rule in ("off", "closed"):
+        return months, weekdays, []
+    if rule in ("", "open"):
+        return months, weekdays, [(0, DAY_MINUTES)]
+    spans = _spans(rule)
+    if spans is None:
+        return None
+    return months, weekdays, spans
+
+
+@lru_cache(maxsize=8192)
+def compile_hours(text):
+    """OpeningHours for an opening_hours tag value, ALWAYS_OPEN for 24/7, or None if it can't be evaluated"""
+    text = (text or "").strip()
+    if not text or "||" in text or '"' in text:
+        return None
+    if text == "24/7":
+        return ALWAYS_OPEN
+
+    # Days no rule mentions are closed; a later rule replaces earlier ones on the days it selects,
+    # while an additional (comma-separated) rule adds to them
+    table = [[] for _ in range(12 * 7)]
+    for group in filter(None, (part.strip() for part in text.split(";"))):
+        for additional, rule in enumerate(_ADDITIONAL_RULE.split(group)):
+            parsed = _parse_rule(rule.strip())
+            if parsed is None:
+                return None
+            months, weekdays, spans = parsed
+            for month in months:
+                for weekday in weekdays:
+                    if additional:
+                        table[month * 7 + weekday].extend(spans)
+                    else:
+                        table[month * 7 + weekday] = list(spans)
+
+    # Overnight spans continue into the next weekday (of the same month, close enough at month ends)
+    compiled = [[] for _ in table]
+    for i, spans in enumerate(table):
+        for start, end in spans:
+            compiled[i].append((start, min(end, DAY_MINUTES)))
+            if end > DAY_MINUTES:
+                compiled[i - i % 7 + (i % 7 + 1) % 7].append((0, end - DAY_MINUTES))
+    return OpeningHours(tuple(_merge(spans) for spans in compiled))
+
+
+def _merge(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
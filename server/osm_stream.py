@@ -0,0 +1,82 @@
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def iter_file_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class ElementParser:
+    """Push parser for the Overpass elements array: feed() chunks as they arrive, get elements back.
+
+    Only the unparsed tail of the current chunk is buffered, so this works
+    on multi-GB dumps and on a socket that is still receiving the response.
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._in_array = False
+        self.done = False
+
+    def feed(self, chunk, final=False):
+        """Elements completed by this str/bytes chunk; final=True marks the end of input"""
+        if self.done:
+            return []
+        self._buffer += self._utf8.decode(chunk, final=final) if isinstance(chunk, bytes) else chunk
+
+        # Skip the header up to the opening bracket of the elements array
+        if not self._in_array:
+            start = self._buffer.find('"elements"')
+            bracket = self._buffer.find("[", start) if start != -1 else -1
+            if bracket == -1:
+                self.done = final
+                return []
+            self._buffer = self._buffer[bracket + 1:]
+            self._in_array = True
+
+        buffer = self._buffer
+        elements = []
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if final:
+                    raise ValueError("Truncated Overpass response")
+                self._buffer = ""
+                return elements
+            if buffer[pos] == "]":
+                self.done = True
+                self._buffer = ""
+                return elements
+            try:
+                element, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                self._buffer = buffer[pos:]
+                return elements
+            elements.append(element)
+            pos = end
+
+    def close(self):
+        return self.feed(b"", final=True)
+
+
+def iter_elements(chunks):
+    """Yield Overpass elements from an iterable of str/bytes chunks, parsing as they arrive"""
+    parser = ElementParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.close()
@@ -0,0 +1,59 @@
+import re
+from functools import lru_cache
+
+# Matches Overpass tag filters of the form ["key"] or ["key"~"regex"]
+TAG_FILTER_RE = re.compile(r'^\["([^"]+)"(?:~"([^"]*)")?\]$')
+
+
+@lru_cache(maxsize=None)
+def parse_tag_filter(tag_filter):
+    """Turn '["amenity"~"cafe|bar"]' into ("amenity", compiled regex) and '["shop"]' into ("shop", None)"""
+    match = TAG_FILTER_RE.match(tag_filter)
+    if not match:
+        raise ValueError(f"Unsupported Overpass tag filter: {tag_filter}")
+    key, pattern = match.groups()
+    return key, re.compile(pattern) if pattern is not None else None
+
+
+def around(radius, lat, lon):
+    """Overpass spatial filter for a circle around a point"""
+    return f"(around:{radius},{lat},{lon})"
+
+
+def bbox(south, west, north, east):
+    """Overpass spatial filter for a bounding box"""
+    return f"({south},{west},{north},{east})"
+
+
+def build_union_query(selectors, area, timeout=25):
+    """Compile (element_type, tag_filter) selectors into one Overpass union query.
+
+    area is one spatial filter, or a list of them to query several disjoint areas at once.
+    """
+    areas = [area] if isinstance(area, str) else area
+    statements = "\n".join(
+        f"    {element_type}{tag_filter}{area};" for area in areas for element_type, tag_filter in selectors
+    )
+    return f"""
+[out:json][timeout:{timeout}];
+(
+{statements}
+);
+out center;
+"""
+
+
+def element_matches(element, selectors):
+    """Check locally whether an Overpass element would be returned by any of the selectors"""
+    tags = element.get("tags", {})
+    element_type = element.get("type")
+    for selector_type, tag_filter in selectors:
+        if selector_type != element_type:
+            continue
+        key, pattern = parse_tag_filter(tag_filter)
+        value = tags.get(key)
+        if value is None:
+            continue
+        if pattern is None or pattern.search(value):
+            return True
+    return False
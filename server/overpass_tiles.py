@@ -0,0 +1,208 @@
+import math
+import os
+
+from cache import TTLCache
+from geo import bounding_box, element_coords, haversine_km_many
+from metrics import cache_requests
+from overpass_query import around, bbox, build_union_query, element_matches
+
+# Slippy-map zoom used to quantize queries; z14 tiles are ~2.4 km wide at the equator
+TILE_ZOOM = int(os.environ.get("OVERPASS_TILE_ZOOM", 14))
+# Trips search 25 km around a city: ~1,000 z14 tiles per interest, but only ~250 at z13
+TRIP_TILE_ZOOM = int(os.environ.get("OVERPASS_TRIP_TILE_ZOOM", 13))
+TILE_TTL = int(os.environ.get("OVERPASS_TILE_TTL", 6 * 3600))
+# Entries are (layer, tile); each service process has its own cache of this size
+TILE_CACHE_SIZE = int(os.environ.get("OVERPASS_TILE_CACHE_SIZE", 200000))
+# Queries touching more tiles than this go straight to Overpass, so one huge area can't evict everyone's tiles
+MAX_QUERY_TILES = int(os.environ.get("OVERPASS_MAX_QUERY_TILES", 4096))
+
+
+def tile_for(lat, lon, zoom=TILE_ZOOM):
+    """Slippy-map (x, y) tile containing a coordinate"""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom=TILE_ZOOM):
+    """(south, west, north, east) of a slippy-map tile"""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def tiles_for_circle(lat, lon, radius_m, zoom=TILE_ZOOM):
+    """Every tile touching the bounding box of a circle"""
+    south, west, north, east = bounding_box(lat, lon, radius_m)
+    x0, y0 = tile_for(north, west, zoom)
+    x1, y1 = tile_for(south, east, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+class TileCache:
+    """Overpass results stored per (layer, tile) so overlapping queries become local work.
+
+    A layer is a named list of (element_type, tag_filter) selectors, e.g. one
+    interest or one nearby category. Missing tiles for every requested layer
+    are fetched together with a single bbox union query. Areas larger than
+    MAX_QUERY_TILES bypass the cache.
+    """
+
+    def __init__(self, fetch, zoom=TILE_ZOOM, ttl=TILE_TTL, maxsize=TILE_CACHE_SIZE, afetch=None):
+        # fetch(query) -> list of elements, raising on failure so outages aren't cached;
+        # afetch is its coroutine twin, used by the *_async methods
+        self.fetch = fetch
+        self.afetch = afetch
+        self.zoom = zoom
+        self.tiles = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def query(self, layers, lat, lon, radius_m):
+        """Return {layer: [elements within radius_m of (lat, lon)]}"""
+        tiles = tiles_for_circle(lat, lon, radius_m, self.zoom)
+        if len(tiles) > MAX_QUERY_TILES:
+            elements = self.fetch(self._direct_query(layers, [(lat, lon, radius_m)]))
+            return self._within(layers, self._split(layers, elements), lat, lon, radius_m)
+        return self._within(layers, self._candidates(layers, tiles, self._tiles(layers, tiles)), lat, lon, radius_m)
+
+    async def query_async(self, layers, lat, lon, radius_m):
+        tiles = tiles_for_circle(lat, lon, radius_m, self.zoom)
+        if len(tiles) > MAX_QUERY_TILES:
+            elements = await self.afetch(self._direct_query(layers, [(lat, lon, radius_m)]))
+            return self._within(layers, self._split(layers, elements), lat, lon, radius_m)
+        return self._within(layers, self._candidates(layers, tiles, await self._tiles_async(layers, tiles)),
+                            lat, lon, radius_m)
+
+    def query_many(self, layers, points):
+        """Return {layer: [candidate elements]} covering every (lat, lon, radius_m) circle, each element once.
+
+        Candidates come from the tiles the circles touch; callers assign them to points by distance.
+        """
+        tiles = self._tiles_for_points(points)
+        if len(tiles) > MAX_QUERY_TILES:
+            return self._split(layers, self.fetch(self._direct_query(layers, points)))
+        return self._candidates(layers, tiles, self._tiles(layers, tiles))
+
+    async def query_many_async(self, layers, points):
+        tiles = self._tiles_for_points(points)
+        if len(tiles) > MAX_QUERY_TILES:
+            return self._split(layers, await self.afetch(self._direct_query(layers, points)))
+        return self._candidates(layers, tiles, await self._tiles_async(layers, tiles))
+
+    def _tiles_for_points(self, points):
+        return list(dict.fromkeys(tile for lat, lon, radius_m in points
+                                  for tile in tiles_for_circle(lat, lon, radius_m, self.zoom)))
+
+    @staticmethod
+    def _candidates(layers, tiles, cached):
+        return {layer: [element for tile in tiles for element in cached.get((layer, tile), ())] for layer in layers}
+
+    @staticmethod
+    def _split(layers, elements):
+        return {layer: [element for element in elements if element_matches(element, selectors)]
+                for layer, selectors in layers.items()}
+
+    @staticmethod
+    def _within(layers, candidates_by_layer, lat, lon, radius_m):
+        results = {}
+        for layer in layers:
+            candidates = candidates_by_layer[layer]
+            coords = [element_coords(element) for element in candidates]
+            distances = haversine_km_many(lat, lon, [c[0] for c in coords], [c[1] for c in coords])
+            radius_km = radius_m / 1000
+            results[layer] = [element for element, d in zip(candidates, distances) if d <= radius_km]
+        return results
+
+    def _tiles(self, layers, tiles):
+        """{(layer, tile): elements} for every requested tile, fetching the missing ones in one query"""
+        cached, missing = self._lookup(layers, tiles)
+        if missing:
+            cached.update(self._store(layers, missing, self.fetch(self._fill_query(layers, missing))))
+        return cached
+
+    async def _tiles_async(self, layers, tiles):
+        cached, missing = self._lookup(layers, tiles)
+        if missing:
+            cached.update(self._store(layers, missing, await self.afetch(self._fill_query(layers, missing))))
+        return cached
+
+    def _lookup(self, layers, tiles):
+        """Split the requested (layer, tile) pairs into cached elements and {layer: missing tiles}"""
+        cached = {}
+        missing = {}
+        for layer in layers:
+            for tile in tiles:
+                hit, elements = self.tiles.get((layer, self.zoom) + tile)
+                if hit:
+                    cached[(layer, tile)] = elements
+                else:
+                    missing.setdefault(layer, set()).add(tile)
+
+        missing_count = sum(len(t) for t in missing.values())
+        cache_requests.inc(len(cached), cache="overpass_tile", result="hit")
+        cache_requests.inc(missing_count, cache="overpass_tile", result="miss")
+        return cached, missing
+
+    def _fill_query(self, layers, missing):
+        """One union query covering every missing (layer, tile)"""
+        missing_tiles = set().union(*missing.values())
+        return build_union_query(_selectors(layers, missing), self._areas(missing_tiles))
+
+    @staticmethod
+    def _direct_query(layers, points):
+        """An uncached query for every layer around each (lat, lon, radius_m) point"""
+        return build_union_query(_selectors(layers, layers), [around(radius_m, lat, lon) for lat, lon, radius_m in points])
+
+    def _store(self, layers, missing, elements):
+        """Split fetched elements into their (layer, tile) entries and cache them"""
+        filled = {(layer, tile): [] for layer, layer_tiles in missing.items() for tile in layer_tiles}
+        for element in elements:
+            el_lat, el_lon = element_coords(element)
+            if el_lat is None:
+                continue
+            tile = tile_for(el_lat, el_lon, self.zoom)
+            for layer, layer_tiles in missing.items():
+                if tile in layer_tiles and element_matches(element, layers[layer]):
+                    filled[(layer, tile)].append(element)
+
+        for (layer, tile), tile_elements in filled.items():
+            self.tiles.set((layer, self.zoom) + tile, tile_elements)
+        return filled
+
+    def _areas(self, tiles):
+        """One bbox around the tiles, or one per row of adjacent tiles when they are scattered (e.g. a route)"""
+        xs = [x for x, _ in tiles]
+        ys = [y for _, y in tiles]
+        if (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1) <= 2 * len(tiles):
+            return bbox(*_merge_bounds([tile_bounds(x, y, self.zoom) for x, y in tiles]))
+
+        areas = []
+        for y in sorted(set(ys)):
+            row = sorted(x for x, tile_y in tiles if tile_y == y)
+            start = prev = row[0]
+            for x in row[1:] + [None]:
+                if x is not None and x == prev + 1:
+                    prev = x
+                    continue
+                areas.append(bbox(*_merge_bounds([tile_bounds(start, y, self.zoom), tile_bounds(prev, y, self.zoom)])))
+                start = prev = x
+        return areas
+
+
+def _selectors(layers, names):
+    """The distinct selectors of the named layers, in order"""
+    selectors = []
+    for layer in names:
+        for selector in layers[layer]:
+            if selector not in selectors:
+                selectors.append(selector)
+    return selectors
+
+
+def _merge_bounds(bounds):
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
@@ -0,0 +1,45 @@
+PLACE_FIELDS = ("id", "name", "address", "category", "lat", "lon", "tags")
+
+
+class Place:
+    """Projected OSM place; only the fields the API serves are kept, not the whole element.
+
+    Supports place["name"] / place.get("tags") so code written against the old
+    dict records keeps working.
+    """
+
+    # score is the ranking importance; it is not served
+    __slots__ = PLACE_FIELDS + ("score",)
+
+    def __init__(self, id, name, address, category, lat, lon, tags, score=0.0):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.category = category
+        self.lat = lat
+        self.lon = lon
+        self.tags = tags
+        self.score = score
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self, fields=PLACE_FIELDS):
+        return {field: getattr(self, field) for field in fields}
+
+
+def parse_fields(fields, include_tags=True):
+    """Normalize a fields= selection (list or comma string) into a tuple of known fields"""
+    if not fields:
+        selected = PLACE_FIELDS
+    else:
+        if isinstance(fields, str):
+            fields = fields.split(",")
+        wanted = {f.strip() for f in fields}
+        selected = tuple(f for f in PLACE_FIELDS if f in wanted)
+    if not include_tags:
+        selected = tuple(f for f in selected if f != "tags")
+    return selected
@@ -0,0 +1,184 @@
+"""Itinerary planning: split places into geographic days and order each day's stops."""
+import math
+import time
+
+from geo import haversine_km
+
+PLAN_BUDGET_S = 0.05      # total time allowed for clustering + route ordering
+CITY_SPEED_KMH = 20       # door-to-door average for walking/transit/taxi mix
+DETOUR_FACTOR = 1.3       # streets aren't straight lines
+KMEANS_ITERATIONS = 15
+
+
+def travel_minutes(lat1, lon1, lat2, lon2):
+    """Estimated travel time between two stops, rounded up to 5 minutes"""
+    km = haversine_km(lat1, lon1, lat2, lon2) * DETOUR_FACTOR
+    return max(5, int(math.ceil(km / CITY_SPEED_KMH * 60 / 5)) * 5)
+
+
+def _project(places, origin):
+    """Equirectangular km coordinates around the origin - accurate enough inside one city"""
+    lat0, lon0 = origin
+    kx = 111.32 * math.cos(math.radians(lat0))
+    return [((p["lon"] - lon0) * kx, (p["lat"] - lat0) * 110.57) for p in places]
+
+
+def _dist(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def _seed_centroids(points, k, deadline):
+    """Farthest-point seeding starting from the densest 1 km grid cell; None if time runs out"""
+    cells = {}
+    for x, y in points:
+        key = (int(x // 1), int(y // 1))
+        cells[key] = cells.get(key, 0) + 1
+    densest = max(cells, key=cells.get)
+    centroids = [(densest[0] + 0.5, densest[1] + 0.5)]
+    nearest = [_dist(p, centroids[0]) for p in points]
+    while len(centroids) < k:
+        if time.perf_counter() > deadline:
+            return None
+        i = max(range(len(points)), key=nearest.__getitem__)
+        centroids.append(points[i])
+        nearest = [min(d, _dist(p, points[i])) for d, p in zip(nearest, points)]
+    return centroids
+
+
+def _assign_with_capacity(points, centroids, capacity, deadline):
+    """Each point goes to its closest centroid with room; points closest to a centroid pick first.
+
+    None if time runs out while ranking the centroids.
+    """
+    preferences = []
+    for i, p in enumerate(points):
+        if i % 64 == 0 and time.perf_counter() > deadline:
+            return None
+        ranked = sorted((_dist(p, c), j) for j, c in enumerate(centroids))
+        preferences.append((ranked[0][0], i, ranked))
+    preferences.sort()
+
+    assignment = [None] * len(points)
+    load = [0] * len(centroids)
+    for _, i, ranked in preferences:
+        for _, j in ranked:
+            if load[j] < capacity:
+                assignment[i] = j
+                load[j] += 1
+                break
+    return assignment
+
+
+def _sweep_assignment(points, k):
+    """Out-of-time fallback in O(n log n): cut a serpentine sweep over ~sqrt(k) horizontal bands into k even runs"""
+    n = len(points)
+    bands = max(1, round(math.sqrt(k)))
+    by_y = sorted(range(n), key=lambda i: points[i][1])
+    band_of = {i: rank * bands // n for rank, i in enumerate(by_y)}
+    sweep = sorted(range(n), key=lambda i: (band_of[i], points[i][0] if band_of[i] % 2 == 0 else -points[i][0]))
+    assignment = [None] * n
+    for position, i in enumerate(sweep):
+        assignment[i] = position * k // n
+    return assignment
+
+
+def cluster_days(points, days, capacity, deadline):
+    """Balanced k-means: returns a list of index lists, one per day"""
+    k = min(days, len(points))
+    centroids = _seed_centroids(points, k, deadline)
+    assignment = _assign_with_capacity(points, centroids, capacity, deadline) if centroids else None
+    if assignment is None:
+        return _clusters(_sweep_assignment(points, k), k)
+
+    for _ in range(KMEANS_ITERATIONS):
+        if time.perf_counter() > deadline:
+            break
+        sums = [[0.0, 0.0, 0] for _ in centroids]
+        for (x, y), j in zip(points, assignment):
+            sums[j][0] += x
+            sums[j][1] += y
+            sums[j][2] += 1
+        centroids = [(sx / n, sy / n) if n else c for (sx, sy, n), c in zip(sums, centroids)]
+        new_assignment = _assign_with_capacity(points, centroids, capacity, deadline)
+        if new_assignment is None or new_assignment == assignment:
+            break
+        assignment = new_assignment
+    return _clusters(assignment, k)
+
+
+def _clusters(assignment, k):
+    clusters = [[] for _ in range(k)]
+    for i, j in enumerate(assignment):
+        clusters[j].append(i)
+    return [c for c in clusters if c]
+
+
+def order_route(points, indices, start, deadline):
+    """Nearest-neighbour tour from `start`, then 2-opt until it stops improving or time runs out"""
+    route = []
+    remaining = set(indices)
+    current = start
+    while remaining:
+        if time.perf_counter() > deadline:
+            # Out of time: finish with a single sort instead of O(n^2) nearest-neighbour steps
+            route.extend(sorted(remaining, key=lambda i: _dist(current, points[i])))
+            break
+        nxt = min(remaining, key=lambda i: _dist(current, points[i]))
+        route.append(nxt)
+        remaining.discard(nxt)
+        current = points[nxt]
+
+    # Open path anchored at `start`: reversing route[i..j] swaps edges (i-1,i) and (j,j+1)
+    def pt(pos):
+        return start if pos < 0 else points[route[pos]]
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(len(route) - 1):
+            for j in range(i + 1, len(route)):
+                before = _dist(pt(i - 1), pt(i))
+                after = _dist(pt(i - 1), pt(j))
+                if j + 1 < len(route):
+                    before += _dist(pt(j), pt(j + 1))
+                    after += _dist(pt(i), pt(j + 1))
+                if after < before - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def plan_days(places, total_days, per_day, origin, budget=PLAN_BUDGET_S):
+    """Group places into at most `total_days` days of at most `per_day` stops, each in visiting order"""
+    if not places:
+        return []
+    deadline = time.perf_counter() + budget
+    points = _project(places, origin)
+    clusters = cluster_days(points, total_days, per_day, deadline)
+
+    # Visit the day closest to the city centre first
+    clusters.sort(key=lambda c: min(math.hypot(*points[i]) for i in c))
+    days = []
+    for cluster in clusters:
+        route = order_route(points, cluster, (0.0, 0.0), deadline)
+        days.append([places[i] for i in route])
+    return days
+
+
+def insertion_index(route, place):
+    """Position in an ordered day where `place` adds the least travel (cheapest insertion)"""
+    if not route:
+        return 0
+
+    def km(a, b):
+        return haversine_km(a["lat"], a["lon"], b["lat"], b["lon"])
+
+    # Appending after the last stop only adds one leg; an inner slot swaps one leg for two
+    best, best_cost = len(route), km(route[-1], place)
+    for i in range(len(route) - 1):
+        cost = km(route[i], place) + km(place, route[i + 1]) - km(route[i], route[i + 1])
+        if cost < best_cost:
+            best, best_cost = i + 1, cost
+    if km(place, route[0]) < best_cost:
+        best = 0
+    return best
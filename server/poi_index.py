@@ -0,0 +1,294 @@
+"""Offline POI engine: import an OSM extract into a SQLite R-tree and query it like Overpass.
+
+    python poi_index.py import city.json --db pois.sqlite3   # Overpass JSON dump
+    python poi_index.py import region.osm.pbf                # needs pyosmium
+
+Set POI_BACKEND=offline (and POI_INDEX_PATH) to make /api/nearby and
+generate_trip read from the index instead of the Overpass mirrors.
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+from geo import bounding_box, element_coords, haversine_km
+from osm_stream import iter_elements, iter_file_chunks
+from overpass_query import element_matches, parse_tag_filter
+from sqlite_store import thread_connection
+
+POI_BACKEND = os.environ.get("POI_BACKEND", "overpass")
+POI_INDEX_PATH = os.environ.get(
+    "POI_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pois.sqlite3")
+)
+
+# Tag keys either service filters on; anything else is never queried
+POI_KEYS = ("amenity", "tourism", "shop", "historic", "leisure", "natural")
+BATCH_SIZE = 5000
+MMAP_SIZE = 1 << 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS poi (
+    id INTEGER PRIMARY KEY,
+    osm_type TEXT NOT NULL,
+    osm_id INTEGER NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    tags TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+"""
+# Created separately: indexes built before it existed may first need their duplicates removed
+UNIQUE_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS poi_osm ON poi (osm_type, osm_id)"
+# One row per POI_KEYS tag of every POI, keyed so a selector and a bounding box are one index range:
+# queries find their matches here and only decode the tags of those. Indexes built before it
+# existed get it filled from their tags.
+TAG_SCHEMA = """
+CREATE TABLE poi_tag (
+    osm_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    poi_id INTEGER NOT NULL,
+    PRIMARY KEY (osm_type, key, value, lat, lon, poi_id)
+) WITHOUT ROWID;
+CREATE INDEX poi_tag_poi ON poi_tag (poi_id);
+"""
+
+
+def is_poi(element):
+    """Same gate as parse_osm_element / enhance_osm_place_data: named, located, and tagged"""
+    tags = element.get("tags")
+    if not tags or not tags.get("name"):
+        return False
+    if element_coords(element)[0] is None:
+        return False
+    return any(key in tags for key in POI_KEYS)
+
+
+def iter_pbf_elements(path):
+    """Yield Overpass-shaped nodes and way centers from an .osm.pbf extract"""
+    import osmium  # optional, only needed for PBF imports
+
+    # Node locations go to a file-backed index so memory stays flat on big extracts
+    node_cache = path + ".nodecache"
+    processor = osmium.FileProcessor(path).with_locations("sparse_file_array," + node_cache)
+    try:
+        for obj in processor:
+            if not obj.tags:
+                continue
+            if obj.is_node() and obj.location.valid():
+                yield {"type": "node", "id": obj.id,
+                       "lat": obj.location.lat, "lon": obj.location.lon,
+                       "tags": dict(obj.tags)}
+            elif obj.is_way():
+                points = [(nd.lat, nd.lon) for nd in obj.nodes if nd.location.valid()]
+                if points:
+                    yield {"type": "way", "id": obj.id,
+                           "center": {"lat": sum(p[0] for p in points) / len(points),
+                                      "lon": sum(p[1] for p in points) / len(points)},
+                           "tags": dict(obj.tags)}
+    finally:
+        if os.path.exists(node_cache):
+            os.remove(node_cache)
+
+
+def _ensure_unique(conn):
+    """Make (osm_type, osm_id) unique, keeping the latest import of elements that were imported twice"""
+    try:
+        conn.execute(UNIQUE_INDEX)
+    except sqlite3.IntegrityError:
+        with conn:
+            conn.execute("DELETE FROM poi WHERE id NOT IN (SELECT MAX(id) FROM poi GROUP BY osm_type, osm_id)")
+            conn.execute("DELETE FROM poi_rtree WHERE id NOT IN (SELECT id FROM poi)")
+        conn.execute(UNIQUE_INDEX)
+
+
+def poi_tags(tags):
+    """The (key, value) pairs of a POI that queries can select on"""
+    return [(key, tags[key]) for key in POI_KEYS if key in tags]
+
+
+def _has_tags(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'poi_tag'").fetchone() is not None
+
+
+def _ensure_tags(conn):
+    """Add and fill poi_tag in indexes imported before it existed"""
+    # Checked before taking the write lock, so read-only index files still open
+    if _has_tags(conn):
+        return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if _has_tags(conn):
+            return  # another worker filled it while this one waited
+        for statement in TAG_SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        for poi_id, osm_type, lat, lon, tags in conn.execute("SELECT id, osm_type, lat, lon, tags FROM poi").fetchall():
+            conn.executemany("INSERT INTO poi_tag (osm_type, key, value, lat, lon, poi_id) VALUES (?, ?, ?, ?, ?, ?)",
+                             [(osm_type, key, value, lat, lon, poi_id) for key, value in poi_tags(json.loads(tags))])
+
+
+def import_extract(source, db_path=POI_INDEX_PATH):
+    """Stream an extract into the index in fixed-size batches; returns the number of POIs.
+
+    Elements already in the index are updated in place, so extracts can be
+    re-imported or overlap.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    _ensure_unique(conn)
+    _ensure_tags(conn)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    if source.endswith(".pbf"):
+        elements = iter_pbf_elements(source)
+        fileobj = None
+    else:
+        fileobj = open(source, "rb")
+        elements = iter_elements(iter_file_chunks(fileobj))
+
+    # Explicit ids for new rows; an element seen before keeps its id
+    next_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM poi").fetchone()[0] + 1
+    count = 0
+    batch = []
+
+    def flush():
+        with conn:
+            conn.executemany(
+                "INSERT INTO poi (id, osm_type, osm_id, lat, lon, tags) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (osm_type, osm_id) DO UPDATE SET lat = excluded.lat, lon = excluded.lon, tags = excluded.tags",
+                batch
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO poi_rtree (id, min_lat, max_lat, min_lon, max_lon) "
+                "SELECT id, lat, lat, lon, lon FROM poi WHERE osm_type = ? AND osm_id = ?",
+                [(row[1], row[2]) for row in batch]
+            )
+            # Re-imported elements may have moved or changed their tags
+            conn.executemany(
+                "DELETE FROM poi_tag WHERE poi_id = (SELECT id FROM poi WHERE osm_type = ? AND osm_id = ?)",
+                [(row[1], row[2]) for row in batch]
+            )
+            conn.executemany(
+                "INSERT INTO poi_tag (osm_type, key, value, lat, lon, poi_id) "
+                "SELECT osm_type, ?, ?, lat, lon, id FROM poi WHERE osm_type = ? AND osm_id = ?",
+                [(key, value, row[1], row[2]) for row in batch for key, value in poi_tags(json.loads(row[5]))]
+            )
+        batch.clear()
+
+    try:
+        for element in elements:
+            if not is_poi(element):
+                continue
+            lat, lon = element_coords(element)
+            batch.append((next_id + count, element["type"], element["id"], lat, lon,
+                           json.dumps(element["tags"], separators=(",", ":"))))
+            count += 1
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        flush()
+    finally:
+        if fileobj:
+            fileobj.close()
+        conn.close()
+    return count
+
+
+class PoiIndex:
+    """Read side of the index; query() has the same contract as TileCache.query"""
+
+    def __init__(self, db_path=POI_INDEX_PATH):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"POI index not found: {db_path} (run poi_index.py import first)")
+        self.db_path = db_path
+        self._conn = thread_connection(db_path, read_only=True, pragmas=[f"mmap_size={MMAP_SIZE}"])
+        # {(osm_type, tag filter): tag values it selects}; a re-imported index is picked up on restart
+        self._values = {}
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            _ensure_tags(conn)
+        finally:
+            conn.close()
+
+    def _selected_values(self, element_type, tag_filter):
+        """Values of the filter's key, among POIs of this type, that the filter selects"""
+        values = self._values.get((element_type, tag_filter))
+        if values is None:
+            key, pattern = parse_tag_filter(tag_filter)
+            rows = self._conn().execute(
+                "SELECT DISTINCT value FROM poi_tag WHERE osm_type = ? AND key = ?", (element_type, key)
+            )
+            values = [value for (value,) in rows if pattern is None or pattern.search(value)]
+            self._values[(element_type, tag_filter)] = values
+        return values
+
+    def query(self, layers, lat, lon, radius_m):
+        """Return {layer: [elements within radius_m of (lat, lon)]}"""
+        south, west, north, east = bounding_box(lat, lon, radius_m)
+        lookups = []
+        params = []
+        for element_type, tag_filter in dict.fromkeys(s for selectors in layers.values() for s in selectors):
+            values = self._selected_values(element_type, tag_filter)
+            if values:
+                lookups.append(
+                    f"SELECT poi_id FROM poi_tag WHERE osm_type = ? AND key = ? AND value IN ({', '.join('?' * len(values))})"
+                    " AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?"
+                )
+                params += [element_type, parse_tag_filter(tag_filter)[0], *values, south, north, west, east]
+
+        results = {layer: [] for layer in layers}
+        if not lookups:
+            return results
+        rows = self._conn().execute(
+            f"SELECT osm_type, osm_id, lat, lon, tags FROM poi WHERE id IN ({' UNION '.join(lookups)})", params
+        )
+        for osm_type, osm_id, el_lat, el_lon, tags in rows:
+            if haversine_km(lat, lon, el_lat, el_lon) * 1000 > radius_m:
+                continue
+            element = {"type": osm_type, "id": osm_id, "lat": el_lat, "lon": el_lon,
+                       "tags": json.loads(tags)}
+            for layer, selectors in layers.items():
+                if element_matches(element, selectors):
+                    results[layer].append(element)
+        return results
+
+    def query_many(self, layers, points):
+        """Same contract as TileCache.query_many: elements near any (lat, lon, radius_m) point, each once"""
+        results = {layer: [] for layer in layers}
+        seen = set()
+        for lat, lon, radius_m in points:
+            for layer, elements in self.query(layers, lat, lon, radius_m).items():
+                for element in elements:
+                    key = (layer, element["type"], element["id"])
+                    if key not in seen:
+                        seen.add(key)
+                        results[layer].append(element)
+        return results
+
+    # Indexed local reads take milliseconds, so the ASGI services call them on the event loop
+    async def query_async(self, layers, lat, lon, radius_m):
+        return self.query(layers, lat, lon, radius_m)
+
+    async def query_many_async(self, layers, points):
+        return self.query_many(layers, points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline POI index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import an Overpass JSON dump or .osm.pbf extract")
+    imp.add_argument("source")
+    imp.add_argument("--db", default=POI_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        count = import_extract(args.source, args.db)
+        print(f"✅ Imported {count} places into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import heapq
+
+# wikidata/wikipedia links are the strongest notability signal OSM carries
+WIKIDATA_WEIGHT = 4.0
+WIKIPEDIA_WEIGHT = 3.0
+HERITAGE_WEIGHT = 1.5
+
+TOURISM_WEIGHTS = {
+    "attraction": 3.0, "museum": 3.0, "zoo": 2.5, "aquarium": 2.5, "theme_park": 2.5,
+    "gallery": 2.0, "viewpoint": 2.0, "artwork": 1.0,
+}
+HISTORIC_WEIGHTS = {
+    "castle": 3.0, "monument": 2.5, "archaeological_site": 2.0, "fort": 2.0, "ruins": 1.5,
+    "memorial": 1.0,
+}
+DEFAULT_CLASS_WEIGHT = 1.0
+
+# Well-mapped places carry more tags and more translated names; both are capped
+TAG_WEIGHT, MAX_TAGS = 0.1, 20
+NAME_WEIGHT, MAX_NAMES = 0.2, 10
+
+
+def importance(tags):
+    """Numeric importance of an OSM place from its tags; higher is more worth visiting"""
+    score = 0.0
+    if "wikidata" in tags:
+        score += WIKIDATA_WEIGHT
+    if "wikipedia" in tags:
+        score += WIKIPEDIA_WEIGHT
+    if "heritage" in tags:
+        score += HERITAGE_WEIGHT
+
+    tourism = tags.get("tourism")
+    if tourism:
+        score += TOURISM_WEIGHTS.get(tourism, DEFAULT_CLASS_WEIGHT)
+    historic = tags.get("historic")
+    if historic:
+        score += HISTORIC_WEIGHTS.get(historic, DEFAULT_CLASS_WEIGHT)
+
+    names = sum(1 for key in tags if key.startswith("name:"))
+    score += TAG_WEIGHT * min(len(tags), MAX_TAGS) + NAME_WEIGHT * min(names, MAX_NAMES)
+    return score
+
+
+def top_places(places, k):
+    """The k most important places, best first, without sorting the rest.
+
+    Ties go to the shorter name, then to the earlier place.
+    """
+    return heapq.nlargest(k, places, key=lambda place: (place.score, -len(place.name)))
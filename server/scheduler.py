@@ -0,0 +1,361 @@
+"""Upstream admission control: per-host token buckets shared across processes, concurrency caps and priorities."""
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from log import fields, get_logger
+from metrics import register_collector, upstream_queue_seconds, upstream_shed
+from sqlite_store import thread_connection
+
+logger = get_logger("scheduler")
+
+# Token state lives in SQLite so every worker process of both services draws from the same buckets
+LIMITS_DB_PATH = os.environ.get(
+    "UPSTREAM_LIMITS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "upstream_limits.sqlite3")
+)
+BUCKET_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    host TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Lower runs first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Longest a request may queue for an upstream slot before it is shed with a 503
+MAX_QUEUE_WAIT = {INTERACTIVE: 3.0, BULK: 15.0}
+
+
+class HostLimit:
+    __slots__ = ("rate", "burst", "concurrency", "reserve")
+
+    def __init__(self, rate, burst, concurrency, reserve=0.0):
+        self.rate = rate                # tokens per second
+        self.burst = burst              # bucket size
+        self.concurrency = concurrency  # requests in flight per process
+        self.reserve = reserve          # tokens only interactive requests may spend
+
+    def __repr__(self):
+        return f"HostLimit({self.rate}/s, burst={self.burst}, concurrency={self.concurrency})"
+
+
+# Public usage policies: Nominatim allows 1 req/s, overpass-api.de hands out a couple of slots per IP
+HOST_LIMITS = {
+    "nominatim.openstreetmap.org": HostLimit(rate=1.0, burst=1, concurrency=1),
+    "overpass-api.de": HostLimit(rate=1.0, burst=2, concurrency=2, reserve=1),
+}
+DEFAULT_LIMIT = HostLimit(rate=2.0, burst=4, concurrency=4, reserve=1)
+
+
+def parse_limits(spec):
+    """UPSTREAM_LIMITS=host=rate:burst:concurrency[:reserve],... e.g. for a self-hosted Overpass"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, values = item.partition("=")
+        numbers = [float(v) for v in values.split(":")]
+        limits[host] = HostLimit(numbers[0], numbers[1], int(numbers[2]), *numbers[3:4])
+    return limits
+
+
+HOST_LIMITS.update(parse_limits(os.environ.get("UPSTREAM_LIMITS", "")))
+
+current_priority = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def use_priority(priority):
+    """Run a block (e.g. a bulk trip build) with a different upstream priority"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class Overloaded(Exception):
+    """An upstream slot can't be had within the queue deadline; callers answer 503"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"Upstream {host} is saturated, retry in {retry_after:.1f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Token buckets in a shared SQLite table, falling back to process-local state if it is unavailable"""
+
+    def __init__(self, db_path=LIMITS_DB_PATH):
+        self.db_path = db_path
+        # Autocommit mode so BEGIN IMMEDIATE below is the only transaction
+        self._conn = thread_connection(db_path, BUCKET_SCHEMA, timeout=2, isolation_level=None)
+        self._fallback = {}
+        self._fallback_lock = threading.Lock()
+
+    @staticmethod
+    def _refill(tokens, updated_at, limit, floor, now):
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+        if tokens >= floor + 1:
+            return tokens - 1, 0.0
+        return tokens, (floor + 1 - tokens) / limit.rate
+
+    def take(self, host, limit, floor=0.0):
+        """Spend one token if more than `floor` remain; returns 0, or seconds until one will be"""
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated_at FROM bucket WHERE host = ?", (host,)).fetchone()
+                tokens, wait = self._refill(*(row or (limit.burst, now)), limit, floor, now)
+                conn.execute("INSERT OR REPLACE INTO bucket (host, tokens, updated_at) VALUES (?, ?, ?)",
+                             (host, tokens, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return wait
+        except sqlite3.Error as e:
+            logger.warning("Shared rate limit unavailable, limiting per process", extra=fields(error=str(e)))
+
+        with self._fallback_lock:
+            tokens, wait = self._refill(*self._fallback.get(host, (limit.burst, now)), limit, floor, now)
+            self._fallback[host] = (tokens, now)
+            return wait
+
+
+class _HostQueue:
+    def __init__(self, host, limit):
+        self.host = host
+        self.limit = limit
+        self.waiting = []   # heap of (priority, seq)
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self.cond = threading.Condition()
+        self.wakers = []    # (loop, future) of coroutines waiting in aslot()
+        self.taking = False     # a waiter is asking the bucket for a token without holding cond
+
+
+def _wake(waker):
+    if not waker.done():
+        waker.set_result(None)
+
+
+class UpstreamScheduler:
+    """Admits upstream requests per host in priority order, within rate and concurrency limits.
+
+    Waiters queue in a heap; only the head asks the shared bucket for a token,
+    so interactive requests always go before queued bulk ones in this process.
+    Across processes, bulk requests leave `reserve` tokens for interactive ones.
+    """
+
+    def __init__(self, limits=HOST_LIMITS, default=DEFAULT_LIMIT, buckets=None):
+        self.limits = limits
+        self.default = default
+        self.buckets = buckets or TokenBuckets()
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _queue(self, host):
+        with self._lock:
+            queue = self._queues.get(host)
+            if queue is None:
+                queue = self._queues[host] = _HostQueue(host, self.limits.get(host, self.default))
+            return queue
+
+    @contextmanager
+    def slot(self, host, priority=None, max_wait=None):
+        """Hold one request slot for `host`, raising Overloaded rather than queueing past max_wait"""
+        priority = current_priority.get() if priority is None else priority
+        max_wait = MAX_QUEUE_WAIT[priority] if max_wait is None else max_wait
+        queue = self._queue(host)
+        start = time.monotonic()
+        deadline = start + max_wait
+
+        with queue.cond:
+            entry = self._enqueue(queue, priority, max_wait)
+            try:
+                while True:
+                    wait = self._poll(queue, entry, deadline)
+                    if wait == 0:
+                        break
+                    queue.cond.wait(wait)
+            except Overloaded:
+                self._leave(queue, entry)
+                raise
+
+        upstream_queue_seconds.observe(time.monotonic() - start, host=host, priority=PRIORITY_NAMES[priority])
+        try:
+            yield
+        finally:
+            self._release(queue)
+
+    @asynccontextmanager
+    async def aslot(self, host, priority=None, max_wait=None):
+        """slot() for coroutines: waiting suspends the task instead of blocking a thread"""
+        priority = current_priority.get() if priority is None else priority
+        max_wait = MAX_QUEUE_WAIT[priority] if max_wait is None else max_wait
+        queue = self._queue(host)
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + max_wait
+
+        with queue.cond:
+            entry = self._enqueue(queue, priority, max_wait)
+        taking = False
+        try:
+            while True:
+                with queue.cond:
+                    taking = self._can_take(queue, entry)
+                    queue.taking |= taking
+                wait = None
+                if taking:
+                    # The shared bucket is a SQLite transaction that may wait on other processes; keep it off the loop
+                    wait = await asyncio.to_thread(self.buckets.take, queue.host, queue.limit,
+                                                   self._floor(queue, entry))
+                with queue.cond:
+                    if taking:
+                        taking = queue.taking = False
+                        self._notify(queue)
+                    wait = self._settle(queue, entry, deadline, wait)
+                    if wait == 0:
+                        break
+                    waker = loop.create_future()
+                    queue.wakers.append((loop, waker))
+                await asyncio.wait({waker}, timeout=wait)
+        except BaseException:
+            # Overloaded, or the request was cancelled while queued
+            with queue.cond:
+                if taking:
+                    queue.taking = False
+                self._leave(queue, entry)
+            raise
+
+        upstream_queue_seconds.observe(time.monotonic() - start, host=host, priority=PRIORITY_NAMES[priority])
+        try:
+            yield
+        finally:
+            self._release(queue)
+
+    def _enqueue(self, queue, priority, max_wait):
+        entry = (priority, next(self._seq))
+        # Shed up front when the requests already ahead can't clear in time
+        ahead = sum(1 for other in queue.waiting if other < entry)
+        expected = ahead / queue.limit.rate
+        if expected > max_wait:
+            self._shed(queue, priority, expected)
+        heapq.heappush(queue.waiting, entry)
+        return entry
+
+    def _poll(self, queue, entry, deadline):
+        """Admit entry if it can go now (returns 0), else seconds to wait before asking again.
+
+        Holds queue.cond, except while asking the bucket: that may wait on other
+        processes, and coroutines take cond on the event loop.
+        """
+        wait = None
+        if self._can_take(queue, entry):
+            queue.taking = True
+            queue.cond.release()
+            try:
+                wait = self.buckets.take(queue.host, queue.limit, self._floor(queue, entry))
+            finally:
+                queue.cond.acquire()
+                queue.taking = False
+                self._notify(queue)
+        return self._settle(queue, entry, deadline, wait)
+
+    @staticmethod
+    def _can_take(queue, entry):
+        """Whether entry may ask the bucket for a token: first in line, a free slot, nobody else asking"""
+        return queue.waiting[0] == entry and queue.active < queue.limit.concurrency and not queue.taking
+
+    @staticmethod
+    def _floor(queue, entry):
+        """Tokens to leave in the bucket: bulk requests keep the reserve for interactive ones"""
+        return 0.0 if entry[0] == INTERACTIVE else queue.limit.reserve
+
+    def _settle(self, queue, entry, deadline, wait):
+        """Admit entry after a bucket answer of 0, else shed it or return seconds to wait; holds queue.cond.
+
+        wait is None when entry didn't get to ask.
+        """
+        limit = queue.limit
+        remaining = deadline - time.monotonic()
+        if wait == 0:
+            queue.waiting.remove(entry)
+            heapq.heapify(queue.waiting)
+            queue.active += 1
+            queue.admitted += 1
+            # The next waiter may be able to go straight away (burst tokens, free slots)
+            self._notify(queue)
+            return 0
+        if wait is None:
+            wait = remaining
+        if remaining <= 0 or wait > remaining:
+            self._shed(queue, entry[0], max(wait, len(queue.waiting) / limit.rate))
+        return wait
+
+    def _leave(self, queue, entry):
+        queue.waiting.remove(entry)
+        heapq.heapify(queue.waiting)
+        self._notify(queue)
+
+    def _release(self, queue):
+        with queue.cond:
+            queue.active -= 1
+            self._notify(queue)
+
+    @staticmethod
+    def _notify(queue):
+        """Wake every waiter, thread or coroutine; holds queue.cond"""
+        queue.cond.notify_all()
+        for loop, waker in queue.wakers:
+            loop.call_soon_threadsafe(_wake, waker)
+        queue.wakers.clear()
+
+    def _shed(self, queue, priority, retry_after):
+        queue.shed += 1
+        upstream_shed.inc(host=queue.host, priority=PRIORITY_NAMES[priority])
+        logger.warning("Shedding upstream request", extra=fields(host=queue.host, priority=PRIORITY_NAMES[priority],
+                                                                 queued=len(queue.waiting), retry_after=retry_after))
+        raise Overloaded(queue.host, max(retry_after, 1 / queue.limit.rate))
+
+    def snapshot(self):
+        with self._lock:
+            queues = list(self._queues.values())
+        return {
+            queue.host: {
+                "rate": queue.limit.rate,
+                "concurrency": queue.limit.concurrency,
+                "active": queue.active,
+                "queued": len(queue.waiting),
+                "admitted": queue.admitted,
+                "shed": queue.shed
+            }
+            for queue in queues
+        }
+
+
+upstream_scheduler = UpstreamScheduler()
+
+
+@register_collector
+def _scheduler_metrics():
+    stats = upstream_scheduler.snapshot()
+    yield ("upstream_active_requests", "gauge", "Upstream requests holding a slot",
+           [({"host": host}, s["active"]) for host, s in stats.items()])
+    yield ("upstream_queued_requests", "gauge", "Upstream requests waiting for a slot",
+           [({"host": host}, s["queued"]) for host, s in stats.items()])
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+from metrics import register_collector
+
+_groups = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent callers with the same key share one in-flight call and its result.
+
+    Results are shared by reference, so callers must treat them as read-only.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0, "errors": 0}
+        _groups[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines: callers await one shared task per key"""
+
+    async def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            task = self._calls.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                self._calls[key] = task
+                self.stats["calls"] += 1
+                task.add_done_callback(lambda done: self._finished(key, done))
+            else:
+                self.stats["coalesced"] += 1
+        # A caller that goes away (client disconnect) must not cancel the call the others wait on
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        with self._lock:
+            del self._calls[key]
+            if task.cancelled() or task.exception() is not None:
+                self.stats["errors"] += 1
+
+
+def snapshot():
+    """Counters for every single-flight group in the process"""
+    return {name: group.snapshot() for name, group in _groups.items()}
+
+
+@register_collector
+def _singleflight_metrics():
+    stats = snapshot()
+    yield ("singleflight_calls_total", "counter", "Upstream calls actually made",
+           [({"group": name}, s["calls"]) for name, s in stats.items()])
+    yield ("singleflight_coalesced_total", "counter", "Calls that waited on an identical in-flight call",
+           [({"group": name}, s["coalesced"]) for name, s in stats.items()])
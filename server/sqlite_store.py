@@ -0,0 +1,32 @@
+import sqlite3
+import threading
+
+# Seconds a write waits for another worker's lock before failing with "database is locked"
+BUSY_TIMEOUT = 5
+
+
+def thread_connection(db_path, schema=None, timeout=BUSY_TIMEOUT, read_only=False, pragmas=(), **connect_args):
+    """A function returning the calling thread's connection to db_path, opened on first use.
+
+    sqlite connections can't be shared across threads, so each thread gets its
+    own. Writable databases are switched to WAL, so readers in other workers
+    aren't blocked by a write, and `schema` is created if missing.
+    """
+    local = threading.local()
+
+    def connection():
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            if read_only:
+                conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=timeout, **connect_args)
+            else:
+                conn = sqlite3.connect(db_path, timeout=timeout, **connect_args)
+                conn.execute("PRAGMA journal_mode=WAL")
+            for pragma in pragmas:
+                conn.execute(f"PRAGMA {pragma}")
+            if schema and not read_only:
+                conn.executescript(schema)
+            local.conn = conn
+        return conn
+
+    return connection
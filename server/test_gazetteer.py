@@ -0,0 +1,89 @@
+import pytest
+
+from gazetteer import HOT_THRESHOLD, MAX_SUGGESTIONS, Gazetteer, build
+
+# (place id, name, country, lat, lon, population, names)
+PLACES = [
+    (1, "Paris", "FR", 48.8566, 2.3522, 2_100_000, ["Paris", "Lutece"]),
+    (2, "Paris", "US", 33.6609, -95.5555, 25_000, ["Paris"]),
+    (3, "Parma", "IT", 44.8015, 10.3279, 195_000, ["Parma"]),
+    (4, "Pärnu", "EE", 58.3859, 24.4971, 51_000, ["Pärnu", "Parnu"]),
+    (5, "São Paulo", "BR", -23.5505, -46.6333, 12_300_000, ["São Paulo"]),
+    (6, "Par", "GB", 50.3500, -4.7000, 1_600, ["Par"]),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "gazetteer.bin")
+    # One row per distinct normalized name of a place: "Pärnu" and "Parnu" share one
+    assert build(PLACES, path) == (len(PLACES), 7)
+    return Gazetteer(path)
+
+
+def names(places):
+    return [(p["name"], p["country"]) for p in places]
+
+
+@pytest.mark.parametrize("query, expected", [
+    # Most populous first, each place once even when several of its names match
+    ("par", [("Paris", "FR"), ("Parma", "IT"), ("Pärnu", "EE"), ("Paris", "US"), ("Par", "GB")]),
+    ("PARI", [("Paris", "FR"), ("Paris", "US")]),
+    ("parn", [("Pärnu", "EE")]),
+    ("pär", [("Paris", "FR"), ("Parma", "IT"), ("Pärnu", "EE"), ("Paris", "US"), ("Par", "GB")]),
+    ("sao p", [("São Paulo", "BR")]),
+    ("lut", [("Paris", "FR")]),
+    ("x", []),
+    ("", []),
+])
+def test_suggest(index, query, expected):
+    assert names(index.suggest(query)) == expected
+
+
+def test_suggest_limit_and_fields(index):
+    assert index.suggest("par", limit=2) == [
+        {"name": "Paris", "country": "FR", "lat": 48.8566, "lon": 2.3522, "population": 2_100_000},
+        {"name": "Parma", "country": "IT", "lat": 44.8015, "lon": 10.3279, "population": 195_000},
+    ]
+
+
+@pytest.mark.parametrize("city, expected", [
+    ("Paris", (48.8566, 2.3522)),       # the most populous of several exact matches
+    (" paris ", (48.8566, 2.3522)),
+    ("Sao Paulo", (-23.5505, -46.6333)),
+    ("Lutece", (48.8566, 2.3522)),
+    ("Pari", None),                     # prefixes aren't matches
+    ("", None),
+    (None, None),
+])
+def test_resolve(index, city, expected):
+    assert index.resolve(city) == expected
+
+
+def test_hot_prefixes_match_a_full_scan(tmp_path):
+    # Enough "sa..." names that the prefix is answered from the precomputed table
+    places = [(i, f"Sa{i:04d}", "XX", 1.0, 2.0, (i * 7919) % 100_000, [f"Sa{i:04d}"])
+              for i in range(HOT_THRESHOLD * 2)]
+    path = str(tmp_path / "gazetteer.bin")
+    build(places, path)
+    index = Gazetteer(path)
+    assert index.hot_count > 0
+
+    by_population = sorted(places, key=lambda p: (-p[5], p[1]))
+    for query in ("s", "sa", "sa0", "sa01"):
+        expected = [p[1] for p in by_population if p[1].lower().startswith(query)][:MAX_SUGGESTIONS]
+        assert [p["name"] for p in index.suggest(query, limit=MAX_SUGGESTIONS)] == expected
+
+
+def test_missing_index(tmp_path):
+    index = Gazetteer(str(tmp_path / "missing.bin"))
+    assert not index.available
+    assert index.suggest("par") == []
+    assert index.resolve("Paris") is None
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"NOPE" + bytes(64))
+    with pytest.raises(ValueError):
+        Gazetteer(str(path))
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+from opening_hours import ALWAYS_OPEN, compile_hours
+
+MON = datetime.date(2026, 6, 1)
+TUE = datetime.date(2026, 6, 2)
+WED = datetime.date(2026, 6, 3)
+SAT = datetime.date(2026, 6, 6)
+SUN = datetime.date(2026, 6, 7)
+JAN_MON = datetime.date(2026, 1, 5)
+
+
+@pytest.mark.parametrize("text, date, expected", [
+    # Weekday ranges and lists
+    ("Mo-Fr 09:00-18:00; Sa 10:00-16:00", MON, ((540, 1080),)),
+    ("Mo-Fr 09:00-18:00; Sa 10:00-16:00", SAT, ((600, 960),)),
+    ("Mo-Fr 09:00-18:00; Sa 10:00-16:00", SUN, ()),
+    ("Mo,We,Fr 10:00-12:00", MON, ((600, 720),)),
+    ("Mo,We,Fr 10:00-12:00", TUE, ()),
+    ("Sa-Su 10:00-14:00", SUN, ((600, 840),)),
+    # Several spans in one rule, open ends, a selector alone, times alone
+    ("Mo 09:00-12:00,13:00-17:00", MON, ((540, 720), (780, 1020))),
+    ("Mo-Fr 09:00-12:00, 14:00-18:00", MON, ((540, 720), (840, 1080))),
+    ("Mo-Fr 10:00+", MON, ((600, 1440),)),
+    ("Mo 22:00-24:00", MON, ((1320, 1440),)),
+    ("Mo-Fr", MON, ((0, 1440),)),
+    ("9:00-17:00", SUN, ((540, 1020),)),
+    # Later rules override earlier ones on the days they select, additional rules add to them
+    ("Mo-Su 09:00-18:00; Su off", SUN, ()),
+    ("Mo-Su 09:00-18:00; Su off", SAT, ((540, 1080),)),
+    ("Mo-Fr 09:00-12:00, We 14:00-18:00", WED, ((540, 720), (840, 1080))),
+    ("Mo-Fr 09:00-12:00, We 14:00-18:00", TUE, ((540, 720),)),
+    # Overnight spans spill into the next weekday
+    ("Fr-Mo 18:00-02:00", MON, ((0, 120), (1080, 1440))),
+    ("Fr-Mo 18:00-02:00", SAT, ((0, 120), (1080, 1440))),
+    ("Fr-Mo 18:00-02:00", TUE, ((0, 120),)),
+    # Month selectors, including ranges that wrap around the new year
+    ("Apr-Oct Mo-Su 09:00-18:00; Nov-Mar Mo-Su 10:00-16:00", MON, ((540, 1080),)),
+    ("Apr-Oct Mo-Su 09:00-18:00; Nov-Mar Mo-Su 10:00-16:00", JAN_MON, ((600, 960),)),
+    ("Nov-Feb Mo 10:00-12:00", JAN_MON, ((600, 720),)),
+    ("Nov-Feb Mo 10:00-12:00", MON, ()),
+    # Public holidays can't be known: alone they are skipped, mixed in they leave the weekdays
+    ("Mo-Fr 09:00-17:00; PH off", MON, ((540, 1020),)),
+    ("PH 10:00-12:00", MON, ()),
+    ("Su,PH 11:00-15:00", SUN, ((660, 900),)),
+    ("Mo,PH 10:00-12:00", MON, ((600, 720),)),
+])
+def test_intervals(text, date, expected):
+    assert compile_hours(text).intervals(date) == expected
+
+
+@pytest.mark.parametrize("text", [
+    None,
+    "",
+    "garbage",
+    "sunrise-sunset",
+    '"by appointment"',
+    "Mo-Fr 09:00-17:00 || Sa 10:00-12:00",
+    "week 1-53 Mo 10:00-12:00",
+])
+def test_unsupported_syntax_compiles_to_none(text):
+    assert compile_hours(text) is None
+
+
+def test_always_open():
+    assert compile_hours("24/7") is ALWAYS_OPEN
+    assert ALWAYS_OPEN.intervals(SUN) == ((0, 1440),)
+
+
+@pytest.mark.parametrize("minute, expected", [(539, False), (540, True), (1079, True), (1080, False)])
+def test_is_open(minute, expected):
+    assert compile_hours("Mo-Fr 09:00-18:00").is_open(MON, minute) is expected
+
+
+@pytest.mark.parametrize("text, minute, duration, expected", [
+    ("Mo-Fr 09:00-18:00", 500, 60, 540),     # waits for opening
+    ("Mo-Fr 09:00-18:00", 1020, 60, 1020),   # just fits before closing
+    ("Mo-Fr 09:00-18:00", 1030, 60, None),   # closes too soon
+    ("Mo 09:00-12:00,13:00-17:00", 690, 60, 780),  # doesn't fit before the break, starts after it
+    ("Sa 10:00-16:00", 540, 30, None),       # closed all day
+])
+def test_earliest_start(text, minute, duration, expected):
+    assert compile_hours(text).earliest_start(MON, minute, duration) == expected
@@ -0,0 +1,165 @@
+import asyncio
+import re
+
+import pytest
+
+import overpass_tiles
+from overpass_query import bbox
+from overpass_tiles import TileCache, tile_bounds, tile_for, tiles_for_circle
+
+ZOOM = 12
+LAT, LON = 48.8566, 2.3522
+FOOD = [("node", '["amenity"~"restaurant|cafe"]')]
+SHOPS = [("node", '["shop"]')]
+BBOX_RE = re.compile(r"\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)")
+
+
+def node(i, lat, lon, **tags):
+    return {"type": "node", "id": i, "lat": lat, "lon": lon, "tags": dict(tags, name=f"Place {i}")}
+
+
+# Around the centre, 500 m north, ~3 km north, and one tile-width east
+ELEMENTS = [
+    node(1, LAT, LON, amenity="cafe"),
+    node(2, LAT + 0.0045, LON, amenity="restaurant"),
+    node(3, LAT + 0.027, LON, amenity="cafe"),
+    node(4, LAT, LON, shop="bakery"),
+    node(5, LAT, LON + 360 / 2 ** ZOOM, amenity="cafe"),
+]
+
+
+class Upstream:
+    """Records every query and answers with ELEMENTS, like Overpass would for a large enough area"""
+
+    def __init__(self, fail=False):
+        self.queries = []
+        self.fail = fail
+
+    def __call__(self, query):
+        self.queries.append(query)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return ELEMENTS
+
+    async def afetch(self, query):
+        return self(query)
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def tiles(upstream):
+    return TileCache(upstream, zoom=ZOOM, afetch=upstream.afetch)
+
+
+def ids(results):
+    return {layer: sorted(element["id"] for element in elements) for layer, elements in results.items()}
+
+
+def fetched_tiles(query, candidates):
+    """The candidate tiles the bboxes of a fill query cover"""
+    boxes = [tuple(map(float, match)) for match in BBOX_RE.findall(query)]
+    covered = set()
+    for tile in candidates:
+        south, west, north, east = tile_bounds(*tile, ZOOM)
+        if any(s <= south + 1e-9 and w <= west + 1e-9 and north <= n + 1e-9 and east <= e + 1e-9
+               for s, w, n, e in boxes):
+            covered.add(tile)
+    return covered
+
+
+def test_tile_bounds_contain_their_points():
+    x, y = tile_for(LAT, LON, ZOOM)
+    south, west, north, east = tile_bounds(x, y, ZOOM)
+    assert south <= LAT < north and west <= LON < east
+    assert tile_for((south + north) / 2, (west + east) / 2, ZOOM) == (x, y)
+
+
+def test_tiles_for_circle():
+    assert tiles_for_circle(LAT, LON, 10, ZOOM) == [tile_for(LAT, LON, ZOOM)]
+    assert len(tiles_for_circle(LAT, LON, 5000, ZOOM)) > 1
+
+
+def test_query_filters_by_layer_and_radius(tiles, upstream):
+    results = tiles.query({"food": FOOD, "shops": SHOPS}, LAT, LON, 1000)
+    assert ids(results) == {"food": [1, 2], "shops": [4]}
+    assert len(upstream.queries) == 1
+
+
+def test_cached_tiles_are_not_fetched_again(tiles, upstream):
+    tiles.query({"food": FOOD}, LAT, LON, 1000)
+    assert ids(tiles.query({"food": FOOD}, LAT, LON, 5000)) == {"food": [1, 2, 3]}
+    assert ids(tiles.query({"food": FOOD}, LAT, LON, 200)) == {"food": [1]}
+    # The wider query fetched only its missing tiles, the narrower one nothing
+    assert len(upstream.queries) == 2
+
+
+def test_partially_cached_area_fetches_only_missing_tiles(tiles, upstream):
+    # Two circles a tile apart, each spanning two columns of tiles: they share one column
+    tiles.query({"food": FOOD}, LAT, LON, 3000)
+    first = set(tiles_for_circle(LAT, LON, 3000, ZOOM))
+    east = LON + 360 / 2 ** ZOOM
+    second = set(tiles_for_circle(LAT, east, 3000, ZOOM))
+    missing = second - first
+    assert missing and missing != second
+
+    assert ids(tiles.query({"food": FOOD}, LAT, east, 3000)) == {"food": [5]}
+    assert len(upstream.queries) == 2
+    assert fetched_tiles(upstream.queries[1], first | second) == missing
+
+
+def test_only_missing_layers_are_fetched(tiles, upstream):
+    tiles.query({"food": FOOD}, LAT, LON, 1000)
+    assert ids(tiles.query({"food": FOOD, "shops": SHOPS}, LAT, LON, 1000)) == {"food": [1, 2], "shops": [4]}
+    assert '["shop"]' in upstream.queries[1]
+    assert '["amenity"' not in upstream.queries[1]
+
+
+def test_failed_fetches_are_not_cached():
+    failing = Upstream(fail=True)
+    tiles = TileCache(failing, zoom=ZOOM)
+    with pytest.raises(RuntimeError):
+        tiles.query({"food": FOOD}, LAT, LON, 1000)
+    assert len(tiles.tiles) == 0
+    failing.fail = False
+    assert ids(tiles.query({"food": FOOD}, LAT, LON, 1000)) == {"food": [1, 2]}
+
+
+def test_areas_over_the_limit_go_straight_to_overpass(tiles, upstream, monkeypatch):
+    monkeypatch.setattr(overpass_tiles, "MAX_QUERY_TILES", 1)
+    assert ids(tiles.query({"food": FOOD, "shops": SHOPS}, LAT, LON, 5000)) == {"food": [1, 2, 3], "shops": [4]}
+    assert ids(tiles.query_many({"food": FOOD}, [(LAT, LON, 5000)])) == {"food": [1, 2, 3, 5]}
+    assert all("(around:5000," in query for query in upstream.queries)
+    assert len(tiles.tiles) == 0
+
+
+def test_query_many_returns_candidates_once(tiles, upstream):
+    results = tiles.query_many({"food": FOOD}, [(LAT, LON, 1000), (LAT + 0.001, LON, 1000)])
+    # Tile candidates, not filtered by distance: the caller matches them to points
+    assert ids(results)["food"] == sorted(set(ids(results)["food"]))
+    assert {1, 2} <= set(ids(results)["food"])
+    assert len(upstream.queries) == 1
+
+
+def test_query_async_shares_the_cache(tiles, upstream):
+    tiles.query({"food": FOOD}, LAT, LON, 1000)
+    results = asyncio.run(tiles.query_async({"food": FOOD}, LAT, LON, 1000))
+    assert ids(results) == {"food": [1, 2]}
+    assert len(upstream.queries) == 1
+
+
+def test_areas_of_adjacent_tiles_are_one_bbox(tiles):
+    assert tiles._areas({(10, 20), (11, 20), (10, 21), (11, 21)}) == bbox(
+        *tile_bounds(10, 21, ZOOM)[:2], *tile_bounds(11, 20, ZOOM)[2:])
+
+
+def test_areas_of_scattered_tiles_are_grouped_by_row(tiles):
+    south, west, _, _ = tile_bounds(10, 20, ZOOM)
+    _, _, north, east = tile_bounds(11, 20, ZOOM)
+    assert tiles._areas({(10, 20), (11, 20), (30, 40)}) == [
+        bbox(south, west, north, east),
+        bbox(*tile_bounds(30, 40, ZOOM)),
+    ]
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+import pytest
+
+from poi_index import PoiIndex, import_extract
+
+LAT, LON = 48.8566, 2.3522
+
+ELEMENTS = [
+    {"type": "node", "id": 1, "lat": LAT, "lon": LON, "tags": {"name": "Cafe", "amenity": "cafe"}},
+    {"type": "node", "id": 2, "lat": LAT + 0.001, "lon": LON, "tags": {"name": "Bistro", "amenity": "restaurant"}},
+    {"type": "node", "id": 3, "lat": LAT, "lon": LON + 0.001, "tags": {"name": "Bank", "amenity": "bank"}},
+    {"type": "way", "id": 4, "center": {"lat": LAT - 0.001, "lon": LON}, "tags": {"name": "Diner", "amenity": "restaurant"}},
+    {"type": "node", "id": 5, "lat": LAT + 0.1, "lon": LON, "tags": {"name": "Far", "amenity": "restaurant"}},
+    {"type": "node", "id": 6, "lat": LAT, "lon": LON, "tags": {"name": "Museum", "tourism": "museum", "amenity": "cafe"}},
+    {"type": "node", "id": 7, "lat": LAT, "lon": LON, "tags": {"amenity": "restaurant"}},  # unnamed, not a POI
+]
+
+FOOD = '["amenity"~"restaurant|cafe"]'
+
+
+def write_extract(path, elements):
+    path.write_text(json.dumps({"elements": elements}))
+    return str(path)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "pois.sqlite3")
+    assert import_extract(write_extract(tmp_path / "city.json", ELEMENTS), path) == 6
+    return path
+
+
+def ids(results):
+    return {layer: sorted(element["id"] for element in elements) for layer, elements in results.items()}
+
+
+@pytest.mark.parametrize("layers, expected", [
+    ({"food": [("node", FOOD)]}, {"food": [1, 2, 6]}),
+    ({"food": [("node", FOOD), ("way", FOOD)]}, {"food": [1, 2, 4, 6]}),
+    ({"amenity": [("node", '["amenity"]')], "tourism": [("node", '["tourism"]')]},
+     {"amenity": [1, 2, 3, 6], "tourism": [6]}),
+    ({"shops": [("node", '["shop"]')]}, {"shops": []}),
+])
+def test_query(db, layers, expected):
+    assert ids(PoiIndex(db).query(layers, LAT, LON, 500)) == expected
+
+
+def test_query_returns_overpass_elements(db):
+    [element] = PoiIndex(db).query({"museum": [("node", '["tourism"~"museum"]')]}, LAT, LON, 500)["museum"]
+    assert element == {"type": "node", "id": 6, "lat": LAT, "lon": LON,
+                       "tags": {"name": "Museum", "tourism": "museum", "amenity": "cafe"}}
+
+
+def test_reimport_updates_tags(db, tmp_path):
+    changed = [{"type": "node", "id": 2, "lat": LAT, "lon": LON, "tags": {"name": "Bistro", "shop": "wine"}}]
+    import_extract(write_extract(tmp_path / "update.json", changed), db)
+    index = PoiIndex(db)
+    assert ids(index.query({"food": [("node", FOOD)], "shop": [("node", '["shop"]')]}, LAT, LON, 500)) == {
+        "food": [1, 6], "shop": [2]}
+
+
+def test_indexes_without_tag_table_are_upgraded(db):
+    conn = sqlite3.connect(db)
+    conn.execute("DROP TABLE poi_tag")
+    conn.close()
+    assert ids(PoiIndex(db).query({"food": [("node", FOOD)]}, LAT, LON, 500)) == {"food": [1, 2, 6]}
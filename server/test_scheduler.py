@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from scheduler import BULK, INTERACTIVE, HostLimit, Overloaded, TokenBuckets, UpstreamScheduler, parse_limits
+
+
+@pytest.fixture
+def buckets(tmp_path):
+    return TokenBuckets(str(tmp_path / "limits.sqlite3"))
+
+
+def scheduler(buckets, **limit):
+    return UpstreamScheduler(limits={"host": HostLimit(**limit)}, buckets=buckets)
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("", {}),
+    ("localhost:8080=5:10:4", {"localhost:8080": (5.0, 10.0, 4, 0.0)}),
+    ("a=1:2:3:1, b=0.5:1:1", {"a": (1.0, 2.0, 3, 1.0), "b": (0.5, 1.0, 1, 0.0)}),
+])
+def test_parse_limits(spec, expected):
+    limits = parse_limits(spec)
+    assert {host: (l.rate, l.burst, l.concurrency, l.reserve) for host, l in limits.items()} == expected
+
+
+@pytest.mark.parametrize("tokens, elapsed, floor, expected", [
+    (2.0, 0.0, 0.0, (1.0, 0.0)),     # spend one
+    (0.0, 0.0, 0.0, (0.0, 0.5)),     # empty: one token every 1 / rate seconds
+    (0.0, 0.25, 0.0, (0.5, 0.25)),   # partly refilled
+    (0.0, 60.0, 0.0, (3.0, 0.0)),    # refills up to the burst only
+    (1.5, 0.0, 1.0, (1.5, 0.25)),    # bulk leaves the reserve alone
+    (2.0, 0.0, 1.0, (1.0, 0.0)),
+])
+def test_refill(tokens, elapsed, floor, expected):
+    limit = HostLimit(rate=2.0, burst=4, concurrency=1)
+    assert TokenBuckets._refill(tokens, 100.0, limit, floor, 100.0 + elapsed) == pytest.approx(expected)
+
+
+def test_take_spends_the_burst_then_waits(buckets):
+    limit = HostLimit(rate=10.0, burst=2, concurrency=1)
+    assert buckets.take("host", limit) == 0
+    assert buckets.take("host", limit) == 0
+    assert 0 < buckets.take("host", limit) <= 0.1
+
+
+def test_buckets_are_shared_between_instances(buckets):
+    limit = HostLimit(rate=0.01, burst=1, concurrency=1)
+    assert buckets.take("host", limit) == 0
+    assert TokenBuckets(buckets.db_path).take("host", limit) > 0
+
+
+def test_reserve_is_left_for_interactive_requests(buckets):
+    limit = HostLimit(rate=0.01, burst=2, concurrency=1, reserve=1)
+    assert buckets.take("host", limit, floor=limit.reserve) == 0
+    assert buckets.take("host", limit, floor=limit.reserve) > 0
+    assert buckets.take("host", limit) == 0
+
+
+def test_unusable_database_falls_back_to_process_local_buckets(tmp_path):
+    buckets = TokenBuckets(str(tmp_path))  # a directory, not a database
+    limit = HostLimit(rate=0.01, burst=1, concurrency=1)
+    assert buckets.take("host", limit) == 0
+    assert buckets.take("host", limit) > 0
+
+
+def test_slot_sheds_past_max_wait(buckets):
+    upstream = scheduler(buckets, rate=1.0, burst=1, concurrency=1)
+    with upstream.slot("host", INTERACTIVE):
+        pass
+    with pytest.raises(Overloaded) as shed:
+        with upstream.slot("host", INTERACTIVE, max_wait=0.05):
+            pass
+    assert shed.value.retry_after > 0.05
+    assert upstream.snapshot()["host"] == {"rate": 1.0, "concurrency": 1, "active": 0, "queued": 0,
+                                           "admitted": 1, "shed": 1}
+
+
+def test_aslot_admits_interactive_before_queued_bulk(buckets):
+    upstream = scheduler(buckets, rate=1000.0, burst=10, concurrency=1)
+    order = []
+
+    async def request(name, priority, hold=0.0):
+        async with upstream.aslot("host", priority):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def main():
+        first = asyncio.create_task(request("first", BULK, hold=0.05))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(first, request("bulk", BULK), request("interactive", INTERACTIVE))
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "bulk"]
+
+
+def test_aslot_respects_concurrency(buckets):
+    upstream = scheduler(buckets, rate=1000.0, burst=10, concurrency=2)
+    active = peak = 0
+
+    async def request():
+        nonlocal active, peak
+        async with upstream.aslot("host"):
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(8)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert upstream.snapshot()["host"]["admitted"] == 8
+
+
+def test_cancelled_waiter_leaves_the_queue(buckets):
+    upstream = scheduler(buckets, rate=1000.0, burst=10, concurrency=1)
+
+    async def main():
+        async with upstream.aslot("host"):
+            waiter = asyncio.create_task(upstream.aslot("host").__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+
+    asyncio.run(main())
+    assert upstream.snapshot()["host"]["queued"] == 0
+    assert upstream.snapshot()["host"]["active"] == 0
@@ -0,0 +1,33 @@
+import sqlite3
+import threading
+
+import pytest
+
+from sqlite_store import thread_connection
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS item (key TEXT PRIMARY KEY); CREATE INDEX IF NOT EXISTS item_key ON item (key);"
+
+
+def test_one_connection_per_thread(tmp_path):
+    connection = thread_connection(str(tmp_path / "store.sqlite3"), SCHEMA)
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connection()))
+    thread.start()
+    thread.join()
+    assert connection() is connection()
+    assert other[0] is not connection()
+
+
+def test_writable_connections_use_wal_and_create_the_schema(tmp_path):
+    conn = thread_connection(str(tmp_path / "store.sqlite3"), SCHEMA)()
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'item%'").fetchone() == (2,)
+
+
+def test_read_only_connections_reject_writes(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    thread_connection(path, SCHEMA)()
+    conn = thread_connection(path, read_only=True, pragmas=["query_only=1"])()
+    assert conn.execute("SELECT COUNT(*) FROM item").fetchone() == (0,)
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO item VALUES ('a')")
@@ -0,0 +1,82 @@
+import datetime
+
+import pytest
+
+from places import Place
+from timetable import clock, open_on, plan_visits, time_slot, visit_minutes
+
+MON = datetime.date(2026, 6, 1)
+
+
+def place(i, category="Viewpoint", hours=None, lat=48.8566, lon=2.3522):
+    return Place(f"n{i}", f"Place {i}", "", category, lat, lon, {"opening_hours": hours} if hours else {})
+
+
+def timetable(visits):
+    """(place id or 'lunch', start, duration, travel to next) per visit"""
+    return [(v.place.id if v.place else "lunch", clock(v.start), v.duration, v.travel) for v in visits]
+
+
+@pytest.mark.parametrize("minutes, expected", [(0, "00:00"), (540, "09:00"), (875, "14:35"), (1500, "01:00")])
+def test_clock(minutes, expected):
+    assert clock(minutes) == expected
+
+
+def test_time_slot():
+    assert time_slot(540, 45, 10) == {"start_time": "09:00", "end_time": "09:45",
+                                      "duration_minutes": 45, "travel_time_next": 10}
+
+
+def test_visit_minutes():
+    assert visit_minutes("Museum") == 120
+    assert visit_minutes("Something Else") == 60
+
+
+@pytest.mark.parametrize("places, expected", [
+    # Lunch after the third stop, before the fourth
+    ([place(1), place(2), place(3), place(4)],
+     [("n1", "09:00", 30, 5), ("n2", "09:35", 30, 5), ("n3", "10:10", 30, 5),
+      ("lunch", "10:45", 60, 0), ("n4", "11:45", 30, 0)]),
+    # Exactly three stops: lunch closes the day
+    ([place(1), place(2), place(3)],
+     [("n1", "09:00", 30, 5), ("n2", "09:35", 30, 5), ("n3", "10:10", 30, 0), ("lunch", "10:40", 60, 0)]),
+    # No lunch break once the third stop ends past 14:00
+    ([place(1, "Museum"), place(2, "Museum"), place(3, "Museum"), place(4, "Museum")],
+     [("n1", "09:00", 120, 5), ("n2", "11:05", 120, 5), ("n3", "13:10", 120, 5), ("n4", "15:15", 120, 0)]),
+    ([], []),
+])
+def test_plan_visits_without_hours(places, expected):
+    assert timetable(plan_visits(places)) == expected
+
+
+@pytest.mark.parametrize("places, expected", [
+    # Opens within MAX_OPENING_WAIT: wait for it
+    ([place(1, hours="Mo 10:00-18:00"), place(2)], [("n1", "10:00", 30, 5), ("n2", "10:35", 30, 0)]),
+    # Opens later than that: visit the next open stop first
+    ([place(1, hours="Mo 12:00-18:00"), place(2)], [("n2", "09:00", 30, 5), ("n1", "12:00", 30, 0)]),
+    # Closed all day, or not open long enough for a visit: left out
+    ([place(1, hours="Tu 09:00-18:00"), place(2)], [("n2", "09:00", 30, 0)]),
+    ([place(1, hours="Mo 09:00-09:20"), place(2)], [("n2", "09:00", 30, 0)]),
+    # Hours that can't be evaluated count as open
+    ([place(1, hours="sunrise-sunset"), place(2)], [("n1", "09:00", 30, 5), ("n2", "09:35", 30, 0)]),
+])
+def test_plan_visits_with_hours(places, expected):
+    assert timetable(plan_visits(places, MON)) == expected
+
+
+def test_plan_visits_ignores_hours_without_a_date():
+    assert timetable(plan_visits([place(1, hours="Tu 09:00-18:00")])) == [("n1", "09:00", 30, 0)]
+
+
+def test_plan_visits_always_open():
+    assert timetable(plan_visits([place(1, hours="24/7")], MON)) == [("n1", "09:00", 30, 0)]
+
+
+@pytest.mark.parametrize("hours, expected", [
+    (None, True),
+    ("Mo 09:00-18:00", True),
+    ("Tu 09:00-18:00", False),
+    ("sunrise-sunset", True),
+])
+def test_open_on(hours, expected):
+    assert open_on(place(1, hours=hours), MON) is expected
@@ -0,0 +1,171 @@
+import pytest
+
+from places import Place
+from trips import (MAX_TRIP_DAYS, InvalidEdit, SavedTrip, TripStore, _make_room, change_interests, merge_candidates,
+                   remove_stop, replace_stop, resize_trip)
+
+
+def place(i, lat, lon=2.35, score=0.0, tags=None):
+    return Place(f"n{i}", f"Place {i}", "", "Museum", lat, lon, tags or {}, score)
+
+
+# Day 1 around 48.851, day 2 two kilometres north; P5 is unused next to day 1, P6 unused and far away
+P1, P2 = place(1, 48.850), place(2, 48.852)
+P3, P4 = place(3, 48.870, score=1.0), place(4, 48.872, score=2.0)
+P5, P6 = place(5, 48.851, 2.351), place(6, 49.000, score=9.0)
+
+
+@pytest.fixture
+def state():
+    trip = {"destination": "Paris", "total_days": 2, "budget": 1000, "per_day": 500.0,
+            "interests": ["culture", "nature"]}
+    sources = {p.id: frozenset({"culture"}) for p in (P1, P3, P4, P5, P6)}
+    sources[P2.id] = frozenset({"nature"})
+    # Strings stand in for scheduled days, so tests can tell which ones an edit kept
+    return SavedTrip(trip, 48.86, 2.35, [P1, P2, P3, P4, P5, P6], sources, 2, [[P1, P2], [P3, P4]],
+                     itinerary=["day 1", "day 2"])
+
+
+def test_merge_candidates_keeps_existing_places():
+    richer = place(1, 48.8501, tags={"wikidata": "Q1"})
+    new = place(7, 48.9)
+    places, sources = merge_candidates([P1], {P1.id: frozenset({"culture"})}, [("food", richer), ("food", new)])
+    assert places == [P1, new]
+    assert places[0] is P1
+    assert sources == {P1.id: {"culture", "food"}, new.id: {"food"}}
+
+
+def test_merge_candidates_dedupes_new_places():
+    places, sources = merge_candidates([], {}, [("culture", P1), ("food", place(1, 48.8501)), ("food", P3)])
+    assert places == [P1, P3]
+    assert sources == {P1.id: {"culture", "food"}, P3.id: {"food"}}
+
+
+def test_remove_stop(state):
+    edited = remove_stop(state, 1, 0)
+    assert edited.days == [[P2], [P3, P4]]
+    assert edited.itinerary == [None, "day 2"]
+    assert state.days == [[P1, P2], [P3, P4]]
+    assert state.itinerary == ["day 1", "day 2"]
+
+
+@pytest.mark.parametrize("day, index", [(0, 0), (3, 0), (1, 2), (1, -1)])
+def test_missing_stops_are_invalid(state, day, index):
+    with pytest.raises(InvalidEdit):
+        remove_stop(state, day, index)
+    with pytest.raises(InvalidEdit):
+        replace_stop(state, day, index)
+
+
+def test_replace_stop_prefers_places_nearby(state):
+    # P6 scores higher but is out of REPLACE_RADIUS_KM
+    edited = replace_stop(state, 1, 0)
+    assert edited.days == [[P5, P2], [P3, P4]]
+    assert edited.itinerary == [None, "day 2"]
+
+
+def test_replace_stop_with_a_chosen_place(state):
+    edited = replace_stop(state, 2, 1, P6.id)
+    assert edited.days == [[P1, P2], [P3, P6]]
+    assert edited.itinerary == ["day 1", None]
+
+
+@pytest.mark.parametrize("place_id", ["n404", P3.id])
+def test_replace_stop_rejects_unknown_and_scheduled_places(state, place_id):
+    with pytest.raises(InvalidEdit):
+        replace_stop(state, 1, 0, place_id)
+
+
+def test_replace_stop_without_unused_places(state):
+    state.places = [P1, P2, P3, P4]
+    with pytest.raises(InvalidEdit):
+        replace_stop(state, 1, 0)
+
+
+def test_shorten_trip(state):
+    edited = resize_trip(state, 1)
+    assert edited.days == [[P1, P2]]
+    assert edited.itinerary == ["day 1"]
+    assert (edited.trip["total_days"], edited.trip["per_day"]) == (1, 1000)
+
+
+def test_lengthen_trip_plans_only_the_new_days(state):
+    edited = resize_trip(state, 3)
+    assert edited.days[:2] == [[P1, P2], [P3, P4]]
+    assert sorted(p.id for p in edited.days[2]) == [P5.id, P6.id]
+    assert edited.itinerary == ["day 1", "day 2", None]
+    assert edited.trip["per_day"] == 333.33
+
+
+def test_lengthen_trip_up_to_the_limit(state):
+    edited = resize_trip(state, MAX_TRIP_DAYS)
+    assert len(edited.days) == len(edited.itinerary) == MAX_TRIP_DAYS
+    # Only two places are left to plan, the other new days stay free
+    assert sorted(p.id for day in edited.days[2:] for p in day) == [P5.id, P6.id]
+    assert edited.itinerary[:2] == ["day 1", "day 2"]
+
+
+@pytest.mark.parametrize("total_days", [0, -1, MAX_TRIP_DAYS + 1])
+def test_trip_length_out_of_range(state, total_days):
+    with pytest.raises(InvalidEdit):
+        resize_trip(state, total_days)
+
+
+def test_remove_interest_replaces_its_stops(state):
+    edited = change_interests(state, [], [], ["nature"])
+    assert edited.trip["interests"] == ["culture"]
+    assert edited.days == [[P1, P5], [P3, P4]]
+    assert edited.itinerary == [None, "day 2"]
+    assert P2 not in edited.places and P2.id not in edited.sources
+
+
+def test_remove_every_interest(state):
+    with pytest.raises(InvalidEdit):
+        change_interests(state, [], [], ["culture", "nature"])
+
+
+def test_add_interest_takes_a_share_of_the_stops(state):
+    # Four stops over three interests: one goes to food, on the closest day, in place of its least important stop
+    cafe = place(8, 48.871, score=5.0)
+    edited = change_interests(state, ["food"], [("food", cafe), ("food", place(9, 48.95))], [])
+    assert edited.trip["interests"] == ["culture", "nature", "food"]
+    assert edited.days[0] == [P1, P2]
+    assert set(edited.days[1]) == {cafe, P4}
+    assert edited.itinerary == ["day 1", None]
+    assert edited.sources[cafe.id] == {"food"}
+
+
+def test_add_existing_interest_changes_nothing(state):
+    edited = change_interests(state, ["culture"], [("culture", place(8, 48.871))], [])
+    assert edited.trip["interests"] == state.trip["interests"]
+    assert edited.days == state.days
+    assert edited.itinerary == state.itinerary
+
+
+def test_make_room_skips_days_holding_only_new_places():
+    new, old, extra = place(1, 48.85), place(2, 48.95), place(3, 48.851, score=1.0)
+    sources = {new.id: {"food"}, old.id: {"culture"}, extra.id: {"food"}}
+    days, changed = [[new], [old]], set()
+    _make_room(days, changed, [new, old, extra], sources, {new.id, old.id}, {"food"}, 1, 1)
+    assert days == [[new], [extra]]
+    assert changed == {1}
+
+
+def test_make_room_fills_empty_days_first():
+    old, new = place(1, 48.85), place(2, 48.851)
+    sources = {old.id: {"culture"}, new.id: {"food"}}
+    days, changed = [[old], []], set()
+    _make_room(days, changed, [old, new], sources, {old.id}, {"food"}, 1, 1)
+    assert days == [[old], [new]]
+    assert changed == {1}
+
+
+def test_store_is_shared_between_workers(tmp_path, state):
+    path = str(tmp_path / "trips.sqlite3")
+    state.places_json = b"[]"
+    TripStore(path).set("trip", state)
+    loaded = TripStore(path).get("trip")
+    assert loaded.days[1][0].id == P3.id
+    assert loaded.places_json is None
+    assert state.places_json == b"[]"
+    assert TripStore(path).get("missing") is None
@@ -0,0 +1,125 @@
+"""Day timetables in integer minutes since midnight; clock strings are only made when a day is serialized."""
+from opening_hours import compile_hours
+from planner import travel_minutes
+
+DAY_START = 9 * 60
+LUNCH_AFTER_STOPS = 3
+LUNCH_BEFORE = 14 * 60    # no lunch break once the third stop runs past this
+LUNCH_MINUTES = 60
+# Waiting this long for the next stop to open beats reordering the route around it
+MAX_OPENING_WAIT = 60
+
+VISIT_MINUTES = {
+    "Temple": 45,
+    "Place Of Worship": 30,
+    "Museum": 120,
+    "Restaurant": 60,
+    "Cafe": 45,
+    "Park": 90,
+    "Shopping Mall": 120,
+    "Market": 90,
+    "Palace": 90,
+    "Viewpoint": 30,
+    "Gallery": 90,
+    "Beach": 120,
+    "Zoo": 180,
+    "Monument": 30,
+    "Castle": 120,
+    "Archaeological Site": 90,
+}
+DEFAULT_VISIT_MINUTES = 60
+
+
+def visit_minutes(category):
+    """How long to spend at a place of this category"""
+    return VISIT_MINUTES.get(category, DEFAULT_VISIT_MINUTES)
+
+
+def clock(minutes):
+    """540 -> '09:00'; wraps past midnight like a wall clock"""
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def time_slot(start, duration, travel):
+    return {
+        "start_time": clock(start),
+        "end_time": clock(start + duration),
+        "duration_minutes": duration,
+        "travel_time_next": travel
+    }
+
+
+class Visit:
+    """One timed entry of a day; place is None for the lunch break"""
+
+    __slots__ = ("place", "start", "duration", "travel")
+
+    def __init__(self, place, start, duration, travel=0):
+        self.place = place
+        self.start = start
+        self.duration = duration
+        self.travel = travel    # minutes to the next stop, 0 for the last one
+
+
+def open_on(place, date):
+    """False only for places whose opening hours say they are closed all of `date`"""
+    hours = compile_hours(place.tags.get("opening_hours"))
+    return hours is None or bool(hours.intervals(date))
+
+
+def _start(place, date, arrive, duration):
+    """When a visit arriving at `arrive` can begin, or None if the place won't be open long enough that day"""
+    if date is None:
+        return arrive
+    hours = compile_hours(place.tags.get("opening_hours"))
+    if hours is None:
+        return arrive
+    return hours.earliest_start(date, arrive, duration)
+
+
+def plan_visits(places, date=None):
+    """Time one day's stops in route order, starting at 09:00 with lunch after the third stop.
+
+    With a date, each place's opening hours are honoured: a stop that is
+    closed on arrival is visited once it opens, or, if that is more than
+    MAX_OPENING_WAIT away, after the next stop that is open. Places that
+    can't be fitted anywhere that day are left out.
+    """
+    visits = []
+    remaining = list(places)
+    now = DAY_START
+    previous = None
+    stops = 0
+    while remaining:
+        lunch_due = stops == LUNCH_AFTER_STOPS
+        best = None
+        for i, place in enumerate(remaining):
+            travel = travel_minutes(previous["lat"], previous["lon"], place["lat"], place["lon"]) if previous else 0
+            arrive = now + travel
+            if lunch_due and arrive < LUNCH_BEFORE:
+                arrive += LUNCH_MINUTES
+            duration = visit_minutes(place["category"])
+            start = _start(place, date, arrive, duration)
+            if start is None:
+                continue
+            if best is None or start < best[3]:
+                best = (i, travel, duration, start)
+            if start - arrive <= MAX_OPENING_WAIT:
+                best = (i, travel, duration, start)
+                break
+        if best is None:
+            break
+
+        i, travel, duration, start = best
+        if visits:
+            visits[-1].travel = travel
+        if lunch_due and now + travel < LUNCH_BEFORE:
+            visits.append(Visit(None, now + travel, LUNCH_MINUTES))
+        previous = remaining.pop(i)
+        visits.append(Visit(previous, start, duration))
+        now = start + duration
+        stops += 1
+
+    if stops == LUNCH_AFTER_STOPS and now < LUNCH_BEFORE:
+        visits.append(Visit(None, now, LUNCH_MINUTES))
+    return visits
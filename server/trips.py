@@ -0,0 +1,324 @@
+"""Saved trips for incremental re-planning: a generated trip keeps its candidates and day plans under an id.
+
+Edits never modify a saved trip. They return a new SavedTrip, which is saved
+under a new id, because one id can be shared by everyone whose request hit the
+trip cache. Days an edit doesn't touch keep their plan and schedule; the ones
+it does touch are left unscheduled (None) for the caller to fill in.
+
+Saved trips live in SQLite so any worker process can serve and edit them.
+"""
+import os
+import pickle
+import secrets
+import sqlite3
+import time
+
+from cache import TTLCache
+from dedup import dedupe_slots
+from geo import haversine_km
+from log import fields, get_logger
+from planner import insertion_index, plan_days
+from ranking import top_places
+from sqlite_store import thread_connection
+
+logger = get_logger("trips")
+
+TRIP_DB_PATH = os.environ.get(
+    "TRIP_STORE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "trips.sqlite3")
+)
+
+# Long enough to keep editing over a planning session; trip ids in the 15-minute trip cache always outlive it
+TRIP_TTL = 2 * 60 * 60
+MEMORY_SIZE = 256
+# Expired trips are deleted every this many saves
+PURGE_EVERY = 500
+
+MAX_TRIP_DAYS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trips_expiry ON trips (expires_at);
+"""
+
+# Automatic replacements come from around the stop they replace when possible
+REPLACE_RADIUS_KM = 2.0
+
+
+class InvalidEdit(ValueError):
+    """An edit that doesn't apply to the trip; handlers answer 400"""
+
+
+class SavedTrip:
+    __slots__ = ("trip", "lat", "lon", "places", "sources", "per_day", "days", "itinerary", "places_json")
+
+    def __init__(self, trip, lat, lon, places, sources, per_day, days, itinerary=None, places_json=None):
+        self.trip = trip            # settings from parse_trip_request
+        self.lat = lat
+        self.lon = lon
+        self.places = places        # every candidate place, in discovery order
+        self.sources = sources      # {place id: frozenset of interests that found it}
+        self.per_day = per_day      # stops per day
+        self.days = days            # each day's places in visiting order
+        self.itinerary = itinerary if itinerary is not None else [None] * len(days)
+        self.places_json = places_json  # encoded allPlaces, reused by every edit that keeps the candidates
+
+    def edited(self, days, changed, **fields):
+        """A copy with new day plans; days in `changed` (0-based) and any new days are left to schedule"""
+        itinerary = self.itinerary[:len(days)]
+        itinerary += [None] * (len(days) - len(itinerary))
+        for d in changed:
+            itinerary[d] = None
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(fields, days=days, itinerary=itinerary)
+        if "places" in fields:
+            values["places_json"] = None
+        return SavedTrip(**values)
+
+    def scheduled_ids(self):
+        return {place.id for day in self.days for place in day}
+
+
+class TripStore:
+    """In-process LRU of recently used trips in front of a SQLite table of pickled SavedTrips"""
+
+    def __init__(self, db_path=TRIP_DB_PATH, memory_size=MEMORY_SIZE):
+        self.db_path = db_path
+        self.memory = TTLCache(maxsize=memory_size, ttl=TRIP_TTL)
+        self._conn = thread_connection(db_path, SCHEMA)
+        self._saves = 0
+
+    def get(self, trip_id):
+        hit, state = self.memory.get(trip_id)
+        if hit:
+            return state
+        try:
+            row = self._conn().execute(
+                "SELECT state, expires_at FROM trips WHERE id = ? AND expires_at > ?", (trip_id, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Trip store read error", extra=fields(error=str(e)))
+            row = None
+        if row is None:
+            return None
+        state = pickle.loads(row[0])
+        self.memory.set(trip_id, state, ttl=row[1] - time.time())
+        return state
+
+    def set(self, trip_id, state):
+        # The encoded allPlaces is only a cache, rebuilt by whichever worker loads the trip
+        places_json, state.places_json = state.places_json, None
+        try:
+            blob = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        finally:
+            state.places_json = places_json
+        now = time.time()
+        self.memory.set(trip_id, state)
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT INTO trips (id, state, expires_at) VALUES (?, ?, ?)",
+                             (trip_id, blob, now + TRIP_TTL))
+                self._saves += 1
+                if self._saves % PURGE_EVERY == 0:
+                    purged = conn.execute("DELETE FROM trips WHERE expires_at <= ?", (now,)).rowcount
+                    logger.info("Expired trips purged", extra=fields(trips=purged))
+        except sqlite3.Error as e:
+            # Still editable on this worker until it evicts the trip
+            logger.warning("Trip store write error", extra=fields(error=str(e)))
+
+
+trip_store = TripStore()
+
+
+def save_trip(state):
+    trip_id = secrets.token_urlsafe(12)
+    trip_store.set(trip_id, state)
+    return trip_id
+
+
+def load_trip(trip_id):
+    """The saved trip, or None if it is unknown or has expired"""
+    return trip_store.get(trip_id)
+
+
+def merge_candidates(places, sources, found):
+    """Add (interest, place) pairs to a candidate set, deduplicated against it; returns (places, sources)
+
+    Existing candidates are never dropped or swapped for a richer copy, since
+    day plans point at them.
+    """
+    unique, slots = dedupe_slots(list(places) + [place for _, place in found])
+    kept = {}
+    for place, slot in zip(places, slots):
+        kept.setdefault(slot, place)
+    merged = list(places)
+    for slot, place in enumerate(unique):
+        if slot not in kept:
+            kept[slot] = place
+            merged.append(place)
+
+    sources = dict(sources)
+    for (interest, _), slot in zip(found, slots[len(places):]):
+        place_id = kept[slot].id
+        sources[place_id] = sources.get(place_id, frozenset()) | {interest}
+    return merged, sources
+
+
+def _stop(state, day, index):
+    if not 1 <= day <= len(state.days):
+        raise InvalidEdit(f"Day must be between 1 and {len(state.days)}")
+    if not 0 <= index < len(state.days[day - 1]):
+        raise InvalidEdit(f"Day {day} has no stop {index}")
+    return state.days[day - 1][index]
+
+
+def _replacement(places, near, used, accept=None):
+    """Best-scored unused candidate around `near`, else the closest unused one, else None"""
+    unused = [(haversine_km(near["lat"], near["lon"], p["lat"], p["lon"]), p) for p in places
+              if p.id not in used and (accept is None or accept(p))]
+    if not unused:
+        return None
+    close = [p for km, p in unused if km <= REPLACE_RADIUS_KM]
+    if close:
+        return top_places(close, 1)[0]
+    return min(unused, key=lambda item: item[0])[1]
+
+
+def refill_day(state, day_places, kept, accept):
+    """The day's stops, with those missing from `kept` swapped for unused places around them that `accept` allows"""
+    used = state.scheduled_ids()
+    kept = {place.id for place in kept}
+    day = []
+    for place in day_places:
+        if place.id not in kept:
+            place = _replacement(state.places, place, used, accept)
+            if place is None:
+                continue
+            used.add(place.id)
+        day.append(place)
+    return day
+
+
+def remove_stop(state, day, index):
+    _stop(state, day, index)
+    days = list(state.days)
+    days[day - 1] = days[day - 1][:index] + days[day - 1][index + 1:]
+    return state.edited(days, [day - 1])
+
+
+def replace_stop(state, day, index, place_id=None):
+    """Swap one stop for `place_id`, or for the best unused place nearby when no id is given"""
+    old = _stop(state, day, index)
+    used = state.scheduled_ids()
+    if place_id is None:
+        place = _replacement(state.places, old, used)
+        if place is None:
+            raise InvalidEdit("Every place found for this trip is already scheduled")
+    else:
+        place = next((p for p in state.places if p.id == place_id), None)
+        if place is None:
+            raise InvalidEdit(f"Unknown place {place_id}")
+        if place.id in used:
+            raise InvalidEdit(f"{place.name} is already in the itinerary")
+
+    days = list(state.days)
+    days[day - 1] = days[day - 1][:index] + [place] + days[day - 1][index + 1:]
+    return state.edited(days, [day - 1])
+
+
+def resize_trip(state, total_days):
+    """Shorten the trip, or plan only the added days from the best places not yet scheduled"""
+    if not 1 <= total_days <= MAX_TRIP_DAYS:
+        raise InvalidEdit(f"A trip has between 1 and {MAX_TRIP_DAYS} days")
+    trip = dict(state.trip, total_days=total_days, per_day=round(state.trip["budget"] / total_days, 2))
+    added = total_days - state.trip["total_days"]
+    if added <= 0:
+        return state.edited(state.days[:total_days], [], trip=trip)
+
+    used = state.scheduled_ids()
+    unused = [place for place in state.places if place.id not in used]
+    selected = top_places(unused, added * state.per_day)
+    new_days = plan_days(selected, added, state.per_day, (state.lat, state.lon))
+    new_days += [[] for _ in range(added - len(new_days))]
+    return state.edited(state.days + new_days, [], trip=trip)
+
+
+def change_interests(state, add, found, remove):
+    """Add interests, whose places are passed in `found` as (interest, place) pairs, and drop the `remove` ones.
+
+    Stops only a dropped interest found are replaced with places around them.
+    New interests then get their share of the stops: their best places go to
+    the closest day, taking the room of that day's least important stop.
+    """
+    added = [interest for interest in dict.fromkeys(add) if interest not in state.trip["interests"]]
+    remove = set(remove) & set(state.trip["interests"])
+    interests = [i for i in state.trip["interests"] if i not in remove] + added
+    if not interests:
+        raise InvalidEdit("A trip needs at least one interest")
+
+    places, sources = merge_candidates(state.places, state.sources, [pair for pair in found if pair[0] in added])
+    dropped = set()
+    for place in places:
+        left = sources[place.id] - remove
+        if left:
+            sources[place.id] = left
+        else:
+            dropped.add(place.id)
+            del sources[place.id]
+    places = [place for place in places if place.id not in dropped]
+
+    days = [list(day) for day in state.days]
+    changed = set()
+    used = {p.id for day in days for p in day if p.id not in dropped}
+    for d, day in enumerate(days):
+        for i, place in enumerate(day):
+            if place.id in dropped:
+                changed.add(d)
+                replacement = _replacement(places, place, used)
+                day[i] = replacement
+                if replacement is not None:
+                    used.add(replacement.id)
+        days[d] = [place for place in day if place is not None]
+
+    if added:
+        _make_room(days, changed, places, sources, used, set(added), len(interests), state.per_day)
+
+    trip = dict(state.trip, interests=interests)
+    return state.edited(days, changed, trip=trip, places=places, sources=sources)
+
+
+def _make_room(days, changed, places, sources, used, added, interest_count, per_day):
+    """Schedule the added interests' best places until they hold their share of the stops"""
+    def is_new(place):
+        return not added.isdisjoint(sources[place.id])
+
+    stops = sum(len(day) for day in days)
+    have = sum(1 for day in days for place in day if is_new(place))
+    want = round(stops * len(added) / interest_count) - have
+    unused = [place for place in places if place.id not in used and is_new(place)]
+
+    for place in top_places(unused, max(want, 0)):
+        # Closest day by the average position of its stops; empty days are as close as can be
+        def distance(d):
+            day = days[d]
+            if not day:
+                return 0.0
+            return haversine_km(place["lat"], place["lon"],
+                                sum(p["lat"] for p in day) / len(day), sum(p["lon"] for p in day) / len(day))
+
+        for d in sorted(range(len(days)), key=distance):
+            day = days[d]
+            if len(day) >= per_day:
+                movable = [p for p in day if not is_new(p)]
+                if not movable:
+                    continue
+                day.remove(min(movable, key=lambda p: p.score))
+            day.insert(insertion_index(day, place), place)
+            used.add(place.id)
+            changed.add(d)
+            break
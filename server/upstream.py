@@ -0,0 +1,228 @@
+"""Shared upstream HTTP layer: pooled sessions, health-scored mirrors, hedging and circuit breakers."""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from log import fields, get_logger
+from metrics import register_collector, upstream_errors, upstream_hedges, upstream_seconds
+from scheduler import MAX_QUEUE_WAIT, Overloaded, current_priority, upstream_scheduler
+
+logger = get_logger("upstream")
+
+# Overpass servers (backup if one fails); OVERPASS_SERVERS=url1,url2 overrides, e.g. for bench/standin.py
+OVERPASS_SERVERS = [url for url in os.environ.get("OVERPASS_SERVERS", "").split(",") if url] or [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://overpass.openstreetmap.fr/api/interpreter"
+]
+
+POOL_SIZE = 32
+EWMA_ALPHA = 0.2
+LATENCY_SAMPLES = 50
+DEFAULT_HEDGE_DELAY = 2.0      # seconds, used until a mirror has enough samples for a p95
+MIN_HEDGE_DELAY = 0.3
+BREAKER_THRESHOLD = 5          # consecutive failures before a mirror is taken out of rotation
+BREAKER_COOLDOWN = 30          # seconds before a half-open trial request
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="upstream")
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def get_session(url):
+    """One keep-alive requests.Session per host, shared by every caller in the process"""
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "TripPlannerApp"
+            _sessions[host] = session
+        return session
+
+
+class Mirror:
+    """Health state for one upstream URL"""
+
+    def __init__(self, url):
+        self.url = url
+        self.host = urlparse(url).netloc
+        self.session = get_session(url)
+        self.latency = None          # EWMA, seconds
+        self.error_rate = 0.0        # EWMA of 0/1 outcomes
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def available(self, now):
+        # Open breakers re-admit traffic once the cooldown passes (half-open)
+        return self.open_until <= now
+
+    def score(self):
+        """Lower is better: expected latency inflated by recent errors"""
+        latency = self.latency if self.latency is not None else DEFAULT_HEDGE_DELAY / 2
+        return latency * (1 + 10 * self.error_rate)
+
+    def hedge_delay(self, timeout):
+        """p95 of recent latencies - past that, a second mirror is worth asking"""
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) < 5:
+            delay = DEFAULT_HEDGE_DELAY
+        else:
+            delay = samples[int(len(samples) * 0.95) - 1]
+        return min(max(delay, MIN_HEDGE_DELAY), timeout / 2)
+
+    def record(self, ok, elapsed=None):
+        with self._lock:
+            self.requests += 1
+            self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                upstream_seconds.observe(elapsed, host=self.host)
+                self.samples.append(elapsed)
+                self.latency = elapsed if self.latency is None else self.latency + EWMA_ALPHA * (elapsed - self.latency)
+                self.consecutive_failures = 0
+                self.open_until = 0.0
+            else:
+                upstream_errors.inc(host=self.host)
+                self.failures += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= BREAKER_THRESHOLD:
+                    self.open_until = time.time() + BREAKER_COOLDOWN
+
+    def snapshot(self):
+        return {
+            "url": self.url,
+            "latency_ewma_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit": "open" if self.open_until > time.time() else "closed"
+        }
+
+
+class UpstreamClient:
+    """POST to the healthiest mirror, hedging to the next one when the first is slow"""
+
+    def __init__(self, urls, timeout=20):
+        self.mirrors = [Mirror(url) for url in urls]
+        self.timeout = timeout
+
+    def ranked(self):
+        now = time.time()
+        return sorted((m for m in self.mirrors if m.available(now)), key=Mirror.score)
+
+    def _attempt(self, mirror, data, deadline, stream, priority):
+        # Waiting for a slot isn't the mirror's fault: Overloaded is raised before any health accounting
+        max_wait = min(MAX_QUEUE_WAIT[priority], deadline - time.monotonic())
+        with upstream_scheduler.slot(mirror.host, priority, max_wait):
+            start = time.monotonic()
+            timeout = max(deadline - start, 0.1)
+            try:
+                resp = mirror.session.post(mirror.url, data=data, timeout=timeout, stream=stream)
+            except Exception:
+                mirror.record(False)
+                raise
+            if resp.status_code != 200:
+                resp.close()
+                mirror.record(False)
+                raise UpstreamError(f"{mirror.url} returned {resp.status_code}")
+            mirror.record(True, time.monotonic() - start)
+            return resp
+
+    def post(self, data, timeout=None, stream=False):
+        """Return the first 200 response from any mirror, or raise UpstreamError (Overloaded if every mirror shed it)"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        # Executor threads don't inherit context, so the caller's priority is passed along explicitly
+        priority = current_priority.get()
+        candidates = self.ranked()
+        if not candidates:
+            raise UpstreamError("Every upstream mirror has an open circuit breaker")
+
+        pending = {}
+        errors = []
+        shed = []
+
+        def launch():
+            mirror = candidates.pop(0)
+            pending[_executor.submit(self._attempt, mirror, data, deadline, stream, priority)] = mirror
+
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            primary = next(iter(pending.values()))
+            wait_for = min(primary.hedge_delay(timeout), remaining) if candidates else remaining
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                logger.info("Hedging to next mirror", extra=fields(slow=primary.host, next=candidates[0].host))
+                upstream_hedges.inc(host=candidates[0].host)
+                launch()
+                continue
+
+            for future in done:
+                mirror = pending.pop(future)
+                try:
+                    resp = future.result()
+                except Overloaded as e:
+                    shed.append(e)
+                    if candidates:
+                        launch()
+                    continue
+                except Exception as e:
+                    logger.warning("Upstream request failed", extra=fields(host=mirror.host, error=str(e)))
+                    errors.append(str(e))
+                    if candidates:
+                        launch()
+                    continue
+                # Losing hedges finish in the background; release their connections
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return resp
+
+        for other in pending:
+            other.add_done_callback(_close_response)
+        if shed and not errors:
+            raise min(shed, key=lambda e: e.retry_after)
+        raise UpstreamError("All upstream mirrors failed: " + ("; ".join(errors) or "deadline exceeded"))
+
+    def snapshot(self):
+        return [mirror.snapshot() for mirror in self.mirrors]
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+overpass_client = UpstreamClient(OVERPASS_SERVERS)
+
+
+@register_collector
+def _mirror_health():
+    mirrors = overpass_client.mirrors
+    yield ("upstream_latency_ewma_seconds", "gauge", "Smoothed latency per mirror",
+           [({"host": m.host}, m.latency or 0) for m in mirrors])
+    yield ("upstream_error_rate_ewma", "gauge", "Smoothed error rate per mirror",
+           [({"host": m.host}, m.error_rate) for m in mirrors])
+    yield ("upstream_circuit_open", "gauge", "1 while a mirror's circuit breaker is open",
+           [({"host": m.host}, int(m.open_until > time.time())) for m in mirrors])
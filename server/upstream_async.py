@@ -0,0 +1,135 @@
+"""asyncio twin of upstream.py for the ASGI services: same mirrors, health scores, hedging and admission control."""
+import asyncio
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from log import fields, get_logger
+from metrics import upstream_hedges
+from scheduler import MAX_QUEUE_WAIT, Overloaded, current_priority, upstream_scheduler
+from upstream import UpstreamClient, UpstreamError, overpass_client
+
+logger = get_logger("upstream_async")
+
+# Connections are cheap sockets here, not threads, so one process can keep hundreds in flight
+ASYNC_POOL_SIZE = 512
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_async_client(url):
+    """One keep-alive httpx.AsyncClient per host, shared by every task in the process"""
+    host = urlparse(url).netloc
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers={"User-Agent": "TripPlannerApp"},
+                limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=64)
+            )
+            _clients[host] = client
+        return client
+
+
+async def close_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+class AsyncUpstreamClient(UpstreamClient):
+    """UpstreamClient whose post() is a coroutine; shares Mirror state with the threaded client"""
+
+    def __init__(self, mirrors, timeout=20):
+        self.mirrors = mirrors
+        self.timeout = timeout
+
+    async def _attempt(self, mirror, data, deadline, stream, priority):
+        max_wait = min(MAX_QUEUE_WAIT[priority], deadline - time.monotonic())
+        async with upstream_scheduler.aslot(mirror.host, priority, max_wait):
+            start = time.monotonic()
+            client = get_async_client(mirror.url)
+            request = client.build_request("POST", mirror.url, content=data,
+                                           timeout=max(deadline - start, 0.1))
+            try:
+                resp = await client.send(request, stream=stream)
+            except asyncio.CancelledError:
+                raise  # a losing hedge, not the mirror's fault
+            except Exception:
+                mirror.record(False)
+                raise
+            if resp.status_code != 200:
+                await resp.aclose()
+                mirror.record(False)
+                raise UpstreamError(f"{mirror.url} returned {resp.status_code}")
+            mirror.record(True, time.monotonic() - start)
+            return resp
+
+    async def post(self, data, timeout=None, stream=False):
+        """Return the first 200 httpx.Response from any mirror, or raise UpstreamError / Overloaded"""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        priority = current_priority.get()
+        candidates = self.ranked()
+        if not candidates:
+            raise UpstreamError("Every upstream mirror has an open circuit breaker")
+
+        pending = {}
+        errors = []
+        shed = []
+
+        def launch():
+            mirror = candidates.pop(0)
+            pending[asyncio.ensure_future(self._attempt(mirror, data, deadline, stream, priority))] = mirror
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                primary = next(iter(pending.values()))
+                wait_for = min(primary.hedge_delay(timeout), remaining) if candidates else remaining
+                done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    logger.info("Hedging to next mirror", extra=fields(slow=primary.host, next=candidates[0].host))
+                    upstream_hedges.inc(host=candidates[0].host)
+                    launch()
+                    continue
+
+                for task in done:
+                    mirror = pending.pop(task)
+                    try:
+                        resp = task.result()
+                    except Overloaded as e:
+                        shed.append(e)
+                        if candidates:
+                            launch()
+                        continue
+                    except Exception as e:
+                        logger.warning("Upstream request failed", extra=fields(host=mirror.host, error=str(e)))
+                        errors.append(str(e))
+                        if candidates:
+                            launch()
+                        continue
+                    return resp
+        finally:
+            # Unlike threads, losing hedges can actually be cancelled
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    asyncio.ensure_future(task.result().aclose())
+
+        if shed and not errors:
+            raise min(shed, key=lambda e: e.retry_after)
+        raise UpstreamError("All upstream mirrors failed: " + ("; ".join(errors) or "deadline exceeded"))
+
+
+async_overpass_client = AsyncUpstreamClient(overpass_client.mirrors)